@@ -0,0 +1,218 @@
+"""
+Benchmarks the main Fragment Hotspot Maps stages over the structures in `benchmark_set`.
+
+For every structure (the apo protein by default) the following stages are timed with pinned settings and seeded
+rotations:
+
+    superstar       SuperStar atomic hotspots (or a recorded fixture, see --fixtures)
+    buriedness      Ghecom (LIGSITE if GHECOM_EXE is not set)
+    sampling        probe sampling of the weighted maps
+    extraction      Extractor.extract_volume
+    scoring         Results.score of the protein
+    io              HotspotWriter / HotspotReader round trip
+
+Wall time, CPU time, peak RSS and output checksums are written to a JSON report, which can be compared against a
+baseline report:
+
+    python benchmark_set.py ../../benchmark_set -o current.json --fixtures fixtures --record_fixtures
+    python benchmark_set.py ../../benchmark_set -o current.json --fixtures fixtures -b baseline.json -t 0.2
+"""
+from __future__ import print_function
+
+import argparse
+import csv
+import random
+import shutil
+import sys
+import tempfile
+from glob import glob
+from os import environ, makedirs
+from os.path import join, exists, basename
+
+import numpy as np
+from ccdc.protein import Protein
+
+from hotspots.atomic_hotspot_calculation import _AtomicHotspot, _AtomicHotspotResult
+from hotspots.calculation import Runner, Buriedness
+from hotspots.grid_extension import Grid
+from hotspots.hs_benchmark import BenchmarkRun, checksum_grid, checksum_result, compare_to_baseline, write_report
+from hotspots.hs_io import HotspotWriter, HotspotReader
+from hotspots.result import Extractor
+
+
+class Organiser(argparse.ArgumentParser):
+    """ class to run the benchmark set """
+
+    def __init__(self):
+        super(self.__class__, self).__init__(description=__doc__,
+                                             formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument(
+            'benchmark_dir',
+            help='path to the benchmark_set directory'
+        )
+        self.add_argument(
+            '-i', '--ids',
+            default=None,
+            help='comma separated benchmark IDs to run (default = all)'
+        )
+        self.add_argument(
+            '-s', '--structure',
+            default='apo',
+            help='which structure of each entry to use: apo, fragment or lead (default = apo)'
+        )
+        self.add_argument(
+            '-o', '--out',
+            default='benchmark_report.json',
+            help='path of the JSON report (default = benchmark_report.json)'
+        )
+        self.add_argument(
+            '-b', '--baseline',
+            default=None,
+            help='baseline JSON report to compare against'
+        )
+        self.add_argument(
+            '-t', '--threshold',
+            type=float,
+            default=0.2,
+            help='allowed fractional slow-down before a stage is reported as a regression (default = 0.2)'
+        )
+        self.add_argument(
+            '-f', '--fixtures',
+            default=None,
+            help='directory of recorded SuperStar outputs (<id>/<probe>.acnt and <probe>.ligsite.acnt)'
+        )
+        self.add_argument(
+            '--record_fixtures',
+            action='store_true',
+            help='run SuperStar and store its outputs in the fixtures directory'
+        )
+        self.add_argument(
+            '-r', '--nrotations',
+            type=int,
+            default=1000,
+            help='number of rotations used in sampling (default = 1000)'
+        )
+        self.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='random seed for the probe rotations (default = 0)'
+        )
+        self.add_argument(
+            '-n', '--nprocesses',
+            type=int,
+            default=3,
+            help='number of processes used by SuperStar (default = 3)'
+        )
+        self.args = self.parse_args()
+        self.probes = {"apolar": "AROMATIC CH CARBON",
+                       "donor": "UNCHARGED NH NITROGEN",
+                       "acceptor": "CARBONYL OXYGEN"}
+
+    def entries(self):
+        """ benchmark entries as (id, path to protein) """
+        ids = self.args.ids.split(",") if self.args.ids else None
+        for d in sorted(glob(join(self.args.benchmark_dir, "*")), key=lambda p: (len(p), p)):
+            fname = join(d, "{}.pdb".format(self.args.structure))
+            if exists(fname) and (ids is None or basename(d) in ids):
+                yield basename(d), fname
+
+    @staticmethod
+    def prepare_protein(fname):
+        """ default protein preparation """
+        prot = Protein.from_file(fname)
+        prot.remove_all_waters()
+        for lig in prot.ligands:
+            prot.remove_ligand(lig.identifier)
+        prot.remove_all_metals()
+        prot.add_hydrogens()
+        return prot
+
+    def superstar(self, entry, prot):
+        """ SuperStar results, from the fixtures directory when recorded """
+        fixture = join(self.args.fixtures, entry) if self.args.fixtures else None
+        if fixture and exists(fixture) and not self.args.record_fixtures:
+            return [_AtomicHotspotResult.find(temp_dir=fixture, jobname=p) for p in self.probes], "fixture"
+
+        a = _AtomicHotspot()
+        a.settings.atomic_probes = self.probes
+        results = a.calculate(protein=prot, nthreads=self.args.nprocesses)
+        if fixture and self.args.record_fixtures:
+            if not exists(fixture):
+                makedirs(fixture)
+            for p in self.probes:
+                for ext in (".acnt", ".ligsite.acnt"):
+                    shutil.copy(join(a.settings.temp_dir, p + ext), fixture)
+        shutil.rmtree(a.settings.temp_dir, ignore_errors=True)
+        return results, "superstar"
+
+    def run_entry(self, entry, fname):
+        """ times all stages for one structure """
+        settings = Runner.Settings(nrotations=self.args.nrotations, sphere_maps=False)
+        run = BenchmarkRun(entry, metadata={"structure": self.args.structure,
+                                            "nrotations": self.args.nrotations,
+                                            "seed": self.args.seed})
+
+        with run.stage("protein_preparation"):
+            prot = self.prepare_protein(fname)
+
+        with run.stage("superstar") as record:
+            superstar_grids, source = self.superstar(entry, prot)
+            record["source"] = source
+
+        with run.stage("buriedness") as record:
+            if 'GHECOM_EXE' in environ:
+                b = Buriedness(protein=prot, out_grid=superstar_grids[0].buriedness.copy_and_clear())
+                buriedness = b.calculate().grid
+                shutil.rmtree(b.settings.working_directory, ignore_errors=True)
+                record["method"] = "ghecom"
+            else:
+                buriedness = Grid.get_single_grid({s.identifier: s.buriedness for s in superstar_grids}, mask=False)
+                record["method"] = "ligsite"
+            record["checksum"] = checksum_grid(buriedness)
+
+        random.seed(self.args.seed)
+        np.random.seed(self.args.seed)
+        with run.stage("sampling") as record:
+            hr = Runner().from_superstar(prot, superstar_grids, buriedness, settings=settings)
+            record["checksum"] = checksum_result(hr)
+
+        with run.stage("extraction") as record:
+            extracted = Extractor(hr).extract_volume(volume=150)
+            record["checksum"] = checksum_result(extracted)
+
+        with run.stage("scoring"):
+            hr.score(hr.protein)
+
+        tmp = tempfile.mkdtemp()
+        with run.stage("io") as record:
+            with HotspotWriter(tmp, grid_extension=".grd", zip_results=True) as writer:
+                writer.write(hr)
+            reread = HotspotReader(join(tmp, "out.zip")).read()
+            record["checksum"] = checksum_result(reread)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+        print(run)
+        return run
+
+    def run(self):
+        runs = [self.run_entry(entry, fname) for entry, fname in self.entries()]
+        write_report(runs, self.args.out)
+
+        if self.args.baseline:
+            regressions = compare_to_baseline([r.to_dict() for r in runs], self.args.baseline,
+                                              threshold=self.args.threshold)
+            writer = csv.writer(sys.stdout)
+            for row in regressions:
+                writer.writerow(row)
+            return 1 if regressions else 0
+        return 0
+
+
+def main():
+    r = Organiser()
+    sys.exit(r.run())
+
+
+if __name__ == "__main__":
+    main()
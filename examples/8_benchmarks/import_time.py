@@ -0,0 +1,130 @@
+"""
+Import-time benchmark of the hotspots modules.
+
+Each module is imported in a fresh interpreter, `repeat` times, and the fastest wall time is kept. A module fails the
+benchmark if its import takes longer than its budget or if it loads one of the heavy optional dependencies, which
+must only be imported by the features that use them (ligand clustering, plotting, arpeggio, pandas export):
+
+    python import_time.py
+    python import_time.py -m hotspots.grid_extension=0.5,hotspots.calculation=1.5 -o import_time.json
+    python import_time.py -b baseline.json
+
+The exit status is 1 if any module is over budget, loads a heavy dependency or regresses against the baseline.
+"""
+from __future__ import print_function, division
+
+import argparse
+import csv
+import json
+import subprocess
+import sys
+from collections import OrderedDict
+
+from hotspots.hs_benchmark import BenchmarkRun, compare_to_baseline, write_report
+
+# seconds, measured from a cold interpreter to the end of the import
+BUDGETS = OrderedDict([("hotspots", 0.1),
+                       ("hotspots.grid_extension", 1.0),
+                       ("hotspots.calculation", 2.0)])
+
+HEAVY = ("matplotlib", "rdkit", "sklearn", "hdbscan", "pandas", "skimage")
+
+_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import {module}
+wall = time.perf_counter() - t
+print(json.dumps({{"wall": wall, "heavy": sorted(set(m.split(".")[0] for m in sys.modules) & set({heavy!r}))}}))
+"""
+
+
+def time_import(module, repeat=5):
+    """
+    imports `module` in fresh interpreters
+
+    :param str module: dotted module name
+    :param int repeat: number of interpreters started, the fastest import is kept
+    :return: dict, {"wall": float, "heavy": list of heavy dependencies loaded}
+    """
+    best = None
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY)])
+        record = json.loads(out.decode().strip().splitlines()[-1])
+        if best is None or record["wall"] < best["wall"]:
+            best = record
+    return best
+
+
+class Organiser(argparse.ArgumentParser):
+    """ class to run the import-time benchmark """
+
+    def __init__(self):
+        super(self.__class__, self).__init__(description=__doc__,
+                                             formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument(
+            '-m', '--modules',
+            default=None,
+            help='comma separated module=budget pairs in seconds (default = {})'.format(
+                ','.join('{}={}'.format(m, b) for m, b in BUDGETS.items()))
+        )
+        self.add_argument(
+            '-r', '--repeat',
+            type=int,
+            default=5,
+            help='number of fresh interpreters per module, the fastest is kept (default = 5)'
+        )
+        self.add_argument(
+            '-o', '--out',
+            default='import_time.json',
+            help='path of the JSON report (default = import_time.json)'
+        )
+        self.add_argument(
+            '-b', '--baseline',
+            default=None,
+            help='baseline JSON report to compare against'
+        )
+        self.add_argument(
+            '-t', '--threshold',
+            type=float,
+            default=0.2,
+            help='allowed fractional slow-down against the baseline (default = 0.2)'
+        )
+        self.args = self.parse_args()
+
+    def budgets(self):
+        if not self.args.modules:
+            return BUDGETS
+        pairs = [m.split("=") for m in self.args.modules.split(",")]
+        return OrderedDict((m, float(b)) for m, b in pairs)
+
+    def run(self):
+        run = BenchmarkRun("import_time", metadata={"repeat": self.args.repeat})
+        failures = []
+        for module, budget in self.budgets().items():
+            record = time_import(module, repeat=self.args.repeat)
+            run.stages[module] = OrderedDict(wall=record["wall"], cpu=float("nan"), peak_rss=None,
+                                             budget=budget, heavy=record["heavy"])
+            if record["wall"] > budget:
+                failures.append(("import_time", module, "wall {:.3f} s > budget {:.3f} s".format(record["wall"],
+                                                                                                 budget)))
+            if record["heavy"]:
+                failures.append(("import_time", module, "loads {}".format(", ".join(record["heavy"]))))
+        print(run)
+        write_report([run], self.args.out)
+
+        if self.args.baseline:
+            failures.extend(compare_to_baseline([run.to_dict()], self.args.baseline, threshold=self.args.threshold,
+                                                min_time=0.))
+        writer = csv.writer(sys.stdout)
+        for row in failures:
+            writer.writerow(row)
+        return 1 if failures else 0
+
+
+def main():
+    r = Organiser()
+    sys.exit(r.run())
+
+
+if __name__ == "__main__":
+    main()
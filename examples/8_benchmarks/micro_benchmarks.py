@@ -0,0 +1,274 @@
+"""
+Micro-benchmarks of the Grid and Results operations on synthetic hotspot maps.
+
+No SuperStar run or protein is needed: hotspot-like maps are generated with `hotspots.hs_benchmark` at each requested
+size (cubic, 0.5 Angstrom spacing), both sparse (a few percent of points scoring) and dense (every point scoring).
+
+Every operation is timed for each backend:
+
+    grid        the methods of `hotspots.grid_extension.Grid`, `hotspots.result.Results` and `_GridEnsemble`
+    numpy       equivalent numpy / scipy array code, the reference for array based replacements
+
+Operations that fail for a backend are recorded with an "error" entry rather than stopping the run. The report is a
+JSON list of runs labelled "<backend>:<n>^3:<density>", which can be compared with a baseline:
+
+    python micro_benchmarks.py -s 50,100,150,200,250 -o current.json
+    python micro_benchmarks.py -s 50,100 -k numpy -b baseline.json
+"""
+from __future__ import print_function, division
+
+import argparse
+import csv
+import sys
+from collections import OrderedDict
+
+import numpy as np
+from scipy import ndimage
+
+from hotspots.hs_benchmark import (BenchmarkRun, checksum_array, checksum_grid, compare_to_baseline,
+                                   synthetic_hotspot_array, synthetic_grid, write_report)
+
+
+def _grid_backend(arrays, shifted):
+    """
+    operations using the grid classes
+
+    :param dict arrays: {probe: `numpy.array`}
+    :param `numpy.array` shifted: the apolar array, offset by 5 points along each axis
+    :return: dict of operations
+    """
+    from hotspots.grid_extension import Grid, _GridEnsemble
+    from hotspots.result import Results
+
+    grids = {probe: synthetic_grid(a) for probe, a in arrays.items()}
+    g = grids["apolar"]
+    other = synthetic_grid(shifted, origin=(2.5, 2.5, 2.5))
+
+    def ensemble():
+        e = _GridEnsemble()
+        e.get_4D_results_array(list(grids.values()))
+        return e.get_gridpoint_means(), e.get_gridpoint_max()
+
+    def running_ensemble():
+        e = _GridEnsemble()
+        e.get_running_statistics(list(grids.values()))
+        return e.get_gridpoint_means(), e.get_gridpoint_max()
+
+    operations = OrderedDict([
+        ("get_array", lambda: Grid.get_array(g)),
+        ("islands", lambda: g.islands(threshold=5)),
+        ("get_single_grid", lambda: Grid.get_single_grid(grids, mask=False)),
+        ("common_grid", lambda: Grid.common_grid([g, other])),
+        ("top_points", lambda: g.top_points(npoints=1000)),
+        ("restricted_volume", lambda: g.restricted_volume(volume=150)),
+        ("gaussian", lambda: g.gaussian(sigma=0.2)),
+        ("get_peaks", lambda: g.get_peaks(min_distance=6, cutoff=2)),
+        ("get_features", lambda: Results._get_features(grids, threshold=5, min_feature_gp=6)),
+        ("ensemble_statistics", ensemble),
+        ("running_ensemble_statistics", running_ensemble),
+    ])
+    return operations
+
+
+def _numpy_backend(arrays, shifted):
+    """
+    the same operations on plain arrays
+
+    :param dict arrays: {probe: `numpy.array`}
+    :param `numpy.array` shifted: the apolar array, offset by 5 points along each axis
+    :return: dict of operations
+    """
+    a = arrays["apolar"]
+
+    def single_grid():
+        # a point is kept only where one probe is strictly the highest, as in `Grid.multi_max_mask`
+        stack = np.stack(list(arrays.values()))
+        top = np.sort(stack, axis=0)
+        return np.where(top[-1] > top[-2], top[-1], 0.)
+
+    def common_grid():
+        shape = [n + 5 for n in a.shape]
+        out = [np.zeros(shape), np.zeros(shape)]
+        out[0][:a.shape[0], :a.shape[1], :a.shape[2]] = a
+        out[1][5:, 5:, 5:] = shifted
+        return out
+
+    def top_points(npoints=1000):
+        flat = a.ravel()
+        threshold = np.partition(flat, flat.size - npoints)[flat.size - npoints]
+        return np.where(a > threshold, a, 0.)
+
+    def restricted_volume(volume=150):
+        max_points = int(float(volume) / 0.125)
+        flat = a.ravel()
+        keep = np.argpartition(flat, flat.size - max_points)[flat.size - max_points:]
+        out = np.zeros(flat.size)
+        out[keep] = flat[keep]
+        out[out < 1] = 0
+        return out.reshape(a.shape)
+
+    def get_peaks(min_distance=6, cutoff=2):
+        local_max = ndimage.maximum_filter(a, size=2 * min_distance + 1, mode="constant") == a
+        return np.argwhere(local_max & (a > cutoff))
+
+    def get_features(threshold=5, min_feature_gp=6, excluded=("apolar",)):
+        features = []
+        for probe, array in arrays.items():
+            if probe in excluded:
+                continue
+            labels, n = ndimage.label(array > threshold)
+            sizes = np.bincount(labels.ravel())[1:]
+            features.extend((probe, i + 1) for i in np.flatnonzero(sizes > min_feature_gp))
+        return features
+
+    def ensemble():
+        values = np.stack(list(arrays.values()), axis=-1)
+        nonzeros = values.max(axis=-1).nonzero()
+        return values[nonzeros].mean(axis=-1), values[nonzeros].max(axis=-1)
+
+    def running_ensemble():
+        mean = np.zeros(a.shape)
+        maximum = np.zeros(a.shape)
+        for n, array in enumerate(arrays.values(), 1):
+            mean += (array - mean) / n
+            np.maximum(maximum, array, out=maximum)
+        nonzeros = maximum.nonzero()
+        return mean[nonzeros], maximum[nonzeros]
+
+    operations = OrderedDict([
+        ("get_array", lambda: a.copy()),
+        ("islands", lambda: ndimage.label(a > 5)),
+        ("get_single_grid", single_grid),
+        ("common_grid", common_grid),
+        ("top_points", top_points),
+        ("restricted_volume", restricted_volume),
+        ("gaussian", lambda: ndimage.gaussian_filter(a, sigma=0.2)),
+        ("get_peaks", get_peaks),
+        ("get_features", get_features),
+        ("ensemble_statistics", ensemble),
+        ("running_ensemble_statistics", running_ensemble),
+    ])
+    return operations
+
+
+BACKENDS = OrderedDict([("grid", _grid_backend), ("numpy", _numpy_backend)])
+
+
+def _checksum(out):
+    """ checksum of an operation's output, where it is a single grid or array """
+    if isinstance(out, np.ndarray):
+        return checksum_array(out)
+    if hasattr(out, "bounding_box"):
+        return checksum_grid(out)
+    return None
+
+
+class Organiser(argparse.ArgumentParser):
+    """ class to run the micro-benchmarks """
+
+    def __init__(self):
+        super(self.__class__, self).__init__(description=__doc__,
+                                             formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument(
+            '-s', '--sizes',
+            default='50,100,150,200,250',
+            help='comma separated grid edge lengths in grid points (default = 50,100,150,200,250)'
+        )
+        self.add_argument(
+            '-d', '--densities',
+            default='sparse,dense',
+            help='comma separated map densities: sparse, dense (default = sparse,dense)'
+        )
+        self.add_argument(
+            '-k', '--backends',
+            default=','.join(BACKENDS),
+            help='comma separated backends: {} (default = all)'.format(', '.join(BACKENDS))
+        )
+        self.add_argument(
+            '-p', '--operations',
+            default=None,
+            help='comma separated operations to run (default = all)'
+        )
+        self.add_argument(
+            '-r', '--repeat',
+            type=int,
+            default=3,
+            help='number of repeats, the fastest is kept (default = 3)'
+        )
+        self.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='random seed for the synthetic maps (default = 0)'
+        )
+        self.add_argument(
+            '-o', '--out',
+            default='micro_benchmarks.json',
+            help='path of the JSON report (default = micro_benchmarks.json)'
+        )
+        self.add_argument(
+            '-b', '--baseline',
+            default=None,
+            help='baseline JSON report to compare against'
+        )
+        self.add_argument(
+            '-t', '--threshold',
+            type=float,
+            default=0.2,
+            help='allowed fractional slow-down before an operation is reported as a regression (default = 0.2)'
+        )
+        self.args = self.parse_args()
+
+    def run_case(self, backend, n, density):
+        """ times every operation of one backend on one synthetic case """
+        shape = (n, n, n)
+        arrays = OrderedDict((probe, synthetic_hotspot_array(shape, density, seed=self.args.seed + i))
+                             for i, probe in enumerate(("apolar", "donor", "acceptor")))
+        shifted = synthetic_hotspot_array(shape, density, seed=self.args.seed + 3)
+
+        run = BenchmarkRun("{}:{}^3:{}".format(backend, n, density),
+                           metadata={"backend": backend, "shape": shape, "density": density,
+                                     "seed": self.args.seed, "repeat": self.args.repeat,
+                                     "nonzero": int(np.count_nonzero(arrays["apolar"]))})
+        operations = BACKENDS[backend](arrays, shifted)
+        selected = self.args.operations.split(",") if self.args.operations else list(operations)
+
+        for name in selected:
+            try:
+                out = run.measure(name, operations[name], repeat=self.args.repeat)
+            except Exception as e:
+                run.stages[name] = OrderedDict(wall=float("nan"), cpu=float("nan"), peak_rss=None,
+                                               error="{}: {}".format(type(e).__name__, e))
+                continue
+            checksum = _checksum(out)
+            if checksum is not None:
+                run.stages[name]["checksum"] = checksum
+
+        print(run)
+        return run
+
+    def run(self):
+        runs = []
+        for backend in self.args.backends.split(","):
+            for n in [int(s) for s in self.args.sizes.split(",")]:
+                for density in self.args.densities.split(","):
+                    runs.append(self.run_case(backend, n, density))
+        write_report(runs, self.args.out)
+
+        if self.args.baseline:
+            regressions = compare_to_baseline([r.to_dict() for r in runs], self.args.baseline,
+                                              threshold=self.args.threshold)
+            writer = csv.writer(sys.stdout)
+            for row in regressions:
+                writer.writerow(row)
+            return 1 if regressions else 0
+        return 0
+
+
+def main():
+    r = Organiser()
+    sys.exit(r.run())
+
+
+if __name__ == "__main__":
+    main()
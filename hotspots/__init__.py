@@ -1,4 +1,38 @@
-from hotspots import calculation
+"""
+The submodules of :mod:`hotspots` are imported on first use, e.g. `hotspots.calculation`, so that importing the
+package (and worker processes that only need grids) does not pay for the whole pipeline.
+"""
+import importlib
+
+_submodules = ("atomic_hotspot_calculation",
+               "calculation",
+               "grid_extension",
+               "grid_io",
+               "hs_benchmark",
+               "hs_clustering",
+               "hs_density",
+               "hs_docking",
+               "hs_docking_prep",
+               "hs_ensemble",
+               "hs_features",
+               "hs_io",
+               "hs_metrics",
+               "hs_pharmacophore",
+               "hs_rescore",
+               "hs_utilities",
+               "pdb_python_api",
+               "rest_client",
+               "result")
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module("{}.{}".format(__name__, name))
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_submodules))
 
 
 __author__ = "Chris Radoux, Peter Curran, Mihaela Smilova"
@@ -10,21 +10,28 @@ More information about the SuperStar method is available:
 """
 from __future__ import print_function
 
+import atexit
 import glob
+import hashlib
+import os
+import shutil
 import subprocess
 import sys
 import tempfile
+import time
 from os import environ, mkdir
-from os.path import join, exists, isfile, dirname
+from os.path import join, exists, isfile, dirname, basename, getsize
 
+import numpy as np
+from scipy.spatial import cKDTree
 from ccdc.io import csd_directory, MoleculeWriter
-from ccdc.utilities import PushDir
+from ccdc.protein import Protein
 from concurrent import futures
 
-try:
-    from grid_extension import Grid
-except ImportError:
-    from ccdc.utilities import Grid
+from hotspots.grid_extension import Grid
+
+# distance (Angstrom) beyond the cavity radius within which protein atoms contribute to a SuperStar cavity job
+_SUPERSTAR_CUTOFF = 5.
 
 
 def _run_job(args):
@@ -33,15 +40,235 @@ def _run_job(args):
 
     Runs an Atomic Hotspot calculation using the SuperStar algorithm.
     :param tup or list args: Command, Jobname, SuperStar Environment Variable and Temporary directory
-    :return: tup, temporary directory and jobname
+    :return: tup, temporary directory, jobname and run time (seconds)
     """
     cmd, jobname, superstar_env, temp_dir = args
-    print(temp_dir)
+    start = time.time()
     env = environ.copy()
     env.update(superstar_env)
-    with PushDir(temp_dir):
-        subprocess.call(cmd, shell=sys.platform != 'win32', env=env)
-    return temp_dir, jobname
+    # the working directory is set for the subprocess only, chdir would affect every thread of the process
+    subprocess.call(cmd, shell=sys.platform != 'win32', env=env, cwd=temp_dir)
+    return temp_dir, jobname, time.time() - start
+
+
+class _SuperStarPool(object):
+    """
+    A long-lived pool of SuperStar workers
+
+    SuperStar runs as a subprocess, so the workers are threads that only wait on it: no Python processes are spawned
+    per calculation and the pool can be shared by many calculations (and `hotspots.calculation.Runner` instances).
+    Jobs are queued in the order they are submitted and their results are available as soon as each job finishes.
+
+    >>> pool = _SuperStarPool.shared(max_workers=3)
+    >>> runner = Runner(pool=pool)
+
+    :param int max_workers: number of SuperStar jobs run at the same time
+    """
+    _shared = {}
+
+    def __init__(self, max_workers=3):
+        self.max_workers = max_workers
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @classmethod
+    def shared(cls, max_workers=3):
+        """
+        the pool of this size shared by the whole process, created on first use. Shared pools are closed at
+        interpreter exit, or earlier with :meth:`close_shared`.
+
+        :param int max_workers: number of SuperStar jobs run at the same time
+        :return: `hotspots.atomic_hotspot_calculation._SuperStarPool`
+        """
+        if max_workers not in cls._shared:
+            cls._shared[max_workers] = cls(max_workers=max_workers)
+        return cls._shared[max_workers]
+
+    def submit(self, job):
+        """
+        queues a SuperStar job
+
+        :param tup job: command, jobname, SuperStar environment variables and working directory
+        :return: `concurrent.futures.Future`, resolving to (working directory, jobname, run time)
+        """
+        return self._executor.submit(_run_job, job)
+
+    def run(self, jobs):
+        """
+        queues SuperStar jobs and yields them as they finish
+
+        :param list jobs: list of (command, jobname, SuperStar environment variables, working directory)
+        :return: generator of (working directory, jobname, run time)
+        """
+        # submitted straight away, not on the first iteration
+        submitted = [self.submit(job) for job in jobs]
+        return self._as_completed(submitted)
+
+    @staticmethod
+    def _as_completed(submitted):
+        try:
+            for f in futures.as_completed(submitted):
+                yield f.result()
+        finally:
+            # jobs not yet started are dropped if the caller stops early
+            for f in submitted:
+                f.cancel()
+
+    def close(self):
+        """
+        waits for running jobs and stops the workers
+
+        :return:
+        """
+        self._executor.shutdown(wait=True)
+        for k, v in list(self._shared.items()):
+            if v is self:
+                del self._shared[k]
+
+    @classmethod
+    def close_shared(cls):
+        """
+        closes every shared pool
+
+        :return:
+        """
+        for pool in list(cls._shared.values()):
+            pool.close()
+
+
+atexit.register(_SuperStarPool.close_shared)
+
+
+class _SuperStarCache(object):
+    """
+    A content-addressed store of SuperStar outputs
+
+    Each entry holds the ".acnt" and ".ligsite.acnt" grids of one job, keyed by a hash of the atoms SuperStar was run
+    on and the job's instructions. In cavity mode only the atoms around the cavity are hashed, so structures that
+    differ away from the pocket (mutants, ensemble members) are served from the store instead of running SuperStar. The least recently used entries are removed once the store grows
+    beyond `max_size`.
+
+    :param str directory: path to the store, created if needed
+    :param float max_size: maximum size of the store in megabytes
+    """
+    extensions = (".acnt", ".ligsite.acnt")
+
+    def __init__(self, directory, max_size=2048):
+        self.directory = directory
+        self.max_size = max_size
+        if not exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(protein, instruction, cavity_origin=None, radius=None):
+        """
+        hash of a SuperStar job, independent of atom order and of the job's name and working directory
+
+        :param `ccdc.protein.Protein` protein: the protein SuperStar is run on
+        :param `hotspots.atomic_hotspot_calculation._AtomicHotspot.InstructionFile` instruction: job instructions
+        :param tup cavity_origin: (float(x), float(y), float(z)), if supplied only atoms within `radius` are hashed
+        :param float radius: distance from the cavity origin in Angstrom
+        :return: str, hex digest
+        """
+        atoms = protein.atoms
+        if cavity_origin is not None and radius is not None:
+            coordinates = np.array([tuple(a.coordinates) for a in atoms]).reshape(-1, 3)
+            near = np.linalg.norm(coordinates - np.array(cavity_origin), axis=1) <= radius
+            atoms = [a for a, n in zip(atoms, near) if n]
+        atoms = sorted("{} {} {:.3f} {:.3f} {:.3f}".format(a.atomic_symbol, a.formal_charge, *a.coordinates)
+                       for a in atoms)
+        h = hashlib.sha256()
+        h.update("\n".join(atoms).encode())
+        h.update(instruction.ins_str.encode())
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return join(self.directory, key[:2], key)
+
+    def fetch(self, key, out, jobname):
+        """
+        copies a stored result into a job directory, as if SuperStar had run there
+
+        :param str key: job hash
+        :param str out: job directory
+        :param str jobname: name of the atomic probe
+        :return: bool, True if the job was in the store
+        """
+        entry = self._entry(key)
+        if not exists(entry):
+            return False
+        try:
+            for ext in self.extensions:
+                shutil.copyfile(join(entry, "job" + ext), join(out, jobname + ext))
+            # the modification time of an entry records when it was last used
+            os.utime(entry, None)
+        except (IOError, OSError):
+            # evicted by another process while being read
+            return False
+        return True
+
+    def store(self, key, out, jobname):
+        """
+        adds the outputs of a finished job to the store
+
+        :param str key: job hash
+        :param str out: job directory
+        :param str jobname: name of the atomic probe
+        :return:
+        """
+        entry = self._entry(key)
+        if exists(entry) or not all(exists(join(out, jobname + ext)) for ext in self.extensions):
+            return
+        if not exists(dirname(entry)):
+            try:
+                os.makedirs(dirname(entry))
+            except OSError:
+                pass
+        # written to a private directory first, so other processes never see a partial entry
+        tmp = tempfile.mkdtemp(prefix=".", dir=dirname(entry))
+        for ext in self.extensions:
+            shutil.copyfile(join(out, jobname + ext), join(tmp, "job" + ext))
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """
+        removes the least recently used entries until the store is within its size limit
+
+        :return: int, number of entries removed
+        """
+        entries = []
+        for prefix in os.listdir(self.directory):
+            if not os.path.isdir(join(self.directory, prefix)):
+                continue
+            for key in os.listdir(join(self.directory, prefix)):
+                if key.startswith("."):
+                    # an entry still being written
+                    continue
+                entry = join(self.directory, prefix, key)
+                try:
+                    size = sum(getsize(join(entry, f)) for f in os.listdir(entry))
+                    entries.append((os.stat(entry).st_mtime, size, entry))
+                except OSError:
+                    continue
+
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for mtime, size, entry in sorted(entries):
+            if total <= self.max_size * 1024 ** 2:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
 
 
 class _AtomicHotspot(object):
@@ -59,15 +286,27 @@ class _AtomicHotspot(object):
         :param box_border: padding on the output grid
         :param min_propensity: the minimum propensity value that can be assigned to a grid. value = 1 is random
         :param superstar_sigma: the sigma value for the gaussian smoothing function
+        :param cavity_radius: radius of the region around a cavity origin searched for cavities (cavity mode only)
+        :param cavity_shell: in cavity mode, residues further than cavity_radius + cavity_shell from the cavity origin
+                             are removed before SuperStar is run. None (default) runs every cavity on the full
+                             protein. Cropping (e.g. 8.) makes each job faster but changes the results, including the
+                             LIGSITE buriedness, which is then computed on the cropped protein.
+        :param cache_dir: directory in which SuperStar outputs are stored and reused across calculations. Defaults to
+                          the HOTSPOTS_SUPERSTAR_CACHE environment variable, if neither is set nothing is cached.
+        :param cache_size: maximum size of the cache in megabytes
         """
 
         def __init__(self, database='CSD', map_background_value=1, box_border=10, min_propensity=0,
-                     superstar_sigma=0.5):
+                     superstar_sigma=0.5, cavity_radius=10, cavity_shell=None, cache_dir=None, cache_size=2048):
             self.database = database
             self.mapbackgroundvalue = map_background_value
             self.boxborder = box_border
             self.minpropensity = min_propensity
             self.superstar_sigma = superstar_sigma
+            self.cavity_radius = cavity_radius
+            self.cavity_shell = cavity_shell
+            self.cache_dir = cache_dir or environ.get('HOTSPOTS_SUPERSTAR_CACHE')
+            self.cache_size = cache_size
             self.superstar_executable, self.superstar_env = self._set_environment_variables()
             self.temp_dir = tempfile.mkdtemp()
             self._csd_atomic_probes = {}
@@ -182,10 +421,11 @@ class _AtomicHotspot(object):
         :param str probename: identifier for the atomic probe
         :param `hotspots.AtomicHotspot.Settings` settings: supplied if settings are adjusted from default
         :param tup cavity: (float(x), float(y), float(z)) describing the centre of a cavity
+        :param str molecule_file: path to the protein file, relative to the working directory of the job
         """
 
-        def __init__(self, jobname, probename, settings, cavity=None):
-            self.ins_str = _atomic_hotspot_ins(jobname, probename, settings)
+        def __init__(self, jobname, probename, settings, cavity=None, molecule_file='protein.mol2'):
+            self.ins_str = _atomic_hotspot_ins(jobname, probename, settings, molecule_file)
             if cavity:
                 self.ins_str += '\nCAVITY_ORIGIN {} {} {}'.format(round(cavity[0], 1),
                                                                   round(cavity[1], 1),
@@ -210,7 +450,79 @@ class _AtomicHotspot(object):
         else:
             self.settings = settings
 
-    def _get_cmd(self, protein, cavity_origin, out=None):
+        self._cache = None
+
+    @property
+    def cache(self):
+        """
+        store of SuperStar outputs, set up from `settings.cache_dir`
+
+        :return: `hotspots.atomic_hotspot_calculation._SuperStarCache`, None if caching is off
+        """
+        if not self.settings.cache_dir:
+            return None
+        if self._cache is None or self._cache.directory != self.settings.cache_dir:
+            self._cache = _SuperStarCache(self.settings.cache_dir, max_size=self.settings.cache_size)
+        self._cache.max_size = self.settings.cache_size
+        return self._cache
+
+    @staticmethod
+    def _write_protein(protein, out):
+        """
+        private method
+
+        writes the protein to the job directory
+        :param `ccdc.protein.Protein` protein: protein
+        :param str out: output directory
+        :return: str, path to the protein file
+        """
+        fname = join(out, 'protein.mol2')
+        with MoleculeWriter(fname) as writer:
+            writer.write(protein)
+        return fname
+
+    def _cavity_shell(self, protein, cavity_origin):
+        """
+        private method
+
+        crops the protein to the residues that can influence the SuperStar calculation for one cavity
+        :param `ccdc.protein.Protein` protein: protein
+        :param tup cavity_origin: (float(x), float(y), float(z))
+        :return: `ccdc.protein.Protein`
+        """
+        if self.settings.cavity_shell is None:
+            return protein
+
+        shell = protein.copy()
+        bs = Protein.BindingSiteFromPoint(protein=shell,
+                                          origin=cavity_origin,
+                                          distance=self.settings.cavity_radius + self.settings.cavity_shell)
+        keep = set(r.identifier for r in bs.residues)
+        for r in shell.residues:
+            if r.identifier not in keep:
+                shell.remove_residue(r.identifier)
+        return shell
+
+    @staticmethod
+    def _cavity_volume(tree, cavity_origin, radius, clearance=3.):
+        """
+        private method
+
+        estimates the empty volume around a cavity origin: the points of a 1 Angstrom lattice within `radius` of the
+        origin that are further than `clearance` from every protein atom
+        :param `scipy.spatial.cKDTree` tree: protein atom coordinates
+        :param tup cavity_origin: (float(x), float(y), float(z))
+        :param float radius: search radius
+        :param float clearance: points closer than this to an atom are occupied
+        :return: int, volume in Angstroms ^ 3
+        """
+        r = int(np.ceil(radius))
+        offsets = np.mgrid[-r:r + 1, -r:r + 1, -r:r + 1].reshape(3, -1).T
+        points = offsets[np.linalg.norm(offsets, axis=1) <= radius] + np.asarray(tuple(cavity_origin), dtype=float)
+        distances, _ = tree.query(points, distance_upper_bound=clearance)
+        return int(np.count_nonzero(np.isinf(distances)))
+
+    def _get_cmd(self, protein, cavity_origin, out=None, protein_file=None):
         """
         private method
 
@@ -218,30 +530,70 @@ class _AtomicHotspot(object):
         :param str jobname: general format (<probe_type>.ins)
         :param str probename: probe identifier
         :param str out: output directory (outputting ins maybe useful for debugging)
-        :return:
+        :param str protein_file: path to an existing protein file, if supplied the protein is not written again
+        :return: list of commands, list of cache keys (None if caching is off)
         """
         cmds = []
+        keys = []
         if not out:
             out = self.settings.temp_dir
 
-        with PushDir(out):
-            with MoleculeWriter(join(out, 'protein.mol2')) as writer:
-                writer.write(protein)
+        if protein_file is None:
+            protein_file = self._write_protein(protein, out)
+
+        if dirname(protein_file) == out:
+            molecule_file = 'protein.mol2'
+        else:
+            molecule_file = protein_file
 
         for jobname, probename in self.settings.atomic_probes.items():
             instruction = self.InstructionFile(jobname=jobname,
                                                probename=probename,
                                                settings=self.settings,
-                                               cavity=cavity_origin)
+                                               cavity=cavity_origin,
+                                               molecule_file=molecule_file)
+            if self.cache is not None:
+                # the instructions are hashed with a fixed job name and protein file, and in cavity mode only the
+                # atoms that can contribute to the cavity, whether or not the protein was cropped
+                keys.append(self.cache.key(protein,
+                                           self.InstructionFile(jobname="job",
+                                                                probename=probename,
+                                                                settings=self.settings,
+                                                                cavity=cavity_origin),
+                                           cavity_origin=cavity_origin or None,
+                                           radius=self.settings.cavity_radius + _SUPERSTAR_CUTOFF))
+            else:
+                keys.append(None)
 
             cmds.append('{}'.format(self.settings.superstar_executable)
                         + ' '
                         + '{}.ins'.format(jobname)
                         )
 
-            with PushDir(out):
-                instruction.write("{}.ins".format(jobname))
-        return cmds
+            instruction.write(join(out, "{}.ins".format(jobname)))
+        return cmds, keys
+
+    @staticmethod
+    def _max_merge(grids):
+        """
+        private method
+
+        places grids onto a shared frame, taking the maximum value at each point in a single pass
+        :param list grids: `ccdc.utilities.Grid` instances with the same spacing
+        :return: `hotspots.grid_extension.Grid`
+        """
+        origin = np.min([tuple(g.bounding_box[0]) for g in grids], axis=0)
+        far_corner = np.max([tuple(g.bounding_box[1]) for g in grids], axis=0)
+        blank = Grid(origin=origin, far_corner=far_corner, spacing=grids[0].spacing, default=0, _grid=None)
+
+        frame = np.zeros(blank.nsteps)
+        for g in grids:
+            i, j, k = blank.point_to_indices(g.bounding_box[0])
+            nx, ny, nz = g.nsteps
+            box = frame[i:i + nx, j:j + ny, k:k + nz]
+            np.maximum(box, Grid.get_array(g), out=box)
+
+        return Grid.array_to_grid(frame, blank)
 
     @staticmethod
     def _merge_cavities(results):
@@ -261,11 +613,8 @@ class _AtomicHotspot(object):
 
         merged_results = []
         for identifier, atomic_results in result_dict.items():
-            g_dict = {"grid_{}".format(i): g.grid for i, g in enumerate(atomic_results)}
-            g = Grid.get_single_grid(g_dict, mask=False)
-
-            b_dict = {"buriedness_{}".format(i): g.buriedness for i, g in enumerate(atomic_results)}
-            b = Grid.get_single_grid(b_dict, mask=False)
+            g = _AtomicHotspot._max_merge([r.grid for r in atomic_results])
+            b = _AtomicHotspot._max_merge([r.buriedness for r in atomic_results])
 
             merged_results.append(_AtomicHotspotResult(identifier=identifier,
                                                       grid=g,
@@ -275,7 +624,7 @@ class _AtomicHotspot(object):
 
         return merged_results
 
-    def calculate(self, protein, nthreads=None, cavity_origins=None):
+    def calculate(self, protein, nthreads=None, cavity_origins=None, metrics=None, pool=None):
         """ Calculates the Atomic Hotspot
 
         This function executes the Atomic Hotspot Calculation for a given input protein.
@@ -284,6 +633,9 @@ class _AtomicHotspot(object):
         :param `ccdc.protein.Protein` protein: The input protein for which the Atomic Hotspot is to be calculated
         :param int nthreads: The number of processor to be used in the calculation. NB: do not exceed the number of available CPU's
         :param list cavity_origins: The list of cavity origins, if supplied the Atomic Hotspot detection will run on a cavity mode. This increase the speed of the calculation however small cavity can be missed in some cases.
+        :param `hotspots.hs_metrics.RunMetrics` metrics: if supplied, per job timings are recorded
+        :param `hotspots.atomic_hotspot_calculation._SuperStarPool` pool: pool used to run SuperStar. By default the
+                                                                           process-wide pool with `nthreads` workers
 
         :return: list of :class:`hotspots._AtomicHotspotResults` instances
 
@@ -306,49 +658,119 @@ class _AtomicHotspot(object):
         >>>     results = a.calculate(protein=protein, nthreads=3)
         [_AtomicHotspotResult(donor), _AtomicHotspotResult(apolar), _AtomicHotspotResult(acceptor)]
 
+        """
+        return list(self.calculate_iter(protein,
+                                        nthreads=nthreads,
+                                        cavity_origins=cavity_origins,
+                                        metrics=metrics,
+                                        pool=pool))
+
+    def calculate_iter(self, protein, nthreads=None, cavity_origins=None, metrics=None, pool=None):
+        """
+        Runs the Atomic Hotspot calculation, yielding the result of each atomic probe as soon as all of its jobs have
+        finished, so that later stages can start on a probe while others are still running. In cavity mode, a probe's
+        result is the merge of its cavities.
+
+        :param `ccdc.protein.Protein` protein: The input protein for which the Atomic Hotspot is to be calculated
+        :param int nthreads: The number of SuperStar jobs run at once. None runs the jobs one after the other
+        :param list cavity_origins: The list of cavity origins, if supplied the Atomic Hotspot detection will run on a cavity mode.
+        :param `hotspots.hs_metrics.RunMetrics` metrics: if supplied, per job timings are recorded
+        :param `hotspots.atomic_hotspot_calculation._SuperStarPool` pool: pool used to run SuperStar
+        :return: generator of :class:`hotspots._AtomicHotspotResults` instances
         """
         self._merge = False
+        self.cavity_boxes = None
+        jobs = []
         if cavity_origins:
             if len(cavity_origins) > 1:
                 self._merge = True
-            temp_dirs = []
-            cmds = []
-            env_str = [self.settings.superstar_env] * len(self.settings.atomic_probes) * len(cavity_origins)
-            jobnames = list(self.settings.atomic_probes.keys()) * len(cavity_origins)
+
+            if self.settings.cavity_shell is None:
+                protein_file = self._write_protein(protein, self.settings.temp_dir)
+            tree = cKDTree(np.array([tuple(a.coordinates) for a in protein.atoms]).reshape(-1, 3))
 
             for i, cavity_origin in enumerate(cavity_origins):
                 out = (join(self.settings.temp_dir, str(i)))
                 if not exists(out):
                     mkdir(out)
-                t = []
-                t.append(out)
-                t *= len(self.settings.atomic_probes)
-                temp_dirs.extend(t)
-                cmds.extend(self._get_cmd(protein, cavity_origin, out=out))
 
-        else:
-            temp_dirs = [self.settings.temp_dir] * len(self.settings.atomic_probes)
-            env_str = [self.settings.superstar_env] * len(self.settings.atomic_probes)
-            jobnames = self.settings.atomic_probes.keys()
-            cmds = self._get_cmd(protein, cavity_origins)
-
-        inputs = zip(cmds, jobnames, env_str, temp_dirs)
+                if self.settings.cavity_shell is None:
+                    cmds, keys = self._get_cmd(protein, cavity_origin, out=out, protein_file=protein_file)
+                else:
+                    cmds, keys = self._get_cmd(self._cavity_shell(protein, cavity_origin), cavity_origin, out=out)
 
-        results = []
-        if nthreads:
-            with futures.ProcessPoolExecutor(max_workers=nthreads) as executor:
-                for t, j in executor.map(_run_job, inputs):
-                    results.append(_AtomicHotspotResult.find(temp_dir=t, jobname=j))
+                # the estimated cavity volume is used as an estimate of the cost of the job
+                cost = self._cavity_volume(tree, cavity_origin, self.settings.cavity_radius)
+                jobs.extend((cost, key, (cmd, jobname, self.settings.superstar_env, out))
+                            for cmd, key, jobname in zip(cmds, keys, self.settings.atomic_probes.keys()))
 
         else:
-            for input in inputs:
-                t, j = _run_job(input)
-                results.append(_AtomicHotspotResult.find(temp_dir=t, jobname=j))
-
-        if self._merge is True:
-            results = self._merge_cavities(results)
+            cmds, keys = self._get_cmd(protein, cavity_origins)
+            jobs.extend((0, key, (cmd, jobname, self.settings.superstar_env, self.settings.temp_dir))
+                        for cmd, key, jobname in zip(cmds, keys, self.settings.atomic_probes.keys()))
+
+        cache_keys = {}
+        hits = []
+        inputs = []
+        remaining = dict((jobname, 0) for jobname in self.settings.atomic_probes.keys())
+        # longest jobs first, so the pool is not left waiting on a large cavity at the end
+        for cost, key, job in sorted(jobs, key=lambda x: x[0], reverse=True):
+            cmd, jobname, env, out = job
+            remaining[jobname] += 1
+            if key is not None and self.cache.fetch(key, out, jobname):
+                if metrics is not None:
+                    metrics.count("superstar_cache_hits")
+                hits.append((out, jobname))
+                continue
+            if key is not None:
+                cache_keys[(out, jobname)] = key
+                if metrics is not None:
+                    metrics.count("superstar_cache_misses")
+            inputs.append(job)
+
+        if pool is None and nthreads:
+            pool = _SuperStarPool.shared(nthreads)
+
+        if pool is not None:
+            completed = pool.run(inputs)
+        else:
+            completed = (_run_job(i) for i in inputs)
+
+        finished = {}
+        boxes = set()
+
+        def _finish(t, j):
+            # returns the probe's result once the last of its jobs is done
+            result = _AtomicHotspotResult.find(temp_dir=t, jobname=j, metrics=metrics)
+            if cavity_origins:
+                boxes.add((tuple(result.grid.bounding_box[0]), tuple(result.grid.bounding_box[1])))
+            finished.setdefault(j, []).append(result)
+            remaining[j] -= 1
+            if remaining[j] > 0:
+                return None
+            if self._merge is True:
+                return self._merge_cavities(finished.pop(j))[0]
+            return finished.pop(j)[0]
+
+        for t, j in hits:
+            result = _finish(t, j)
+            if result is not None:
+                yield result
+
+        for t, j, seconds in completed:
+            if metrics is not None:
+                stage = "superstar:{}".format(j)
+                if cavity_origins:
+                    stage += ":{}".format(basename(t))
+                metrics.record(stage, seconds)
+            if (t, j) in cache_keys:
+                self.cache.store(cache_keys[(t, j)], t, j)
+            result = _finish(t, j)
+            if result is not None:
+                yield result
 
-        return results
+        if cavity_origins:
+            self.cavity_boxes = list(boxes)
 
 
 class _AtomicHotspotResult(object):
@@ -408,14 +830,16 @@ class _AtomicHotspotResult(object):
         return self._buriedness
 
     @staticmethod
-    def find(temp_dir, jobname):
+    def find(temp_dir, jobname, metrics=None):
         """
         searches the calculation working directory and constructs a
         `hotspots.atomic_hotspots_calculation.AtomHotspotResult` instance
         :param str temp_dir: path to the temporary calculation directory
         :param str jobname: name of the atomic probe used in the calculation
+        :param `hotspots.hs_metrics.RunMetrics` metrics: if supplied, reading and ligsite correction are timed
         :return: a `hotspots.atomic_hotspots_calculation.AtomHotspotResult` instance
         """
+        start = time.time()
         grid_path = join(temp_dir, jobname + ".acnt")
         grid = Grid.from_file(grid_path)
         buriedness_path = join(temp_dir, jobname + ".ligsite.acnt")
@@ -423,8 +847,14 @@ class _AtomicHotspotResult(object):
         if exists(buriedness_path):
             b_grid = Grid.from_file(buriedness_path)
             print('ligsite extrema', b_grid.extrema)
+            if metrics is not None:
+                metrics.record("superstar_read", time.time() - start)
+                metrics.count("grid_allocations", 2)
+                start = time.time()
             # b.write('buriedness_broken.grd')
             buriedness = _AtomicHotspotResult._correct_ligsite(grid, b_grid)
+            if metrics is not None:
+                metrics.record("ligsite_correction", time.time() - start)
 
         else:
             print(buriedness_path)
@@ -452,12 +882,13 @@ class _AtomicHotspotResult(object):
         return l + ((mask * lc).mean_value_of_neighbours() * mask)
 
 
-def _atomic_hotspot_ins(jobname, probename, settings):
+def _atomic_hotspot_ins(jobname, probename, settings, molecule_file='protein.mol2'):
     """
     template for atomic hotspot input file (SuperStar ins)
     :param str jobname: general format (<probe_type>.ins)
     :param str probename: probe identifier
     :param `hotspots.atomic_hotspot_calculation.AtomicHotspot.Settings`settings:
+    :param str molecule_file: path to the protein file
     :return: str, atomic hotspot calculation input str
     """
     ss_str = '''
@@ -472,12 +903,12 @@ SHELL_VALUES 0.5 0
 SIGCHECK_METHOD POISSON SHELL
 PROPENSITY_CORRECTION LOGP DEFAULT DEFAULT
 MIN_CAVITY_VOLUME 10
-CAVITY_RADIUS 10
+CAVITY_RADIUS {6}
 PEAK_FITTING 0
 PEAK_FITTING_NCYCLES 1
 MIN_PEAK_HEIGHT 0
 PEAK_FITTING_REFINE 0
-MOLECULE_FILE protein.mol2
+MOLECULE_FILE {7}
 CAVITY_DETECTION 1
 MIN_PSP 5
 SAVE_CAVITY MESH
@@ -532,6 +963,8 @@ ATOM_SCORING SINGLE_POINT'''.format(jobname,
                                     settings.mapbackgroundvalue,
                                     settings.boxborder,
                                     settings.minpropensity,
-                                    settings.superstar_sigma)
+                                    settings.superstar_sigma,
+                                    settings.cavity_radius,
+                                    molecule_file)
 
     return ss_str
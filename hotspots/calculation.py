@@ -6,6 +6,7 @@ The main classes of the :mod:`hotspots.calculation` module are:
 
 - :class:`hotspots.calculation.Buriedness`
 - :class:`hotspots.calculation.Runner`
+- :class:`hotspots.calculation.RegionOfInterest`
 
 More information about the Fragment Hotspot Maps method is available from:
     - Radoux, C.J. et. al., Identifying the Interactions that Determine Fragment Binding at Protein Hotspots J. Med. Chem. 2016, 59 (9), 4314-4325 [dx.doi.org/10.1021/acs.jmedchem.5b01980]
@@ -15,32 +16,35 @@ More information about the Ghecom method is available from:
 """
 from __future__ import print_function, division
 
+import copy
 import multiprocessing
 import operator
+import queue
 import random
 import shutil
+import subprocess
 import sys
 import tempfile
+import threading
 import time
+from concurrent import futures
 from functools import reduce
-from os import system, environ
+from os import environ
 from os.path import join
 
 import numpy as np
-import pkg_resources
 from ccdc.cavity import Cavity
 from ccdc.io import MoleculeWriter, MoleculeReader
 from ccdc.molecule import Molecule, Coordinates
 from ccdc.protein import Protein
-from ccdc.utilities import PushDir
 from scipy import ndimage
-from skimage.morphology import ball
-from skimage.transform import resize
+from scipy.spatial import cKDTree
 # from hotspots.protoss import Protoss
 from tqdm import tqdm
 
 from hotspots.atomic_hotspot_calculation import _AtomicHotspot
 from hotspots.grid_extension import Grid
+from hotspots.hs_metrics import RunMetrics
 from hotspots.hs_utilities import Helper
 from hotspots.pdb_python_api import PDBResult
 from hotspots.result import Results
@@ -62,6 +66,8 @@ class ExpBuriedness(object):
         to the max probe radius
         :return:
         """
+        from skimage.morphology import ball
+
         probe_selem_dict = {}
 
         # Small probe
@@ -146,6 +152,7 @@ class ExpBuriedness(object):
         out_array = out_g.get_array()
         scaled_g = Grid.initalise_grid(self.out_grid.bounding_box, padding=0, spacing=0.5)
 
+        from skimage.transform import resize
         scaled_array = resize(out_array, scaled_g.nsteps ,anti_aliasing=False)
 
 
@@ -211,28 +218,32 @@ class Buriedness(object):
         self.settings.protein = protein
         self.settings.out_grid = out_grid
 
-    def calculate(self):
+    def run(self):
         """
-        runs the buriedness calculation
+        runs Ghecom. The output grid is not needed until the result is read, so it can be set afterwards.
 
-        :return: `hotspots.calculation._BuriednessResult`: a class with a :class:`ccdc.utilities.Grid` attribute
+        :return: None
         """
+        if self.settings.protein is not None:
+            with MoleculeWriter(self.settings.in_name) as writer:
+                writer.write(self.settings.protein)
 
-        with PushDir(self.settings.working_directory):
-            if self.settings.protein is not None:
-                with MoleculeWriter('protein.pdb') as writer:
-                    writer.write(self.settings.protein)
-
-            cmd = "{} {} -M {} -gw {} -rli {} -rlx {} -opoc {}".format(environ['GHECOM_EXE'],
-                                                                       self.settings.in_name,
-                                                                       self.settings.mode,
-                                                                       self.settings.grid_spacing,
-                                                                       self.settings.radius_min_large_sphere,
-                                                                       self.settings.radius_max_large_sphere,
-                                                                       self.settings.out_name)
+        cmd = "{} {} -M {} -gw {} -rli {} -rlx {} -opoc {}".format(environ['GHECOM_EXE'],
+                                                                   self.settings.in_name,
+                                                                   self.settings.mode,
+                                                                   self.settings.grid_spacing,
+                                                                   self.settings.radius_min_large_sphere,
+                                                                   self.settings.radius_max_large_sphere,
+                                                                   self.settings.out_name)
+        subprocess.call(cmd, shell=True, cwd=self.settings.working_directory)
 
-            system(cmd)
+    def calculate(self):
+        """
+        runs the buriedness calculation
 
+        :return: `hotspots.calculation._BuriednessResult`: a class with a :class:`ccdc.utilities.Grid` attribute
+        """
+        self.run()
         return _BuriednessResult(self.settings)
 
 
@@ -414,9 +425,251 @@ class _SampleGrid(object):
         return a.atomic_symbol == 'C' and a.is_cyclic and any(b.atom_type == 'aromatic' for b in a.bonds)
 
 
+class RegionOfInterest(object):
+    """
+    A box confining the hotspot calculation to a binding site of interest.
+
+    SuperStar is run in cavity mode from the centre of the box, and the buriedness, weighted and output grids are
+    cropped to the box. Use one of the `from_` constructors:
+
+    >>> from hotspots.calculation import RegionOfInterest, Runner
+
+    >>> region = RegionOfInterest.from_ligand(protein.ligands[0], margin=6)
+    >>> result = Runner().from_protein(protein, region=region)
+
+    :param tup origin: (float(x), float(y), float(z)), minimum corner of the box
+    :param tup far_corner: (float(x), float(y), float(z)), maximum corner of the box
+    :param float margin: padding added to every side of the box (Angstroms)
+    """
+
+    def __init__(self, origin, far_corner, margin=0.):
+        self.origin = tuple(float(o) - margin for o in origin)
+        self.far_corner = tuple(float(f) + margin for f in far_corner)
+
+    def __str__(self):
+        return 'RegionOfInterest({}, {})'.format(self.origin, self.far_corner)
+    __repr__ = __str__
+
+    @property
+    def centre(self):
+        """
+        centre of the box
+        :return: tup, (float(x), float(y), float(z))
+        """
+        return tuple((o + f) / 2 for o, f in zip(self.origin, self.far_corner))
+
+    @property
+    def radius(self):
+        """
+        radius of the sphere enclosing the box
+        :return: float
+        """
+        return float(np.linalg.norm(np.array(self.far_corner) - np.array(self.origin))) / 2
+
+    @staticmethod
+    def from_coordinates(coordinates, margin=6.):
+        """
+        box around a set of coordinates
+        :param list coordinates: list of (float(x), float(y), float(z))
+        :param float margin: padding (Angstroms)
+        :return: `hotspots.calculation.RegionOfInterest`
+        """
+        coordinates = np.array([tuple(c) for c in coordinates])
+        return RegionOfInterest(coordinates.min(axis=0), coordinates.max(axis=0), margin=margin)
+
+    @staticmethod
+    def from_ligand(ligand, margin=6.):
+        """
+        box around a ligand
+        :param `ccdc.molecule.Molecule` ligand: ligand
+        :param float margin: padding (Angstroms)
+        :return: `hotspots.calculation.RegionOfInterest`
+        """
+        return RegionOfInterest.from_coordinates([a.coordinates for a in ligand.heavy_atoms], margin=margin)
+
+    @staticmethod
+    def from_residues(protein, residues, margin=4.):
+        """
+        box around a set of residues
+        :param `ccdc.protein.Protein` protein: protein
+        :param list residues: residue identifiers (e.g. "A:TYR97") or `ccdc.protein.Protein.Residue` instances
+        :param float margin: padding (Angstroms)
+        :return: `hotspots.calculation.RegionOfInterest`
+        """
+        identifiers = set(r if isinstance(r, str) else r.identifier for r in residues)
+        atoms = [a for r in protein.residues if r.identifier in identifiers for a in r.atoms]
+        if len(atoms) == 0:
+            raise ValueError("None of the residues {} were found in the protein".format(sorted(identifiers)))
+        return RegionOfInterest.from_coordinates([a.coordinates for a in atoms], margin=margin)
+
+    @staticmethod
+    def from_point(point, radius=8.):
+        """
+        box around a sphere
+        :param tup point: (float(x), float(y), float(z))
+        :param float radius: radius of the sphere (Angstroms)
+        :return: `hotspots.calculation.RegionOfInterest`
+        """
+        return RegionOfInterest(point, point, margin=radius)
+
+    @staticmethod
+    def from_box(origin, far_corner, margin=0.):
+        """
+        :param tup origin: (float(x), float(y), float(z))
+        :param tup far_corner: (float(x), float(y), float(z))
+        :param float margin: padding (Angstroms)
+        :return: `hotspots.calculation.RegionOfInterest`
+        """
+        return RegionOfInterest(origin, far_corner, margin=margin)
+
+    def contains(self, points):
+        """
+        :param points: array-like, shape (n, 3)
+        :return: `numpy.array`, bool mask of the points inside the box
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        return np.all((points >= self.origin) & (points <= self.far_corner), axis=1)
+
+    def crop(self, grid):
+        """
+        the part of a grid that lies inside the box
+        :param `hotspots.grid_extension.Grid` grid: grid to crop
+        :return: `hotspots.grid_extension.Grid`
+        """
+        lo = [max(0, i) for i in Grid.point_to_indices(grid, self.origin)]
+        hi = [min(n - 1, i) for i, n in zip(Grid.point_to_indices(grid, self.far_corner), grid.nsteps)]
+        if any(h < l for l, h in zip(lo, hi)):
+            raise ValueError("{} does not overlap the grid".format(self))
+        return grid.sub_grid(tuple(lo) + tuple(hi))
+
+    def protein_shell(self, protein, distance=8.):
+        """
+        copy of the protein keeping only residues within `distance` of the enclosing sphere of the box
+        :param `ccdc.protein.Protein` protein: protein
+        :param float distance: distance beyond the box (Angstroms)
+        :return: `ccdc.protein.Protein`
+        """
+        shell = protein.copy()
+        bs = Protein.BindingSiteFromPoint(protein=shell, origin=self.centre, distance=self.radius + distance)
+        keep = set(r.identifier for r in bs.residues)
+        for r in shell.residues:
+            if r.identifier not in keep:
+                shell.remove_residue(r.identifier)
+        return shell
+
+
+class _StageGraph(object):
+    """
+    private class
+
+    runs the stages of a calculation as a dependency graph. A stage starts, on a worker thread, as soon as the
+    stages it depends on have finished, and is called with their results. Stages can also be completed from outside
+    the graph with `complete` (e.g. by a stage that streams several results).
+
+    :param int max_workers: number of stages run at the same time
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.results = {}
+        self._stages = {}
+        self._locks = {}
+        self._events = queue.Queue()
+
+    def add(self, name, func, deps=(), lock=None):
+        """
+        adds a stage
+
+        :param str name: stage name
+        :param func: callable, called with the results of `deps` in order
+        :param tup deps: names of the stages this stage depends on
+        :param str lock: stages sharing a lock name never run at the same time
+        :return:
+        """
+        self._stages[name] = (func, tuple(deps), lock)
+        if lock is not None and lock not in self._locks:
+            self._locks[lock] = threading.Lock()
+
+    def expect(self, name):
+        """
+        declares a stage that is completed from outside the graph with `complete`
+
+        :param str name: stage name
+        :return:
+        """
+        self._stages[name] = (None, (), None)
+
+    def complete(self, name, result=None):
+        """
+        marks a stage as finished, can be called from any thread
+
+        :param str name: stage name
+        :param result: result passed to the dependent stages
+        :return:
+        """
+        self._events.put((name, result, None))
+
+    def _call(self, name, func, args, lock):
+        try:
+            if lock is not None:
+                with self._locks[lock]:
+                    result = func(*args)
+            else:
+                result = func(*args)
+        except BaseException as e:
+            self._events.put((name, None, e))
+        else:
+            self._events.put((name, result, None))
+
+    def run(self):
+        """
+        runs the graph to completion. The first exception raised by a stage is re-raised here, once the stages
+        already running have finished; stages not yet started are dropped.
+
+        :return: dict, stage name: result
+        """
+        for name, (func, deps, lock) in self._stages.items():
+            missing = [d for d in deps if d not in self._stages]
+            if missing:
+                raise ValueError("Stage {} depends on unknown stages: {}".format(name, ", ".join(missing)))
+
+        started = set(name for name, stage in self._stages.items() if stage[0] is None)
+        submitted = []
+        executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while len(self.results) < len(self._stages):
+                for name, (func, deps, lock) in self._stages.items():
+                    if name not in started and all(d in self.results for d in deps):
+                        started.add(name)
+                        submitted.append(executor.submit(self._call, name, func, [self.results[d] for d in deps],
+                                                         lock))
+
+                name, result, error = self._events.get()
+                if error is not None:
+                    raise error
+                self.results[name] = result
+        except BaseException:
+            # no stage outlives the run: queued stages are cancelled and running ones waited for
+            for f in submitted:
+                f.cancel()
+            executor.shutdown(wait=True)
+            while not self._events.empty():
+                name, result, error = self._events.get()
+                if error is not None:
+                    print("WARNING! stage {} also failed: {!r}".format(name, error))
+            raise
+        executor.shutdown(wait=True)
+        return self.results
+
+
 class Runner(object):
     """
     A class for running the Fragment Hotspot Map calculation
+
+    :param `hotspots.calculation.Runner.Settings` settings: sampling settings
+    :param `hotspots.atomic_hotspot_calculation._SuperStarPool` pool: SuperStar workers, shared by the Runner instances
+                                                                       it is passed to. By default the process-wide
+                                                                       pool with `nprocesses` workers is used.
     """
 
     class Settings(object):
@@ -429,16 +682,44 @@ class Runner(object):
         :param bool polar_contributions: allow carbon atoms of probes with polar atoms to contribute to the apolar output map.
         :param bool return_probes: Generate a sorted list of molecule objects, corresponding to probe poses
         :param bool sphere_maps: When setting the probe score on the output maps, set it for a sphere (radius 1.5) instead of a single point.
+        :param bool coarse_to_fine: First sample coarse (1.0 Angstrom) grids with few rotations, then only refine
+                                    translation points near coarse points that could reach the refine thresholds.
+        :param int coarse_nrotations: number of rotations used in the coarse pass
+        :param tup refine_thresholds: the map thresholds of interest, the refined map is intended to match a full
+                                      calculation at or above these scores
+        :param float coarse_margin: a coarse point is refined if its best score >= coarse_margin * min(refine_thresholds)
+        :param float refine_radius: translation points within this distance of a refined coarse point are sampled in the fine pass
+        :param bool adaptive_rotations: sample each translation point with a small global rotation set, then refine
+                                        around the best orientations of points that could reach the refine thresholds
+        :param int initial_rotations: size of the global rotation set used by the adaptive sampler
+        :param int refine_rotations: rotations added per refinement round of the adaptive sampler
+        :param float adaptive_margin: a point is refined if its best score >= adaptive_margin * min(refine_thresholds)
+        :param float convergence_tolerance: refinement of a point stops when a round improves its best score by less
+        :param float refine_sigma: initial size of the quaternion perturbation, halved each round
         """
 
         def __init__(self, nrotations=3000, apolar_translation_threshold=15, polar_translation_threshold=15,
-                     polar_contributions=False, return_probes=False, sphere_maps=False):
+                     polar_contributions=False, return_probes=False, sphere_maps=False, coarse_to_fine=False,
+                     coarse_nrotations=300, refine_thresholds=(14, 17), coarse_margin=0.75, refine_radius=1.0,
+                     adaptive_rotations=False, initial_rotations=150, refine_rotations=50, adaptive_margin=0.75,
+                     convergence_tolerance=0.25, refine_sigma=0.2):
             self.nrotations = nrotations
             self.apolar_translation_threshold = apolar_translation_threshold
             self.polar_translation_threshold = polar_translation_threshold
             self.polar_contributions = polar_contributions
             self.return_probes = return_probes
             self.sphere_maps = sphere_maps
+            self.coarse_to_fine = coarse_to_fine
+            self.coarse_nrotations = coarse_nrotations
+            self.refine_thresholds = refine_thresholds
+            self.coarse_margin = coarse_margin
+            self.refine_radius = refine_radius
+            self.adaptive_rotations = adaptive_rotations
+            self.initial_rotations = initial_rotations
+            self.refine_rotations = refine_rotations
+            self.adaptive_margin = adaptive_margin
+            self.convergence_tolerance = convergence_tolerance
+            self.refine_sigma = refine_sigma
 
         @property
         def _num_gp(self):
@@ -470,6 +751,13 @@ class Runner(object):
                 settings = self.Settings()
 
             self.settings = settings
+            self.regions = kw.get('regions')
+            self.seeds = kw.get('seeds')
+            self.metrics = kw.get('metrics')
+            self.n_candidate_points = 0
+            self.translation_points = np.zeros((0, 3))
+            self.translation_scores = np.zeros(0)
+            self.point_statistics = None
             self.probe_grids = [_SampleGrid(g.name, g.grid.copy_and_clear(), g.atom_predicate) for g in self.grids]
 
         def get_priority_atom(self, molecule):
@@ -518,34 +806,49 @@ class Runner(object):
             :param priority_atom_type: str, atomic interaction type
             :return: list, list of :class: `ccdc.molecule.Molecule` instances
             """
-            translate_probe = []
             wg = self.grid_dic[priority_atom_type]
 
             if priority_atom_type == 'apolar':
                 translation_threshold = self.settings.apolar_translation_threshold
             else:
                 translation_threshold = self.settings.polar_translation_threshold
-            hs = wg.grid.islands(translation_threshold)
-            for g in hs:
-                nx, ny, nz = g.nsteps
 
-                maxima = [g.indices_to_point(i, j, k)
-                          for i in range(nx) for j in range(ny) for k in range(nz)
-                          if g.value(i, j, k) >= translation_threshold]
+            points = [np.zeros((0, 3))]
+            for g in wg.grid.islands(translation_threshold):
+                indices = np.argwhere(Grid.get_array(g) >= translation_threshold)
+                points.append(np.array(tuple(g.bounding_box[0])) + indices * g.spacing)
+            points = np.concatenate(points)
+
+            if self.regions:
+                mask = np.zeros(len(points), dtype=bool)
+                for lo, hi in self.regions:
+                    mask |= np.all((points >= lo) & (points <= hi), axis=1)
+                points = points[mask]
+
+            # coarse-to-fine: only keep points close to promising points from the coarse pass
+            self.n_candidate_points = len(points)
+            if self.seeds is not None:
+                if len(self.seeds) == 0 or len(points) == 0:
+                    points = points[:0]
+                else:
+                    d, _ = cKDTree(self.seeds).query(points, distance_upper_bound=self.settings.refine_radius)
+                    points = points[np.isfinite(d)]
 
-                translate_probe = translate_probe + maxima
-            return translate_probe
+            return [tuple(p) for p in points]
 
-        def generate_rand_quaternions(self):
+        def generate_rand_quaternions(self, nrotations=None):
             """
             Returns a list of random quaternions. Length matches settings.nrotations
 
+            :param int nrotations: number of quaternions, overrides settings.nrotations
             :return: tup, (a,b,c,d)
             """
+            if nrotations is None:
+                nrotations = self.settings.nrotations
             quaternions = []
             i = 1
-            if self.settings.nrotations > 1:
-                while i <= self.settings.nrotations:
+            if nrotations > 1:
+                while i <= nrotations:
                     r1 = random.uniform(-1, 1)
                     r2 = random.uniform(-1, 1)
                     s1 = r1 * r1 + r2 * r2
@@ -606,9 +909,9 @@ class Runner(object):
             :param score: float, score of a given probe
             :param active_coordinates_dic:
             :param trans: list of translations
-            :return:
+            :return: int, number of grid points raised
             """
-
+            updated = 0
             for pg in self.probe_grids:
                 actives = active_coordinates_dic[pg.name]
                 if len(actives) == 0:
@@ -618,12 +921,15 @@ class Runner(object):
                     i, j, k = pg.grid.point_to_indices(coords)
                     orig_value = pg.grid.value(i, j, k)
                     #
+                    if score > orig_value:
+                        updated += 1
                     if self.settings.sphere_maps:
                         #pg.grid.set_sphere(coords, 2, score, mode='max')
                         if score > orig_value:
                             pg.grid.set_sphere(coords, 1.5, score, mode='max', scaling='None')
                     else:
                         pg.grid.set_value(i, j, k, max(score, orig_value))
+            return updated
 
         def get_active_coordinates(self):
             """
@@ -638,6 +944,169 @@ class Runner(object):
 
             return active_coords_dic
 
+        @staticmethod
+        def rotation_matrices(quaternions):
+            """
+            Converts quaternions to rotation matrices
+
+            :param quaternions: array-like, (n, 4) quaternions (a, b, c, d), normalised here
+            :return: `numpy.array`, (n, 3, 3)
+            """
+            q = np.asarray(quaternions, dtype=float).reshape(-1, 4)
+            q = q / np.linalg.norm(q, axis=1)[:, None]
+            a, b, c, d = q.T
+            return np.stack([np.stack([1 - 2 * (c * c + d * d), 2 * (b * c - a * d), 2 * (b * d + a * c)], axis=-1),
+                             np.stack([2 * (b * c + a * d), 1 - 2 * (b * b + d * d), 2 * (c * d - a * b)], axis=-1),
+                             np.stack([2 * (b * d - a * c), 2 * (c * d + a * b), 1 - 2 * (b * b + c * c)], axis=-1)],
+                            axis=1)
+
+        @staticmethod
+        def perturb_quaternions(quaternions, sigma, n):
+            """
+            Random quaternions close to the supplied ones
+
+            :param list quaternions: quaternions to perturb
+            :param float sigma: size of the perturbation
+            :param int n: number of quaternions returned
+            :return: `numpy.array`, (n, 4)
+            """
+            q = np.asarray(quaternions, dtype=float).reshape(-1, 4)
+            q = q[np.random.randint(len(q), size=n)] + np.random.normal(scale=sigma, size=(n, 4))
+            return q / np.linalg.norm(q, axis=1)[:, None]
+
+        def _score_poses(self, poses, point, probe):
+            """
+            Scores a set of orientations at one translation point and updates the output grids
+
+            :param list poses: list of {grid name: (n, 3) coordinates relative to the priority atom}
+            :param tup point: translation point
+            :param probe: str, interaction type
+            :return: `numpy.array`, pose scores
+            """
+            scores = np.zeros(len(poses))
+            n_scored = 0
+            n_updated = 0
+            for n, pose in enumerate(poses):
+                score = self.sample_pose(point, pose, probe)
+                scores[n] = score
+                if score >= 1:
+                    n_scored += 1
+                    n_updated += self.update_out_grids(score, pose, point)
+
+            if self.metrics is not None:
+                self.metrics.count("poses_evaluated", len(poses))
+                self.metrics.count("poses_above_threshold", n_scored)
+                self.metrics.count("voxels_updated", n_updated)
+            return scores
+
+        def sample_adaptive(self, molecule, probe):
+            """
+            Sample the grids, adapting the number of rotations to each translation point. Every point is scored with
+            a global set of settings.initial_rotations; points that could reach the refine thresholds are refined with
+            perturbations of their best orientations until the best score converges or settings.nrotations is reached.
+
+            self.point_statistics holds (rotations, best score, converged) for each translation point.
+
+            :param molecule:
+            :param probe: str, interaction type, (donor, acceptor, negative, positive, apolar)
+            :return: if settings.return_probes, the best pose of each point scoring above 14, best first
+            """
+            priority_atom, priority_atom_type = self.get_priority_atom(molecule)
+            translate_points = self.get_translation_points(priority_atom_type)
+            molecule.remove_hydrogens()
+
+            for g in self.grids:
+                g.set_molecule(molecule, True)
+
+            for g in self.probe_grids:
+                g.set_molecule(molecule, self.settings.polar_contributions)
+
+            centre = np.array(tuple(priority_atom.coordinates))
+            reference = {g.name: np.array([tuple(a.coordinates) for a in g._active_atoms]).reshape(-1, 3) - centre
+                         for g in self.grids}
+
+            def poses(quaternions):
+                return [{name: coords.dot(r.T) for name, coords in reference.items()}
+                        for r in self.rotation_matrices(quaternions)]
+
+            global_quaternions = np.array(self.generate_rand_quaternions(self.settings.initial_rotations))
+            global_poses = poses(global_quaternions)
+            cutoff = self.settings.adaptive_margin * min(self.settings.refine_thresholds)
+            nkeep = 3
+
+            self.translation_points = np.array(translate_points).reshape(-1, 3)
+            self.translation_scores = np.zeros(len(translate_points))
+            stats = np.zeros((len(translate_points), 3))
+            high_scoring_probes = []
+            print("\n    nRotations (initial):", len(global_quaternions), "nTranslations:", len(translate_points),
+                  "probename:", probe)
+
+            for n, point in enumerate(tqdm(translate_points)):
+                scores = self._score_poses(global_poses, point, probe)
+                nrotations = len(scores)
+                best = scores.max() if nrotations else 0
+                best_quaternion = global_quaternions[np.argmax(scores)] if nrotations else None
+                converged = True
+
+                if best >= cutoff:
+                    order = np.argsort(scores)[::-1][:nkeep]
+                    seeds, seed_scores = global_quaternions[order], scores[order]
+                    sigma = self.settings.refine_sigma
+                    converged = False
+                    while nrotations < self.settings.nrotations:
+                        local = self.perturb_quaternions(seeds, sigma, self.settings.refine_rotations)
+                        local_scores = self._score_poses(poses(local), point, probe)
+                        nrotations += len(local)
+
+                        candidates = np.concatenate([seeds, local])
+                        candidate_scores = np.concatenate([seed_scores, local_scores])
+                        order = np.argsort(candidate_scores)[::-1][:nkeep]
+                        seeds, seed_scores = candidates[order], candidate_scores[order]
+
+                        improvement = seed_scores[0] - best
+                        best = seed_scores[0]
+                        best_quaternion = seeds[0]
+                        sigma *= 0.5
+                        if improvement < self.settings.convergence_tolerance:
+                            converged = True
+                            break
+
+                self.translation_scores[n] = best
+                stats[n] = nrotations, best, converged
+                if self.settings.return_probes is True and best > 14:
+                    high_scoring_probes.append((best, self._posed_probe(molecule, centre, best_quaternion, point,
+                                                                        best)))
+
+            self.point_statistics = stats
+            if len(stats):
+                print("    mean rotations per point: {:.0f}, converged: {:.1%}".format(stats[:, 0].mean(),
+                                                                                      stats[:, 2].mean()))
+
+            if self.settings.return_probes is True:
+                high_scoring_probes.sort(key=lambda x: x[0], reverse=True)
+                sampled_probes = [m for score, m in high_scoring_probes[:10000]]
+                print('Returned probes = ', len(sampled_probes))
+                return sampled_probes
+
+        def _posed_probe(self, molecule, centre, quaternion, point, score):
+            """
+            A copy of the probe in one pose: rotated about its priority atom and translated onto a point
+
+            :param molecule: a :class: `ccdc.molecule.Molecule` instance
+            :param `numpy.array` centre: priority atom coordinates
+            :param quaternion: (a, b, c, d)
+            :param tup point: translation point
+            :param float score: pose score, used as the identifier
+            :return: a :class: `ccdc.molecule.Molecule` instance
+            """
+            m = molecule.copy()
+            r = self.rotation_matrices([quaternion])[0]
+            coordinates = (np.array([tuple(a.coordinates) for a in m.atoms]) - centre).dot(r.T) + np.asarray(point)
+            for a, c in zip(m.atoms, coordinates):
+                a.coordinates = Coordinates(*c)
+            m.identifier = "{}".format(score)
+            return m
+
         def sample(self, molecule, probe):
             """
             Sample the grids according to the settings
@@ -652,6 +1121,8 @@ class Runner(object):
             quaternions = self.generate_rand_quaternions()
             high_scoring_probes = {}
             print("\n    nRotations:", len(quaternions), "nTranslations:", len(translate_points), "probename:", probe)
+            self.translation_points = np.array(translate_points).reshape(-1, 3)
+            self.translation_scores = np.zeros(len(translate_points))
 
             for g in self.grids:
                 g.set_molecule(molecule, True)
@@ -659,20 +1130,25 @@ class Runner(object):
             for g in self.probe_grids:
                 g.set_molecule(molecule, self.settings.polar_contributions)
 
+            n_scored = 0
+            n_updated = 0
             for q in tqdm(quaternions):
                 molecule.apply_quaternion(q)
                 priority_atom_coordinates = priority_atom.coordinates
                 active_coordinates_dic = self.get_active_coordinates()
 
-                for priority_atom_point in translate_points:
+                for n, priority_atom_point in enumerate(translate_points):
 
                     translation = [priority_atom_point[i] - priority_atom_coordinates[i]
                                    for i in range(0, len(priority_atom_coordinates))]
 
                     score = self.sample_pose(translation, active_coordinates_dic, probe)
+                    if score > self.translation_scores[n]:
+                        self.translation_scores[n] = score
                     if score < 1:
                         continue
-                    self.update_out_grids(score, active_coordinates_dic, translation)
+                    n_scored += 1
+                    n_updated += self.update_out_grids(score, active_coordinates_dic, translation)
 
                     if self.settings.return_probes is True:
                         if score < 5:
@@ -687,9 +1163,14 @@ class Runner(object):
                             except KeyError:
                                 high_scoring_probes[score] = [m]
 
+            if self.metrics is not None:
+                self.metrics.count("poses_evaluated", len(quaternions) * len(translate_points))
+                self.metrics.count("poses_above_threshold", n_scored)
+                self.metrics.count("voxels_updated", n_updated)
+
             if self.settings.return_probes is True:
                 sampled_probes = []
-                for key in sorted(high_scoring_probes.iterkeys(), reverse=True):
+                for key in sorted(high_scoring_probes.keys(), reverse=True):
                     sampled_probes.extend(high_scoring_probes[key])
                 print('Returned probes = ', len(sampled_probes))
                 if len(sampled_probes) > 10000:
@@ -697,11 +1178,18 @@ class Runner(object):
                 else:
                     return sampled_probes
 
-    def __init__(self, settings=None):
+    def __init__(self, settings=None, pool=None):
         self.out_grids = {}
         self.super_grids = {}
         self.buriedness = None
         self.sampled_probes = {}
+        self.cavity_boxes = None
+        self.region = None
+        self.coverage = {}
+        self.rotation_statistics = {}
+        self.metrics = RunMetrics()
+        self.pool = pool
+        self.stage_graph = None
 
         if settings is None:
             self.sampler_settings = self.Settings()
@@ -896,13 +1384,102 @@ class Runner(object):
         weight superstar output by burriedness
         :return: a list of :class:`WeightedResult` instances
         """
-        results = []
-        for s in self.superstar_grids:
-            g, b = Grid.common_grid([s.grid, self.buriedness], padding=1)
-            weighted_grid = g * b
-            results.append(_WeightedResult(s.identifier, weighted_grid))
+        return [self._weight(s) for s in self.superstar_grids]
 
-        return results
+    def _weight(self, s):
+        """
+        private method
+
+        weight one superstar output by burriedness
+        :param `hotspots.atomic_hotspot_calculation._AtomicHotspotResult` s: superstar output
+        :return: a :class:`WeightedResult` instance
+        """
+        buriedness = self.buriedness
+        grid = s.grid
+        if self.region is not None:
+            buriedness = self.region.crop(buriedness)
+            grid = self.region.crop(grid)
+        g, b = Grid.common_grid([grid, buriedness], padding=1)
+        self.metrics.count("grid_allocations", 3)
+        return _WeightedResult(s.identifier, g * b)
+
+    @staticmethod
+    def _coarse_grid(grid, factor=2):
+        """
+        private method
+
+        max-pools a grid onto a grid with `factor` times the spacing. Max-pooling keeps the coarse scores optimistic,
+        so promising regions are not lost.
+        :param `hotspots.grid_extension.Grid` grid: input grid
+        :param int factor: pooling factor
+        :return: `hotspots.grid_extension.Grid`
+        """
+        array = Grid.get_array(grid)
+        array = np.pad(array, [(0, (-n) % factor) for n in array.shape], mode='constant')
+        nx, ny, nz = [n // factor for n in array.shape]
+        pooled = array.reshape(nx, factor, ny, factor, nz, factor).max(axis=(1, 3, 5))
+
+        spacing = grid.spacing * factor
+        origin = tuple(grid.bounding_box[0])
+        far_corner = [o + (n - 1) * spacing for o, n in zip(origin, (nx, ny, nz))]
+        blank = Grid(origin=origin, far_corner=far_corner, spacing=spacing, default=0, _grid=None)
+        return Grid.array_to_grid(pooled, blank)
+
+    def _sample_grids(self, grid_dict):
+        """
+        private method
+
+        :param dict grid_dict: dictionary with key = probe identifier and value = `hotspots.grid_extension.Grid`
+        :return: list of `hotspots.calculation._SampleGrid`
+        """
+        sample_grids = [_SampleGrid('apolar', grid_dict['apolar'], _SampleGrid.is_apolar),
+                        _SampleGrid('donor', grid_dict['donor'], _SampleGrid.is_donor),
+                        _SampleGrid('acceptor', grid_dict['acceptor'], _SampleGrid.is_acceptor)]
+
+        if self.charged_probes:
+            sample_grids += [_SampleGrid('negative', grid_dict['negative'], _SampleGrid.is_negative),
+                             _SampleGrid('positive', grid_dict['positive'], _SampleGrid.is_positive)]
+        return sample_grids
+
+    def _probe_molecule(self, probe):
+        """
+        private method
+
+        :param str probe: probe identifier
+        :return: `ccdc.molecule.Molecule`
+        """
+        import pkg_resources
+        probe_path = pkg_resources.resource_filename('hotspots', 'probes/')
+
+        if self.charged_probes and (probe == "negative" or probe == "positive"):
+            return MoleculeReader(join(probe_path, "rotate-{}_{}_flat.mol2".format(probe, "test")))[0]
+        else:
+            return MoleculeReader(join(probe_path, "rotate-{}_{}_flat.mol2".format(probe, self.probe_size)))[0]
+
+    def _coarse_seeds(self, probe, grid_dict, regions):
+        """
+        private method
+
+        the coarse pass of coarse-to-fine sampling. Samples max-pooled 1.0 Angstrom grids with a reduced number of
+        rotations and returns the translation points whose best score could reach the refine thresholds.
+        :param str probe: probe identifier
+        :param dict grid_dict: dictionary with key = probe identifier and value = `hotspots.grid_extension.Grid`
+        :param list regions: boxes translation points are restricted to
+        :return: `numpy.array`, (n, 3) coordinates
+        """
+        coarse_dict = {p: self._coarse_grid(g) for p, g in grid_dict.items()}
+        self.metrics.count("grid_allocations", len(coarse_dict))
+        settings = copy.copy(self.sampler_settings)
+        settings.nrotations = self.sampler_settings.coarse_nrotations
+        settings.return_probes = False
+        settings.sphere_maps = False
+
+        sampler = self._Sampler(*self._sample_grids(coarse_dict), settings=settings, regions=regions,
+                                metrics=self.metrics)
+        sampler.sample(self._probe_molecule(probe), probe=probe)
+
+        cutoff = self.sampler_settings.coarse_margin * min(self.sampler_settings.refine_thresholds)
+        return sampler.translation_points[sampler.translation_scores >= cutoff]
 
     def _get_out_maps(self, probe, grid_dict, return_probes=False):
         """
@@ -914,31 +1491,31 @@ class Runner(object):
         :param bool return_probes: optional, bool indicating if probe molecules should be returned
         :return:
         """
-        donor_grid = _SampleGrid('donor', grid_dict['donor'], _SampleGrid.is_donor)
-        acceptor_grid = _SampleGrid('acceptor', grid_dict['acceptor'], _SampleGrid.is_acceptor)
-        apolar_grid = _SampleGrid('apolar', grid_dict['apolar'], _SampleGrid.is_apolar)
-
-        if self.charged_probes:
-            negative_grid = _SampleGrid('negative', grid_dict['negative'], _SampleGrid.is_negative)
-            positive_grid = _SampleGrid('positive', grid_dict['positive'], _SampleGrid.is_positive)
-
-        kw = {'settings': self.sampler_settings}
-        if self.charged_probes:
-            self.sampler = self._Sampler(apolar_grid, donor_grid, acceptor_grid, negative_grid, positive_grid, **kw)
+        # in cavity mode, the probes are only translated within the SuperStar boxes of the cavities
+        if self.region is not None:
+            regions = [(self.region.origin, self.region.far_corner)]
         else:
-            self.sampler = self._Sampler(apolar_grid, donor_grid, acceptor_grid, **kw)
+            regions = self.cavity_boxes
+        kw = {'settings': self.sampler_settings, 'regions': regions, 'metrics': self.metrics}
 
-        probe_path = pkg_resources.resource_filename('hotspots', 'probes/')
+        if self.sampler_settings.coarse_to_fine:
+            kw['seeds'] = self._coarse_seeds(probe, grid_dict, regions)
 
-        if self.charged_probes:
-            if probe == "negative" or probe == "positive":
-                mol = MoleculeReader(join(probe_path, "rotate-{}_{}_flat.mol2".format(probe, "test")))[0]
-            else:
-                mol = MoleculeReader(join(probe_path, "rotate-{}_{}_flat.mol2".format(probe, self.probe_size)))[0]
+        self.sampler = self._Sampler(*self._sample_grids(grid_dict), **kw)
+        self.metrics.count("grid_allocations", len(self.sampler.probe_grids))
+
+        if self.sampler_settings.adaptive_rotations:
+            probes = self.sampler.sample_adaptive(self._probe_molecule(probe), probe=probe)
+            self.rotation_statistics[probe] = self.sampler.point_statistics
         else:
-            mol = MoleculeReader(join(probe_path, "rotate-{}_{}_flat.mol2".format(probe, self.probe_size)))[0]
+            probes = self.sampler.sample(self._probe_molecule(probe), probe=probe)
 
-        probes = self.sampler.sample(mol, probe=probe)
+        if self.sampler_settings.coarse_to_fine:
+            n_total = self.sampler.n_candidate_points
+            n_refined = len(self.sampler.translation_points)
+            self.coverage[probe] = float(n_refined) / n_total if n_total else 0.
+            print("    coarse-to-fine: refined {} of {} translation points ({:.1%})".format(n_refined, n_total,
+                                                                                         self.coverage[probe]))
 
         for pg in self.sampler.probe_grids:
             if pg.name.lower() == probe:
@@ -950,6 +1527,132 @@ class Runner(object):
         if return_probes is True:
             return probes
 
+    def _stage_graph(self, atomic_hotspot, probe_types, return_probes=False):
+        """
+        private method
+
+        the calculation as a dependency graph:
+
+            superstar:<probe>   streamed from the SuperStar pool as each probe finishes
+            ghecom              the Ghecom executable, started straight away as it only needs the protein
+            frame               frame of the first SuperStar grid, on which buriedness is reported
+            buriedness          Ghecom output read onto the frame (LIGSITE: needs every SuperStar grid)
+            weighting:<probe>   SuperStar grid * buriedness
+            sampling:<probe>    needs every weighted grid, sampling stages run one at a time
+
+        :param `hotspots.atomic_hotspot_calculation._AtomicHotspot` atomic_hotspot: configured atomic hotspot calculation
+        :param list probe_types: probe identifiers
+        :param bool return_probes: optional, bool indicating if probe molecules should be returned
+        :return: `hotspots.calculation._StageGraph`
+        """
+        graph = _StageGraph(max_workers=len(probe_types) + 2)
+        method = self.buriedness_method.lower()
+        superstar = ["superstar:{}".format(p) for p in probe_types]
+        weighting = ["weighting:{}".format(p) for p in probe_types]
+
+        def run_superstar():
+            start = time.time()
+            done = []
+            for s in atomic_hotspot.calculate_iter(protein=self.protein,
+                                                   nthreads=self.nprocesses,
+                                                   cavity_origins=self.cavities,
+                                                   metrics=self.metrics,
+                                                   pool=self.pool):
+                if not done:
+                    graph.complete("frame", s.buriedness.copy_and_clear())
+                graph.complete("superstar:{}".format(s.identifier), s)
+                done.append(s.identifier)
+            missing = set(probe_types) - set(done)
+            if missing:
+                raise RuntimeError("SuperStar returned no result for: {}".format(", ".join(sorted(missing))))
+            self.metrics.record("superstar", time.time() - start)
+            self.cavity_boxes = atomic_hotspot.cavity_boxes
+            if self.clear_tmp == True:
+                shutil.rmtree(atomic_hotspot.settings.temp_dir)
+            print("Atomic hotspot detection complete\n")
+
+        graph.add("superstar", run_superstar)
+        graph.expect("frame")
+        for name in superstar:
+            graph.expect(name)
+
+        if self.buriedness is not None:
+            graph.add("buriedness", lambda: self.buriedness)
+
+        elif method == 'ghecom':
+            protein = self.protein
+            if self.region is not None:
+                protein = self.region.protein_shell(self.protein)
+            b = Buriedness(protein=protein, out_grid=None)
+
+            def run_ghecom():
+                start = time.time()
+                b.run()
+                self.metrics.record("ghecom", time.time() - start)
+
+            def read_ghecom(ghecom, frame):
+                with self.metrics.timer("buriedness"):
+                    print("    buriedness method: Ghecom")
+                    if self.region is not None:
+                        frame = self.region.crop(frame)
+                    b.settings.out_grid = frame
+                    self.buriedness = _BuriednessResult(b.settings).grid
+                    shutil.rmtree(b.settings.working_directory)
+                return self.buriedness
+
+            graph.add("ghecom", run_ghecom)
+            graph.add("buriedness", read_ghecom, deps=("ghecom", "frame"))
+
+        elif method == 'ghecom_internal':
+            def internal_ghecom(frame):
+                with self.metrics.timer("buriedness"):
+                    print("    buriedness method: Internal version Ghecom")
+                    if self.region is not None:
+                        frame = self.region.crop(frame)
+                    self.buriedness = ExpBuriedness(prot=self.protein, out_grid=frame).buriedness_grid()
+                return self.buriedness
+
+            graph.add("buriedness", internal_ghecom, deps=("frame",))
+
+        elif method == 'ligsite':
+            def ligsite(*superstar_grids):
+                # LIGSITE combines the pocket grids of every probe
+                with self.metrics.timer("buriedness"):
+                    print("    buriedness method: LIGSITE")
+                    self.buriedness = Grid.get_single_grid(grd_dict={s.identifier: s.buriedness
+                                                                     for s in superstar_grids},
+                                                           mask=False)
+                return self.buriedness
+
+            graph.add("buriedness", ligsite, deps=superstar)
+
+        else:
+            raise ValueError("Buriedness method must be 'ghecom', 'ghecom_internal' or 'ligsite'")
+
+        def weight(name):
+            def _weight(s, buriedness):
+                # one timer per probe, the weighting stages run concurrently
+                with self.metrics.timer(name):
+                    return self._weight(s)
+            return _weight
+
+        for probe, name in zip(probe_types, weighting):
+            graph.add(name, weight(name), deps=("superstar:{}".format(probe), "buriedness"))
+
+        def sample(probe):
+            def _sample(*weighted):
+                grid_dict = {w.identifier: w.grid for w in weighted}
+                with self.metrics.timer("sampling:{}".format(probe)):
+                    print("Start sampling: {}".format(probe))
+                    return self._get_out_maps(probe, grid_dict, return_probes=return_probes)
+            return _sample
+
+        for probe in probe_types:
+            # sampling writes to the shared output grids, so these stages take the same lock
+            graph.add("sampling:{}".format(probe), sample(probe), deps=weighting, lock="sampling")
+
+        return graph
+
     def _calc_hotspots(self, return_probes=False):
         """
         handles the organisation of the hotspot calculation
@@ -964,53 +1667,48 @@ class Runner(object):
         if self.charged_probes:
             a.settings.atomic_probes = {"negative": "CARBOXYLATE OXYGEN", "positive": "CHARGED NH NITROGEN"}
 
-        probe_types = a.settings.atomic_probes.keys()
-        self.superstar_grids = a.calculate(protein=self.protein,
-                                           nthreads=self.nprocesses,
-                                           cavity_origins=self.cavities)
-
-        if self.clear_tmp == True:
-            shutil.rmtree(a.settings.temp_dir)
+        if self.region is not None:
+            a.settings.cavity_radius = max(a.settings.cavity_radius, int(np.ceil(self.region.radius)))
 
-        print("Atomic hotspot detection complete\n")
+        probe_types = list(a.settings.atomic_probes.keys())
+        self.superstar_grids = []
+        self.weighted_grids = []
+        self.stage_graph = self._stage_graph(a, probe_types, return_probes)
+        results = self.stage_graph.run()
 
-        print("Start buriedness calculation")
-        if self.buriedness_method.lower() == 'ghecom' and self.buriedness is None:
-            print("    method: Ghecom")
-            out_grid = self.superstar_grids[0].buriedness.copy_and_clear()
-            b = Buriedness(protein=self.protein,
-                           out_grid=out_grid)
-            self.buriedness = b.calculate().grid
-            shutil.rmtree(b.settings.working_directory)
-
-        elif self.buriedness_method.lower() == 'ghecom_internal' and self.buriedness is None:
-            print("    method: Internal version Ghecom")
-            out_grid = self.superstar_grids[0].buriedness.copy_and_clear()
-            b = ExpBuriedness(prot=self.protein, out_grid=out_grid)
-            self.buriedness = b.buriedness_grid()
-
-        elif self.buriedness_method.lower() == 'ligsite' and self.buriedness is None:
-            print("    method: LIGSITE")
-            self.buriedness = Grid.get_single_grid(grd_dict={s.identifier: s.buriedness for s in self.superstar_grids},
-                                                   mask=False)
-
-        self.weighted_grids = self._get_weighted_maps()
+        self.superstar_grids = [results["superstar:{}".format(p)] for p in probe_types]
+        self.weighted_grids = [results["weighting:{}".format(p)] for p in probe_types]
+        if return_probes is True:
+            self.sampled_probes.update({p: results["sampling:{}".format(p)] for p in probe_types})
 
-        print("Buriedness calcualtion complete\n")
+        print("Sampling complete\n")
 
-        print("Start sampling")
-        grid_dict = {w.identifier: w.grid for w in self.weighted_grids}
+    def _new_run(self):
+        """
+        private method
 
-        for probe in probe_types:
-            if return_probes is True:
-                ps = self._get_out_maps(probe, grid_dict, return_probes=True)
-                print(len(ps))
-                self.sampled_probes.update({probe: ps})
+        starts the metrics of a new calculation, hooks are carried over
+        :return:
+        """
+        self.metrics = RunMetrics(hooks=self.metrics.hooks)
+        self._start = time.time()
 
-            else:
-                self._get_out_maps(probe, grid_dict)
+    def _get_results(self):
+        """
+        private method
 
-        print("Sampling complete\n")
+        constructs the result of the calculation and attaches the run metrics
+        :return: a :class:`hotspots.result.Results` instance
+        """
+        with self.metrics.timer("result_construction"):
+            hr = Results(super_grids=self.super_grids,
+                         protein=self.protein,
+                         buriedness=self.buriedness)
+        self.metrics.record("total", time.time() - self._start)
+        print("Runtime = {}seconds".format(self.metrics.timings["total"]))
+        hr.metrics = self.metrics
+        hr.settings = self.sampler_settings
+        return hr
 
     def _prepare_protein(self, protoss=False):
         """
@@ -1026,7 +1724,7 @@ class Runner(object):
             self.protein.add_hydrogens()
 
     def from_superstar(self, protein, superstar_grids, buriedness, charged_probes=False, probe_size=7,
-                        settings=None, clear_tmp=False):
+                        settings=None, clear_tmp=False, region=None):
         """
         calculate hotspot maps from precalculated superstar maps. This enables more effective parallelisation and reuse
         of object such as the Buriedness grids
@@ -1038,10 +1736,12 @@ class Runner(object):
         :param int probe_size: Size of probe in number of heavy atoms (3-8 atoms)
         :param settings: `hotspots.calculation.Runner.Settings` settings: holds the sampler settings
         :param bool clear_tmp: If True, clear the temporary directory
+        :param `hotspots.calculation.RegionOfInterest` region: if supplied, the weighting and sampling are confined to this region
         :return:
         """
-        start = time.time()
+        self._new_run()
         self.super_grids = {}
+        self.region = region
         self.superstar_grids = superstar_grids
         self.probe_types = [p.identifier for p in self.superstar_grids]
         self.buriedness = buriedness
@@ -1056,25 +1756,24 @@ class Runner(object):
         else:
             self.sampler_settings = settings
 
-        self.weighted_grids = self._get_weighted_maps()
+        with self.metrics.timer("weighting"):
+            self.weighted_grids = self._get_weighted_maps()
 
         print("Start sampling")
         grid_dict = {w.identifier: w.grid for w in self.weighted_grids}
 
         for probe in self.probe_types:
-            self._get_out_maps(probe, grid_dict)
+            with self.metrics.timer("sampling:{}".format(probe)):
+                self._get_out_maps(probe, grid_dict)
 
         self.super_grids = {p: g[0] for p, g in self.out_grids.items()}
 
         print("Sampling complete\n")
-        print("Runtime = {}seconds".format(time.time() - start))
 
-        return Results(super_grids=self.super_grids,
-                       protein=self.protein,
-                       buriedness=self.buriedness)
+        return self._get_results()
 
     def from_protein(self, protein, charged_probes=False, probe_size=7, buriedness_method='ghecom',
-                     cavities=None, nprocesses=1, settings=None, buriedness_grid=None, clear_tmp=False):
+                     cavities=None, nprocesses=1, settings=None, buriedness_grid=None, clear_tmp=False, region=None):
         """
         generates a result from a protein
 
@@ -1086,6 +1785,7 @@ class Runner(object):
         :param int nprocesses: number of CPU's used
         :param `hotspots.calculation.Runner.Settings` settings: holds the sampler settings
         :param `ccdc.utilities.Grid` buriedness_grid: pre-calculated buriedness grid
+        :param `hotspots.calculation.RegionOfInterest` region: if supplied, the calculation is confined to this region
         :return: a :class:`hotspots.result.Results` instance
 
 
@@ -1101,13 +1801,16 @@ class Runner(object):
         Result()
 
         """
-        start = time.time()
+        self._new_run()
         self.super_grids = {}
         self.buriedness = buriedness_grid
         self.protein = protein
         self.charged_probes = charged_probes
         self.probe_size = probe_size
         self.buriedness_method = buriedness_method
+        self.region = region
+        if region is not None and cavities is None:
+            cavities = Coordinates(*region.centre)
         self.cavities = cavities
         self.clear_tmp = clear_tmp
 
@@ -1119,11 +1822,8 @@ class Runner(object):
             self.sampler_settings = settings
         self._calc_hotspots()  # return probes = False by default
         self.super_grids = {p: g[0] for p, g in self.out_grids.items()}
-        print("Runtime = {}seconds".format(time.time() - start))
 
-        return Results(super_grids=self.super_grids,
-                       protein=self.protein,
-                       buriedness=self.buriedness)
+        return self._get_results()
 
     def from_pdb(self, pdb_code, charged_probes=False, probe_size=7, buriedness_method='ghecom', nprocesses=3,
                  cavities=False, settings=None, clear_tmp=False):
@@ -1147,6 +1847,7 @@ class Runner(object):
 
         """
         protoss = False
+        self._new_run()
 
         tmp = tempfile.mkdtemp()
         # if  protoss is True:
@@ -1154,14 +1855,17 @@ class Runner(object):
         #     self.protein = protoss.add_hydrogens(pdb_code).protein
         #
         # else:
-        PDBResult(identifier=pdb_code).download(out_dir=tmp)
+        with self.metrics.timer("protein_download"):
+            PDBResult(identifier=pdb_code).download(out_dir=tmp)
         fname = join(tmp, "{}.pdb".format(pdb_code))
-        self.protein = Protein.from_file(fname)
-        self._prepare_protein(protoss)
+        with self.metrics.timer("protein_preparation"):
+            self.protein = Protein.from_file(fname)
+            self._prepare_protein(protoss)
         self.charged_probes = charged_probes
         self.probe_size = probe_size
         self.buriedness_method = buriedness_method
         self.clear_tmp = clear_tmp
+        self.region = None
         self.cavities = None
         if cavities is True:
             self.cavities = Cavity.from_pdb_file(fname)
@@ -1184,6 +1888,4 @@ class Runner(object):
         if clear_tmp == True:
             shutil.rmtree(tmp)
 
-        return Results(super_grids=self.super_grids,
-                       protein=self.protein,
-                       buriedness=self.buriedness)
+        return self._get_results()
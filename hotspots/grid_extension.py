@@ -24,13 +24,10 @@ import collections
 import operator
 import numpy as np
 from ccdc import utilities
+from hotspots import grid_io
 from hotspots.hs_utilities import Helper
 from scipy import ndimage
-from skimage import feature
-from skimage.morphology import ball
 from os.path import join, basename
-from scipy.stats import norm
-import matplotlib.pyplot as plt
 import pickle
 from functools import reduce
 
@@ -161,20 +158,8 @@ class Grid(utilities.Grid):
         :param float sigma: degree of smoothing
         :return:
         """
-        s = (sigma, sigma, sigma, 0)
-        nx, ny, nz = self.nsteps
-        scores = np.zeros((nx, ny, nz, 1))
-        for i in range(nx):
-            for j in range(ny):
-                for k in range(nz):
-                    scores[i, j, k, 0] += self.value(i, j, k)
-        smoothed = ndimage.filters.gaussian_filter(scores, sigma=s)
-        grid = self.copy_and_clear()
-        for i in range(nx):
-            for j in range(ny):
-                for k in range(nz):
-                    grid.set_value(i, j, k, smoothed[i, j, k, 0])
-        return grid
+        smoothed = ndimage.gaussian_filter(Grid.get_array(self), sigma=sigma)
+        return Grid.array_to_grid(smoothed, self)
 
     def contains_point(self, point, threshold=0, tolerance=0):
         """
@@ -209,6 +194,7 @@ class Grid(utilities.Grid):
     def dilate_by_atom(self):
 
         g_array = self.get_array()
+        from skimage.morphology import ball
         selem = ball(radius=2)
         print(selem)
 
@@ -465,7 +451,13 @@ class Grid(utilities.Grid):
 
     @staticmethod
     def array_to_grid(array, blank):
-        """"""
+        """
+        creates a grid with the frame of `blank` holding the values of `array`
+
+        :param `numpy.array` array: values, with shape `blank.nsteps`
+        :param `hotspots.grid_extension.Grid` blank: grid defining the frame
+        :return: `hotspots.grid_extension.Grid`
+        """
         grid = blank.copy_and_clear()
         indices = np.nonzero(array)
         values = array[indices]
@@ -478,27 +470,15 @@ class Grid(utilities.Grid):
         return grid
 
     @staticmethod
-    def from_array(fname):
+    def from_array(fname, origin=(0., 0., 0.), spacing=0.5):
         """
         creates a grid from array
-        :param fname: path to pickled numpy array
+        :param fname: path to a numpy array (as written by `numpy.save`)
+        :param tup origin: (float(x), float(y), float(z)) of grid point (0, 0, 0)
+        :param float spacing: grid spacing
         :return: `hotspots.grid_extension.Grid`
         """
-        grid = Grid(origin=[-35.00, -42.00, 44.00],
-                    far_corner=[59.00, 53.00, 54.00],
-                    spacing=0.5,
-                    default=0.0,
-                    _grid=None)
-
-        array = np.load(fname)
-        indices = np.nonzero(array)
-        values = array[indices]
-        as_triads = zip(*indices)
-
-        for (i, j, k), v in zip(as_triads, values):
-            grid._grid.set_value(int(i), int(j), int(k), v)
-
-        return grid
+        return grid_io.GridData(np.load(fname), origin, spacing).to_grid()
 
     @staticmethod
     def common_grid(grid_list, padding=1):
@@ -672,34 +652,41 @@ class Grid(utilities.Grid):
 
         return inner.__add__(outer > threshold)
 
+    @staticmethod
+    def array_peaks(array, min_distance=6, cutoff=2):
+        """
+        finds local maxima in an array: points that are the maximum of the cube of (2 * min_distance + 1) points
+        around them and score above `cutoff`. Points closer than `min_distance` to the edge are ignored. Connected
+        points of a flat peak are reported once, at their mean position.
+
+        :param `numpy.array` array: 3D array
+        :param int min_distance: half width of the neighbourhood, in grid points
+        :param float cutoff: peaks must score above this value
+        :return: `numpy.array`, (n, 3) integer indices of the peaks
+        """
+        size = 2 * int(min_distance) + 1
+        peaks = (ndimage.maximum_filter(array, size=size, mode='constant') == array) & (array > cutoff)
+        if min_distance > 0:
+            border = np.zeros(array.shape, dtype=bool)
+            border[min_distance:-min_distance, min_distance:-min_distance, min_distance:-min_distance] = True
+            peaks &= border
+
+        labels, n = ndimage.label(peaks, structure=np.ones((3, 3, 3)))
+        if n == 0:
+            return np.zeros((0, 3), dtype=int)
+        centres = np.array(ndimage.center_of_mass(peaks, labels, np.arange(1, n + 1))).reshape(n, 3)
+        return np.floor(centres).astype(int)
+
     def get_peaks(self, min_distance=6, cutoff=2):
         """
         find peak coordinates in grid
-        :return:
+        :param int min_distance: minimum distance between peaks, in grid points
+        :param float cutoff: peaks must score above this value
+        :return: list of tup, (float(x), float(y), float(z))
         """
-        peaks = feature.peak_local_max(self.get_array(),
-                                       min_distance=min_distance,
-                                       threshold_abs=cutoff)
-        peak_by_value = {}
-        for peak in peaks:
-            val = self.value(int(peak[0]), int(peak[1]), int(peak[2]))
-            if val > cutoff:
-                if val in peak_by_value:
-                    peak_by_value[val].append((peak[0], peak[1], peak[2]))
-                else:
-                    peak_by_value.update({val: [(peak[0], peak[1], peak[2])]})
-
-        average_peaks = []
-        for key in peak_by_value.keys():
-            x = [point[0] for point in peak_by_value[key]]
-            y = [point[1] for point in peak_by_value[key]]
-            z = [point[2] for point in peak_by_value[key]]
-            average_peaks.append(self.indices_to_point(int(sum(x) / len(x)),
-                                                       int(sum(y) / len(y)),
-                                                       int(sum(z) / len(z))
-                                                       )
-                                 )
-        return average_peaks
+        indices = Grid.array_peaks(Grid.get_array(self), min_distance=min_distance, cutoff=cutoff)
+        points = np.array(tuple(self.bounding_box[0])) + indices * self.spacing
+        return [tuple(p) for p in points.tolist()]
 
     def value_at_coordinate(self, coordinates, tolerance=1, position=True):
         """
@@ -761,6 +748,7 @@ class _GridEnsemble(object):
         self.nonzeros = None
         self.out_dir = None
         self.spacing = None
+        self.accumulator = None
 
     ###### Functions that generate the ensemble and set attributes
 
@@ -818,49 +806,90 @@ class _GridEnsemble(object):
         max_array = np.max(self.results_array, axis=-1)
         self.nonzeros = max_array.nonzero()
 
+    def get_running_statistics(self, grids):
+        """
+        Folds grids into the ensemble one at a time, keeping only running statistics (max, min, mean, M2 and count)
+        on a frame that grows to fit each new grid. The 4D results array is never built, so the memory used is
+        independent of the number of structures.
+        :param grids: iterable of `hotspots.grid_extension.Grid` instances or paths to grid files
+        :return:
+        """
+        accumulator = None
+        for g in grids:
+            if not isinstance(g, utilities.Grid):
+                g = Grid.from_file(g)
+            if accumulator is None:
+                accumulator = _GridEnsembleAccumulator(spacing=g.spacing)
+            accumulator.add(g)
+
+        if accumulator is None:
+            raise ValueError("No grids supplied to the ensemble")
+
+        self.accumulator = accumulator
+        self.results_array = None
+        self.spacing = accumulator.spacing
+        self.tup_max_length = accumulator.n
+        self.common_grid_origin = accumulator.origin
+        self.common_grid_far_corner = accumulator.far_corner
+        self.common_grid_nsteps = accumulator.max.shape
+        self.nonzeros = accumulator.max.nonzero()
+
 
     #### Functions for analysing ensemble data #####
 
+    def _values(self):
+        """
+        2D array (n_nonzero, n_grids) of the tuples held at each nonzero point of the ensemble
+        :return: `numpy.array`
+        """
+        if self.results_array is None:
+            raise RuntimeError("Streamed ensembles do not hold the per-structure values, only the running statistics")
+        return self.results_array[self.nonzeros]
+
     def get_gridpoint_means(self):
         """
         For each tuple in the GridEnsemble, calculates the means of the tuple
         :return: list
         """
-        means = [np.mean(val) for val in self.results_array[self.nonzeros]]
-        return means
+        if self.results_array is None and self.accumulator is not None:
+            return self.accumulator.mean[self.nonzeros].tolist()
+        return self._values().mean(axis=-1).tolist()
 
     def get_gridpoint_max(self):
         """
         For each tuple in the GridEnsemble, calculates the max of the tuple
         :return: list
         """
-        maxes = [np.max(val) for val in self.results_array[self.nonzeros]]
-        return maxes
+        if self.results_array is None and self.accumulator is not None:
+            return self.accumulator.max[self.nonzeros].tolist()
+        return self._values().max(axis=-1).tolist()
 
     def get_gridpoint_ranges(self):
         """
-        For each tuple in the GridEnsemble, returns the difference between max and mean
+        For each tuple in the GridEnsemble, returns the difference between max and min
+        :return: list
+        """
+        if self.results_array is None and self.accumulator is not None:
+            return (self.accumulator.max - self.accumulator.min)[self.nonzeros].tolist()
+        values = self._values()
+        return np.ptp(values, axis=-1).tolist()
+
+    def get_gridpoint_frequency(self):
+        """
+        For each tuple in the GridEnsemble, returns the number of structures with a nonzero score
         :return: list
         """
-        ranges = [np.max(val) - np.min(val) for val in self.results_array[self.nonzeros]]
-        return ranges
+        if self.results_array is None and self.accumulator is not None:
+            return self.accumulator.count[self.nonzeros].tolist()
+        return np.count_nonzero(self._values(), axis=-1).tolist()
 
     def get_gridpoint_means_spread(self):
         """
         For tuple in the GridEnsemble, calculates the difference in score between each point in the tuple and the mean of the tuple.
         :return: Python list
         """
-        means_spread = []
-        values = self.results_array[self.nonzeros]
-
-        for v in values:
-            num_zeros = self.tup_max_length - len(v)
-            if num_zeros != 0:
-                print('Number of zeros', num_zeros, 'out of ', self.tup_max_length)
-            hist_arr = np.array(v)
-            means_spread.extend(list(hist_arr - np.mean(hist_arr)))
-
-        return means_spread
+        values = self._values()
+        return (values - values.mean(axis=-1, keepdims=True)).ravel().tolist()
 
     # Functions for plotting histograms of analysed ensemble data ####
     def plot_gridpoint_spread(self):
@@ -868,10 +897,13 @@ class _GridEnsemble(object):
         For each point in the 3D grid, plots the difference in score between each point in the tuple and the mean of the tuple.
         '''
         # Get the data:
+        import matplotlib.pyplot as plt
+        from scipy.stats import norm
+
         means_spread = self.get_gridpoint_means_spread()
         mean_arr = np.array(means_spread)
         (mu, sigma) = norm.fit(mean_arr)
-        n, bins, patches = plt.hist(means_spread, bins=40, normed=1)
+        n, bins, patches = plt.hist(means_spread, bins=40, density=True)
         # print(bins)
         # y_fit = np.random.normal(mu, sigma, np.shape(mean_arr))
         y = norm.pdf(bins, mu, sigma)
@@ -892,8 +924,10 @@ class _GridEnsemble(object):
         Plots the range of the tuple values for each point in the 3D grid
         :return: ranges = list of the tuple ranges at each point
         '''
+        import matplotlib.pyplot as plt
+
         ranges = self.get_gridpoint_ranges()
-        plt.hist(ranges, bins=40, normed=0)
+        plt.hist(ranges, bins=40, density=False)
         plt.title('Score ranges for {} {}'.format(self.prot_name, self.probe))
         hist_name = self.prot_name + '_{}_score_ranges'.format(self.probe)
         plt.savefig(join(self.out_dir, hist_name))
@@ -911,15 +945,16 @@ class _GridEnsemble(object):
         """
         grid = Grid(origin=self.common_grid_origin,
                     far_corner=self.common_grid_far_corner,
-                    spacing=0.5,
+                    spacing=self.spacing or 0.5,
                     default=0.0,
                     _grid=None)
 
-        as_triads = zip(*self.nonzeros)
-        for (i, j, k), v in zip(as_triads, values):
-            grid._grid.set_value(int(i), int(j), int(k), v)
+        values = np.asarray(values, dtype=float)
+        keep = values.nonzero()
+        frame = np.zeros(grid.nsteps)
+        frame[tuple(idx[keep] for idx in self.nonzeros)] = values[keep]
 
-        return grid
+        return Grid.array_to_grid(frame, grid)
 
     def output_grid(self, mode="max", save=True):
         """
@@ -936,7 +971,7 @@ class _GridEnsemble(object):
         elif mode == "ranges":
             vals = self.get_gridpoint_ranges()
         elif mode == "frequency":
-            vals = [np.max(val) - np.min(val) for val in self.results_array[self.nonzeros]]
+            vals = self.get_gridpoint_frequency()
         else:
             print("Unrecognised mode: {}".format(mode))
             return
@@ -1013,3 +1048,144 @@ class _GridEnsemble(object):
 
         return self.output_grid(mode, save=False)
 
+    def from_grid_stream(self, grids, out_dir, prot_name, probe_name, mode="max"):
+        """
+        Creates a GridEnsemble from an iterable of Hotspot maps without holding them all in memory
+        :param grids: iterable of `hotspots.grid_extension.Grid` instances or paths to grid files (a generator is fine)
+        :param out_dir: path to where grids and histograms are saved
+        :param prot_name: str
+        :param probe_name: 'donor', 'acceptor', or 'apolar'
+        :param mode: "max", "mean", "ranges" or "frequency"
+        :return: `hotspots.grid_extension.Grid`
+        """
+        self.out_dir = out_dir
+        self.prot_name = prot_name
+        self.probe = probe_name
+        print("Making streamed ensemble {} {}".format(self.prot_name, self.probe))
+
+        self.get_running_statistics(grids)
+
+        return self.output_grid(mode, save=False)
+
+
+def _lattice_index(origin, spacing, tolerance=1e-3):
+    """
+    private method
+
+    the lattice index (origin / spacing) of a grid origin
+    :param tup origin: (float(x), float(y), float(z))
+    :param float spacing: grid spacing
+    :param float tolerance: largest accepted distance (Angstrom) from the lattice
+    :return: `numpy.array`, int(x), int(y), int(z)
+    """
+    steps = np.asarray(tuple(origin), dtype=float) / spacing
+    index = np.round(steps)
+    if np.any(np.abs(steps - index) * spacing > tolerance):
+        raise ValueError("Grid origin {} is not on the lattice of spacing {}".format(tuple(origin), spacing))
+    return index.astype(int)
+
+
+class _GridEnsembleAccumulator(object):
+    """
+    Running per-point statistics for a stream of grids sharing the same spacing and lattice.
+
+    Points outside a grid's bounding box count as zero for that grid, matching `Grid.common_grid`.
+    """
+    def __init__(self, spacing=0.5):
+        self.spacing = spacing
+        self.n = 0
+        self._origin_index = None
+        self.max = None
+        self.min = None
+        self.mean = None
+        self.m2 = None
+        self.count = None
+
+    @property
+    def origin(self):
+        return tuple(float(i) * self.spacing for i in self._origin_index)
+
+    @property
+    def far_corner(self):
+        return tuple(float(i + n - 1) * self.spacing for i, n in zip(self._origin_index, self.max.shape))
+
+    @property
+    def variance(self):
+        """
+        population variance of each point across the ensemble
+        :return: `numpy.array`
+        """
+        if self.n == 0:
+            return self.m2
+        return self.m2 / self.n
+
+    def _grow(self, origin_index, shape):
+        """
+        pads the running arrays so that the frame covers a box starting at `origin_index` with `shape` points.
+        Newly covered points have only seen zeros, so zero padding keeps every statistic exact.
+        """
+        origin_index = np.asarray(origin_index, dtype=int)
+        shape = np.asarray(shape, dtype=int)
+        if self._origin_index is None:
+            self._origin_index = origin_index
+            self.max = np.zeros(shape)
+            self.min = np.zeros(shape)
+            self.mean = np.zeros(shape)
+            self.m2 = np.zeros(shape)
+            self.count = np.zeros(shape, dtype=np.int32)
+            return
+
+        current_far = self._origin_index + np.array(self.max.shape)
+        new_origin = np.minimum(self._origin_index, origin_index)
+        new_far = np.maximum(current_far, origin_index + shape)
+        if np.array_equal(new_origin, self._origin_index) and np.array_equal(new_far, current_far):
+            return
+
+        pad = [(int(b), int(a)) for b, a in zip(self._origin_index - new_origin, new_far - current_far)]
+        self.max = np.pad(self.max, pad, mode="constant")
+        self.min = np.pad(self.min, pad, mode="constant")
+        self.mean = np.pad(self.mean, pad, mode="constant")
+        self.m2 = np.pad(self.m2, pad, mode="constant")
+        self.count = np.pad(self.count, pad, mode="constant")
+        self._origin_index = new_origin
+
+    def add_array(self, array, origin):
+        """
+        folds a 3D array into the running statistics
+        :param `numpy.array` array: grid values with shape (nx, ny, nz)
+        :param tup origin: (float(x), float(y), float(z)) coordinate of array[0, 0, 0], on the lattice of `spacing`
+        :return:
+        """
+        array = np.asarray(array, dtype=float)
+        # grids off the lattice would be shifted by up to half a spacing, so they are rejected rather than snapped
+        origin_index = _lattice_index(origin, self.spacing)
+        self._grow(origin_index, array.shape)
+
+        frame = np.zeros(self.max.shape)
+        start = origin_index - self._origin_index
+        box = tuple(slice(int(s), int(s) + n) for s, n in zip(start, array.shape))
+        frame[box] = array
+
+        self.n += 1
+        if self.n == 1:
+            self.max = frame.copy()
+            self.min = frame.copy()
+        else:
+            np.maximum(self.max, frame, out=self.max)
+            np.minimum(self.min, frame, out=self.min)
+
+        # Welford's update, applied to the whole frame at once
+        delta = frame - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (frame - self.mean)
+        self.count += (frame != 0)
+
+    def add(self, grid):
+        """
+        folds a grid into the running statistics
+        :param grid: `hotspots.grid_extension.Grid`
+        :return:
+        """
+        if abs(grid.spacing - self.spacing) > 1e-6:
+            raise ValueError("Grid spacing {} does not match ensemble spacing {}".format(grid.spacing, self.spacing))
+        self.add_array(Grid.get_array(grid), grid.bounding_box[0])
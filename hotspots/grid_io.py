@@ -0,0 +1,298 @@
+"""
+The :mod:`hotspots.grid_io` module reads and writes grid files with NumPy only.
+
+The supported formats are:
+
+- CCP4 / MRC maps (.ccp4, .mrc, .map): the header is parsed and the data block is memory-mapped
+- InsightII ASCII grids (.grd) and SuperStar contour files (.acnt), which share the InsightII layout
+
+Files are written with a single buffer write of the data block. No `ccdc` Grid is constructed, which makes this the fast route when
+archived results are reloaded in bulk; :meth:`hotspots.grid_io.GridData.to_grid` converts to a
+:class:`hotspots.grid_extension.Grid` when the grid methods are needed.
+
+The main class of the :mod:`hotspots.grid_io` module is:
+
+- :class:`hotspots.grid_io.GridData`
+
+>>> from hotspots import grid_io
+
+>>> apolar = grid_io.read("apolar.ccp4")
+>>> apolar.array.max()
+>>> grid_io.write("apolar.grd", apolar)
+"""
+from __future__ import print_function, division
+
+from os.path import splitext
+
+import numpy as np
+
+_CCP4_MODES = {0: np.int8, 1: np.int16, 2: np.float32, 6: np.uint16}
+
+
+class GridData(object):
+    """
+    A grid held as a NumPy array and its frame
+
+    :param `numpy.array` array: values with shape (nx, ny, nz), index (i, j, k) at origin + (i, j, k) * spacing
+    :param tup origin: (float(x), float(y), float(z)) of point (0, 0, 0)
+    :param float spacing: grid spacing
+    """
+    __slots__ = ("array", "origin", "spacing")
+
+    def __init__(self, array, origin, spacing):
+        self.array = array
+        self.origin = tuple(float(o) for o in origin)
+        self.spacing = float(spacing)
+
+    def __repr__(self):
+        return "GridData({}, origin={}, spacing={})".format(self.nsteps, self.origin, self.spacing)
+
+    @property
+    def nsteps(self):
+        return tuple(int(n) for n in self.array.shape)
+
+    @property
+    def far_corner(self):
+        return tuple(o + (n - 1) * self.spacing for o, n in zip(self.origin, self.nsteps))
+
+    @staticmethod
+    def from_grid(grid):
+        """
+        :param `hotspots.grid_extension.Grid` grid: grid
+        :return: :class:`hotspots.grid_io.GridData`
+        """
+        from hotspots.grid_extension import Grid
+        return GridData(Grid.get_array(grid), tuple(grid.bounding_box[0]), grid.spacing)
+
+    def to_grid(self):
+        """
+        :return: :class:`hotspots.grid_extension.Grid`
+        """
+        from hotspots.grid_extension import Grid
+        blank = Grid(origin=self.origin, far_corner=self.far_corner, spacing=self.spacing, default=0, _grid=None)
+        return Grid.array_to_grid(self.array, blank)
+
+
+def _ccp4_header(f):
+    """
+    parses the 1024 byte CCP4 / MRC header
+
+    :param f: binary file object, at the start of the file
+    :return: tup, (dtype, shape of the stored block, axis order, origin, spacing, offset of the data block)
+    """
+    header = f.read(1024)
+    if len(header) < 1024:
+        raise ValueError("truncated CCP4 header")
+
+    # the machine stamp gives the byte order, old files without one are checked for a sensible mode
+    stamp = header[212:214]
+    if stamp[:1] == b"\x11":
+        endian = ">"
+    elif stamp[:1] == b"\x44":
+        endian = "<"
+    else:
+        endian = "<" if np.frombuffer(header, dtype="<i4", count=4)[3] in _CCP4_MODES else ">"
+
+    words = np.frombuffer(header, dtype=endian + "i4", count=256)
+    floats = np.frombuffer(header, dtype=endian + "f4", count=256)
+    ncrs = words[0:3]
+    mode = int(words[3])
+    nstart = words[4:7]
+    sampling = words[7:10]
+    cell = floats[10:13]
+    axes = words[16:19]
+    nsymbt = int(words[23])
+
+    if mode not in _CCP4_MODES:
+        raise ValueError("unsupported CCP4 mode {}".format(mode))
+    if sorted(axes.tolist()) != [1, 2, 3] or np.any(ncrs < 1):
+        raise ValueError("not a CCP4 map")
+
+    # header values are indexed by column / row / section, the frame is indexed by x / y / z
+    start = np.zeros(3)
+    for crs, axis in enumerate(axes):
+        start[axis - 1] = nstart[crs]
+    spacing = cell / np.where(sampling > 0, sampling, 1)
+    origin = floats[49:52] if np.any(floats[49:52]) else start * spacing
+
+    # data is stored with columns varying fastest: C order (section, row, column)
+    order = [[axes[2], axes[1], axes[0]].index(a) for a in (1, 2, 3)]
+    shape = (int(ncrs[2]), int(ncrs[1]), int(ncrs[0]))
+    return np.dtype(_CCP4_MODES[mode]).newbyteorder(endian), shape, order, origin, float(spacing[0]), 1024 + nsymbt
+
+
+def read_ccp4(fname, mmap=True):
+    """
+    reads a CCP4 / MRC map
+
+    :param str fname: path to file
+    :param bool mmap: if True, the data block is memory-mapped (read only) rather than read into memory
+    :return: :class:`hotspots.grid_io.GridData`
+    """
+    with open(fname, "rb") as f:
+        dtype, shape, order, origin, spacing, offset = _ccp4_header(f)
+        if not mmap:
+            f.seek(offset)
+            data = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    if mmap:
+        data = np.memmap(fname, dtype=dtype, mode="r", offset=offset, shape=shape)
+    return GridData(data.transpose(order), origin, spacing)
+
+
+def write_ccp4(fname, array, origin, spacing, label="hotspots"):
+    """
+    writes a CCP4 map (mode 2, float32). The grid is stored x-slowest (as written by the CSD Python API), so that an
+    (nx, ny, nz) C-ordered array is written without reordering.
+
+    :param str fname: path to file
+    :param `numpy.array` array: values with shape (nx, ny, nz)
+    :param tup origin: (float(x), float(y), float(z))
+    :param float spacing: grid spacing
+    :param str label: text stored in the header
+    :return:
+    """
+    data = np.ascontiguousarray(array, dtype="<f4")
+    nx, ny, nz = data.shape
+    start = np.round(np.asarray(origin, dtype=float) / spacing).astype(int)
+    # origins off the lattice can not be described by the start indices and are stored in the MRC2000 origin field
+    exact = np.allclose(start * spacing, origin, atol=1e-4)
+
+    words = np.zeros(256, dtype="<i4")
+    floats = words.view("<f4")
+    words[0:3] = (nz, ny, nx)
+    words[3] = 2
+    words[4:7] = (start[2], start[1], start[0]) if exact else (0, 0, 0)
+    sampling = [max(n - 1, 1) for n in (nx, ny, nz)]
+    words[7:10] = sampling
+    floats[10:13] = [n * spacing for n in sampling]
+    floats[13:16] = 90.
+    words[16:19] = (3, 2, 1)
+    if data.size:
+        floats[19:22] = (data.min(), data.max(), data.mean())
+        floats[54] = data.std()
+    words[22] = 1
+    if not exact:
+        floats[49:52] = origin
+    words[55] = 1
+
+    header = bytearray(words.tobytes())
+    header[208:216] = b"MAP \x44\x41\x00\x00"
+    header[224:304] = label.encode("ascii", "replace")[:80].ljust(80)
+
+    with open(fname, "wb") as f:
+        f.write(header)
+        data.tofile(f)
+
+
+def _insight_header(f):
+    """
+    parses the five line InsightII header
+
+    :param f: binary file object, at the start of the file
+    :return: tup, (shape, origin, spacing, fast axis)
+    """
+    lines = [f.readline() for _ in range(5)]
+    try:
+        cell = [float(v) for v in lines[2].split()[:3]]
+        intervals = [int(v) for v in lines[3].split()[:3]]
+        limits = [int(v) for v in lines[4].split()[:7]]
+    except (ValueError, IndexError):
+        raise ValueError("not an InsightII grid")
+    if len(cell) != 3 or len(intervals) != 3 or len(limits) != 7 or limits[0] not in (1, 3):
+        raise ValueError("not an InsightII grid")
+
+    fast, starts, ends = limits[0], limits[1::2], limits[2::2]
+    spacing = cell[0] / intervals[0] if intervals[0] else 1.
+    shape = tuple(e - s + 1 for s, e in zip(starts, ends))
+    origin = tuple(s * spacing for s in starts)
+    return shape, origin, spacing, fast
+
+
+def read_insight(fname):
+    """
+    reads an InsightII ASCII grid (.grd) or SuperStar contour file (.acnt)
+
+    :param str fname: path to file
+    :return: :class:`hotspots.grid_io.GridData`
+    """
+    with open(fname, "rb") as f:
+        shape, origin, spacing, fast = _insight_header(f)
+        values = np.array(f.read().split(), dtype=np.float64)
+
+    n = int(np.prod(shape))
+    if values.size < n:
+        raise ValueError("{} holds {} values, expected {}".format(fname, values.size, n))
+    values = values[:n]
+    if fast == 1:
+        array = values.reshape(shape[::-1]).transpose(2, 1, 0)
+    else:
+        array = values.reshape(shape)
+    return GridData(array, origin, spacing)
+
+
+def write_insight(fname, array, origin, spacing, title="GRD InsightII ASCII grid map"):
+    """
+    writes an InsightII ASCII grid, x varying fastest
+
+    :param str fname: path to file
+    :param `numpy.array` array: values with shape (nx, ny, nz)
+    :param tup origin: (float(x), float(y), float(z)), should lie on the lattice of `spacing`
+    :param float spacing: grid spacing
+    :param str title: first line of the file
+    :return:
+    """
+    array = np.asarray(array, dtype=np.float64)
+    shape = array.shape
+    starts = [int(round(o / spacing)) for o in origin]
+    intervals = [n - 1 for n in shape]
+
+    cell = [n * spacing for n in intervals] + [90., 90., 90.]
+    limits = [1] + [v for s, n in zip(starts, intervals) for v in (s, s + n)]
+    header = "{}\n(1F10.3)\n{}\n{}\n{}\n".format(title,
+                                                 " ".join("{:>9.3f}".format(v) for v in cell),
+                                                 " ".join("{:>9}".format(n) for n in intervals),
+                                                 " ".join("{:>9}".format(v) for v in limits))
+    body = ("%9.3f\n" * array.size) % tuple(array.ravel(order="F").tolist())
+
+    with open(fname, "w") as f:
+        f.write(header + body)
+
+
+READERS = {".ccp4": read_ccp4,
+           ".mrc": read_ccp4,
+           ".map": read_ccp4,
+           ".grd": read_insight,
+           ".acnt": read_insight}
+
+WRITERS = {".ccp4": write_ccp4,
+           ".mrc": write_ccp4,
+           ".map": write_ccp4,
+           ".grd": write_insight,
+           ".acnt": write_insight}
+
+
+def read(fname):
+    """
+    reads a grid file, the format is given by the extension
+
+    :param str fname: path to file
+    :return: :class:`hotspots.grid_io.GridData`
+    """
+    ext = splitext(fname)[1].lower()
+    if ext not in READERS:
+        raise ValueError("unsupported grid format {}".format(ext))
+    return READERS[ext](fname)
+
+
+def write(fname, grid_data):
+    """
+    writes a grid file, the format is given by the extension
+
+    :param str fname: path to file
+    :param `hotspots.grid_io.GridData` grid_data: grid
+    :return:
+    """
+    ext = splitext(fname)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError("unsupported grid format {}".format(ext))
+    WRITERS[ext](fname, grid_data.array, grid_data.origin, grid_data.spacing)
@@ -0,0 +1,290 @@
+"""
+The :mod:`hotspots.hs_benchmark` module provides a small harness for performance benchmarks of the Fragment Hotspot
+Maps pipeline.
+
+Each timed stage records wall time, CPU time (including finished child processes such as SuperStar and Ghecom),
+peak resident memory and, optionally, a checksum of its output so that speed-ups can be checked for changes in the
+results. A run is written as JSON and can be compared against a stored baseline.
+
+The main classes of the :mod:`hotspots.hs_benchmark` module are:
+
+- :class:`hotspots.hs_benchmark.BenchmarkRun`
+
+Synthetic hotspot maps, for benchmarks that do not need SuperStar or a CSD licence, are made with
+:func:`hotspots.hs_benchmark.synthetic_hotspot_array` and :func:`hotspots.hs_benchmark.synthetic_grid`.
+
+>>> from hotspots.hs_benchmark import BenchmarkRun, compare_to_baseline
+
+>>> run = BenchmarkRun("1hcl")
+>>> with run.stage("buriedness") as record:
+...     grid = calculate_buriedness()
+...     record["checksum"] = checksum_grid(grid)
+>>> run.write_json("current.json")
+>>> regressions = compare_to_baseline(run.to_dict(), "baseline.json", threshold=0.2)
+
+Benchmark scripts using this harness are in `examples/8_benchmarks`.
+"""
+from __future__ import print_function, division
+
+import hashlib
+import json
+import platform
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from hotspots.hs_metrics import peak_memory
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def cpu_time():
+    """
+    user + system CPU time of this process and its finished children
+
+    :return: float, seconds
+    """
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def synthetic_hotspot_array(shape, density="sparse", npeaks=None, seed=0):
+    """
+    a hotspot-like map: gaussian peaks scoring up to ~40 on a zero background ("sparse", a few percent of points
+    nonzero) or on a low scoring background covering the whole grid ("dense")
+
+    :param tup shape: (nx, ny, nz)
+    :param str density: "sparse" or "dense"
+    :param int npeaks: number of peaks (default scales with the grid volume)
+    :param int seed: random seed
+    :return: `numpy.array`
+    """
+    if density not in ("sparse", "dense"):
+        raise ValueError("density must be 'sparse' or 'dense'")
+    rng = np.random.RandomState(seed)
+    shape = tuple(int(n) for n in shape)
+    if npeaks is None:
+        npeaks = max(4, int(np.prod(shape) / 20000))
+
+    array = np.zeros(shape)
+    for centre, height, width in zip(rng.uniform(0, 1, (npeaks, 3)) * shape,
+                                     rng.uniform(10, 40, npeaks),
+                                     rng.uniform(1.5, 4, npeaks)):
+        # only the box within 3 sigma of the peak is touched
+        lo = np.maximum(np.floor(centre - 3 * width).astype(int), 0)
+        hi = np.minimum(np.ceil(centre + 3 * width).astype(int) + 1, shape)
+        axes = [np.arange(l, h) - c for l, h, c in zip(lo, hi, centre)]
+        d2 = axes[0][:, None, None] ** 2 + axes[1][None, :, None] ** 2 + axes[2][None, None, :] ** 2
+        box = array[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+        np.maximum(box, height * np.exp(-d2 / (2 * width ** 2)), out=box)
+
+    if density == "sparse":
+        array[array < 1] = 0
+    else:
+        array += rng.uniform(1, 5, shape)
+    return np.round(array, 2)
+
+
+def synthetic_grid(array, origin=(0., 0., 0.), spacing=0.5):
+    """
+    a :class:`hotspots.grid_extension.Grid` holding `array`
+
+    :param `numpy.array` array: grid values, e.g. from `synthetic_hotspot_array`
+    :param tup origin: (float(x), float(y), float(z))
+    :param float spacing: grid spacing
+    :return: `hotspots.grid_extension.Grid`
+    """
+    from hotspots.grid_extension import Grid
+    far_corner = [o + (n - 1) * spacing for o, n in zip(origin, array.shape)]
+    blank = Grid(origin=origin, far_corner=far_corner, spacing=spacing, default=0, _grid=None)
+    return Grid.array_to_grid(array, blank)
+
+
+def checksum_array(array, decimals=3):
+    """
+    checksum of an array, rounded so that harmless floating point noise does not change it
+
+    :param `numpy.array` array: values
+    :param int decimals: number of decimals kept
+    :return: str, sha1 hex digest
+    """
+    array = np.round(np.asarray(array, dtype=np.float64), decimals) + 0.
+    h = hashlib.sha1()
+    h.update(str(array.shape).encode())
+    h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+
+def checksum_grid(grid, decimals=3):
+    """
+    checksum of a grid's values and frame
+
+    :param `hotspots.grid_extension.Grid` grid: grid
+    :param int decimals: number of decimals kept
+    :return: str, sha1 hex digest
+    """
+    from hotspots.grid_extension import Grid
+    h = hashlib.sha1()
+    h.update(str([round(v, 3) for corner in grid.bounding_box for v in corner]).encode())
+    h.update(checksum_array(Grid.get_array(grid), decimals).encode())
+    return h.hexdigest()
+
+
+def checksum_result(hr, decimals=3):
+    """
+    checksum of the probe grids of a result
+
+    :param `hotspots.result.Results` hr: result
+    :param int decimals: number of decimals kept
+    :return: str, sha1 hex digest
+    """
+    h = hashlib.sha1()
+    for probe in sorted(hr.super_grids.keys()):
+        h.update(probe.encode())
+        h.update(checksum_grid(hr.super_grids[probe], decimals).encode())
+    return h.hexdigest()
+
+
+class BenchmarkRun(object):
+    """
+    The measurements of one benchmark run
+
+    :param str label: name of the run, e.g. the structure or synthetic case being benchmarked
+    :param dict metadata: anything needed to reproduce the run (settings, seeds, versions)
+    """
+
+    def __init__(self, label, metadata=None):
+        self.label = label
+        self.metadata = OrderedDict(python=platform.python_version(),
+                                    numpy=np.__version__,
+                                    machine=platform.machine())
+        self.metadata.update(metadata or {})
+        self.stages = OrderedDict()
+
+    def __str__(self):
+        lines = ["BenchmarkRun({})".format(self.label)]
+        for name, record in self.stages.items():
+            lines.append("    {:<36} wall {:>9.3f} s   cpu {:>9.3f} s   rss {:>8.1f} MB".format(
+                name, record["wall"], record["cpu"], record["peak_rss"] or 0.))
+        return "\n".join(lines)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        times the enclosed block. The yielded dict can be used to add a "checksum" or any other values.
+
+        :param str name: stage name
+        """
+        record = OrderedDict()
+        wall = time.time()
+        cpu = cpu_time()
+        try:
+            yield record
+        finally:
+            record["wall"] = time.time() - wall
+            record["cpu"] = cpu_time() - cpu
+            record["peak_rss"] = peak_memory()
+            self.stages[name] = record
+
+    def measure(self, name, func, *args, **kwargs):
+        """
+        times a call, repeated `repeat` times (keyword argument, default 1), keeping the fastest
+
+        :param str name: stage name
+        :param func: callable
+        :return: the return value of the last call
+        """
+        repeat = kwargs.pop("repeat", 1)
+        best = None
+        out = None
+        for _ in range(repeat):
+            wall = time.time()
+            cpu = cpu_time()
+            out = func(*args, **kwargs)
+            record = OrderedDict(wall=time.time() - wall, cpu=cpu_time() - cpu)
+            if best is None or record["wall"] < best["wall"]:
+                best = record
+        best["peak_rss"] = peak_memory()
+        best["repeat"] = repeat
+        self.stages[name] = best
+        return out
+
+    def to_dict(self):
+        """
+        :return: dict, {"label": str, "metadata": {}, "stages": {}}
+        """
+        return OrderedDict(label=self.label, metadata=self.metadata, stages=self.stages)
+
+    def write_json(self, path):
+        """
+        :param str path: output path
+        :return:
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def write_report(runs, path):
+    """
+    writes several runs to one JSON report
+
+    :param list runs: list of :class:`hotspots.hs_benchmark.BenchmarkRun`
+    :param str path: output path
+    :return:
+    """
+    with open(path, "w") as f:
+        json.dump([r.to_dict() for r in runs], f, indent=2)
+
+
+def _by_key(report):
+    if isinstance(report, dict):
+        report = [report]
+    return {(r["label"], stage): record for r in report for stage, record in r["stages"].items()}
+
+
+def compare_to_baseline(report, baseline, threshold=0.2, min_time=0.05):
+    """
+    compares a report with a baseline report
+
+    A stage regresses if its wall time exceeds the baseline by more than `threshold` (fractional), if its checksum
+    differs or if it failed where the baseline did not. Stages faster than `min_time` seconds in the baseline are only
+    checked for checksums, their timings are too noisy to compare.
+
+    :param report: dict or list of dicts (as from `BenchmarkRun.to_dict`), or path to a JSON report
+    :param baseline: dict or list of dicts, or path to a JSON report
+    :param float threshold: allowed fractional slow-down
+    :param float min_time: baseline wall time below which timings are not compared
+    :return: list of (label, stage, reason) tuples, empty if there are no regressions
+    """
+    if not isinstance(report, (dict, list)):
+        with open(report) as f:
+            report = json.load(f)
+    if not isinstance(baseline, (dict, list)):
+        with open(baseline) as f:
+            baseline = json.load(f)
+
+    current = _by_key(report)
+    regressions = []
+    for key, base in sorted(_by_key(baseline).items()):
+        label, stage = key
+        if key not in current:
+            regressions.append((label, stage, "missing"))
+            continue
+        now = current[key]
+        if "error" in now and "error" not in base:
+            regressions.append((label, stage, "error {}".format(now["error"])))
+            continue
+        if "checksum" in base and now.get("checksum") != base["checksum"]:
+            regressions.append((label, stage, "checksum {} != {}".format(now.get("checksum"), base["checksum"])))
+        if base["wall"] >= min_time and now["wall"] > base["wall"] * (1 + threshold):
+            regressions.append((label, stage, "wall {:.3f} s > {:.3f} s (+{:.0%})".format(
+                now["wall"], base["wall"], now["wall"] / base["wall"] - 1)))
+    return regressions
@@ -0,0 +1,152 @@
+"""
+The :mod:`hotspots.hs_clustering` module clusters molecular fingerprints in bulk.
+
+Fingerprints are packed into rows of 64 bit words, so a Tanimoto similarity is a popcount over a few dozen words
+and the full matrix is computed with NumPy in blocks, with no Python call per pair. The matrix is then clustered by:
+
+- "butina": Butina sphere exclusion at a distance threshold, no extra dependency
+- "hdbscan": HDBSCAN on the precomputed distance matrix
+
+>>> from hotspots.hs_clustering import pack_fingerprints, tanimoto_matrix, cluster_fingerprints
+
+>>> packed = pack_fingerprints([AllChem.GetMorganFingerprintAsBitVect(m, 2) for m in mols])
+>>> similarity = tanimoto_matrix(packed)
+>>> clusters = cluster_fingerprints(packed, method="butina", threshold=0.35)
+"""
+from __future__ import print_function, division
+
+import numpy as np
+
+# number of uint64 words held by the temporary array of one block of :func:`tanimoto_matrix` (32 MB)
+_BLOCK_WORDS = 1 << 22
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    """
+    number of set bits in each row of packed words
+
+    :param `numpy.array` words: uint64 array, bits packed along the last axis
+    :return: `numpy.array`, int32 counts with the last axis summed
+    """
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+    return _POPCOUNT8[words.view(np.uint8)].sum(axis=-1, dtype=np.int32)
+
+
+def pack_fingerprints(fingerprints, n_bits=None):
+    """
+    packs fingerprints into rows of 64 bit words
+
+    :param list fingerprints: RDKit bit vectors (anything with `GetOnBits`), or a (n, bits) array of 0/1
+    :param int n_bits: fingerprint length (default: the length of the first fingerprint)
+    :return: `numpy.array`, uint64 with shape (n, ceil(bits / 64))
+    """
+    fingerprints = list(fingerprints)
+    if len(fingerprints) == 0:
+        return np.zeros((0, 0), dtype=np.uint64)
+
+    if hasattr(fingerprints[0], "GetOnBits"):
+        n_bits = n_bits or fingerprints[0].GetNumBits()
+        bits = np.zeros((len(fingerprints), n_bits), dtype=bool)
+        for i, fp in enumerate(fingerprints):
+            bits[i, list(fp.GetOnBits())] = True
+    else:
+        bits = np.asarray(fingerprints, dtype=bool)
+        if n_bits is not None:
+            bits = bits[:, :n_bits]
+
+    pad = -bits.shape[1] % 64
+    if pad:
+        bits = np.pad(bits, ((0, 0), (0, pad)))
+    return np.ascontiguousarray(np.packbits(bits, axis=1)).view(np.uint64)
+
+
+def tanimoto_matrix(a, b=None):
+    """
+    Tanimoto similarities between packed fingerprints. A pair of empty fingerprints has a similarity of 0.
+
+    :param `numpy.array` a: packed fingerprints, see :func:`pack_fingerprints`
+    :param `numpy.array` b: packed fingerprints (default: `a`)
+    :return: `numpy.array`, float32 with shape (len(a), len(b))
+    """
+    a = np.ascontiguousarray(a, dtype=np.uint64)
+    b = a if b is None else np.ascontiguousarray(b, dtype=np.uint64)
+    count_a = popcount(a)
+    count_b = popcount(b)
+
+    out = np.empty((len(a), len(b)), dtype=np.float32)
+    rows = max(1, _BLOCK_WORDS // max(1, b.size))
+    for start in range(0, len(a), rows):
+        stop = min(start + rows, len(a))
+        intersection = popcount(a[start:stop, None, :] & b[None, :, :])
+        union = count_a[start:stop, None] + count_b[None, :] - intersection
+        out[start:stop] = intersection / np.maximum(union, 1)
+    return out
+
+
+def butina(distances, threshold=0.35):
+    """
+    Butina sphere exclusion clustering. Points are taken in order of their number of neighbours within `threshold`;
+    each point that is not yet assigned becomes a centroid and takes all its unassigned neighbours.
+
+    :param `numpy.array` distances: (n, n) distance matrix
+    :param float threshold: neighbour distance cutoff
+    :return: tup, (`numpy.array` of int cluster labels, `numpy.array` of the centroid index of each cluster)
+    """
+    neighbours = np.asarray(distances) <= threshold
+    order = np.argsort(-neighbours.sum(axis=1), kind="stable")
+    labels = np.full(len(neighbours), -1, dtype=int)
+    centroids = []
+    for i in order:
+        if labels[i] != -1:
+            continue
+        labels[neighbours[i] & (labels == -1)] = len(centroids)
+        labels[i] = len(centroids)
+        centroids.append(i)
+    return labels, np.array(centroids, dtype=int)
+
+
+def hdbscan_labels(distances, min_cluster_size=2):
+    """
+    HDBSCAN on a precomputed distance matrix
+
+    :param `numpy.array` distances: (n, n) distance matrix
+    :param int min_cluster_size: smallest cluster
+    :return: `numpy.array` of int cluster labels, -1 for noise
+    """
+    import hdbscan
+
+    model = hdbscan.HDBSCAN(metric="precomputed", min_cluster_size=min_cluster_size)
+    return model.fit(np.asarray(distances, dtype=np.float64)).labels_
+
+
+def cluster_fingerprints(fingerprints, method="hdbscan", threshold=0.35, min_cluster_size=2, distances=None):
+    """
+    clusters fingerprints on their Tanimoto distances
+
+    :param fingerprints: packed fingerprints, or anything accepted by :func:`pack_fingerprints`
+    :param str method: "butina" or "hdbscan"
+    :param float threshold: Butina neighbour distance cutoff
+    :param int min_cluster_size: smaller clusters are dropped (HDBSCAN reports them as noise)
+    :param `numpy.array` distances: precomputed Tanimoto distance matrix, saves repacking when it is reused
+    :return: list of lists of int, the member indices of each cluster. Butina clusters list their centroid first.
+    """
+    if distances is None:
+        if not (isinstance(fingerprints, np.ndarray) and fingerprints.dtype == np.uint64):
+            fingerprints = pack_fingerprints(fingerprints)
+        distances = 1. - tanimoto_matrix(fingerprints)
+
+    if method == "butina":
+        labels, centroids = butina(distances, threshold=threshold)
+        clusters = [[c] + [i for i in np.flatnonzero(labels == label) if i != c]
+                    for label, c in enumerate(centroids)]
+    elif method == "hdbscan":
+        labels = hdbscan_labels(distances, min_cluster_size=min_cluster_size)
+        clusters = [list(np.flatnonzero(labels == label)) for label in np.unique(labels) if label != -1]
+    else:
+        raise ValueError("unknown clustering method {}".format(method))
+
+    return [[int(i) for i in c] for c in clusters if len(c) >= min_cluster_size]
@@ -14,15 +14,16 @@ More information about the GOLD method is available:
     - Development and Validation of a Genetic Algorithm for Flexible Docking G. Jones, P. Willett, R. C. Glen, A. R. Leach and R. Taylor, J. Mol. Biol., 267, 727-748, 1997 [DOI: 10.1006/jmbi.1996.0897]
 """
 from __future__ import print_function
+import json
 import os
 import tempfile
 
 import numpy as np
 from ccdc import docking
-from ccdc import io
-from ccdc import molecule
 from ccdc.utilities import _private_importer
-from hotspots.result import Extractor, Results
+from hotspots.grid_io import GridData
+from hotspots.hs_docking_prep import best_volume, fitting_points, write_fitting_points
+from hotspots.result import Results
 
 with _private_importer():
     import DockingLib
@@ -161,35 +162,43 @@ class DockerSettings(docking.Docker.Settings):
         :param float threshold: points above this value will be included in the fitting points
         :param str mode: 'threshold'- assigns fitting points based on a score cutoff or 'bcv'- assigns fitting points from best continuous volume analysis (recommended)
         """
-        temp = tempfile.mkdtemp()
-        mol = molecule.Molecule(identifier="fitting_pts")
-
         if mode == 'threshold':
-            dic = hr.super_grids["apolar"].grid_value_by_coordinates(threshold=threshold)
+            apolar = GridData.from_grid(hr.super_grids["apolar"])
 
         elif mode == 'bcv':
-            extractor = Extractor(hr=hr, volume=volume, mode="global")
-            bv = extractor.extracted_hotspots[0].best_island
-            dic = bv.grid_value_by_coordinates(threshold=17)
+            grids = {p: GridData.from_grid(g) for p, g in hr.super_grids.items()}
+            apolar = best_volume(grids, hr.protein, volume=volume)["apolar"]
 
         else:
             raise TypeError("{} not supported, see documentation for details".format(mode))
 
-        for score, v in dic.items():
-            for pts in v:
-                atm = molecule.Atom(atomic_symbol='C',
-                                    atomic_number=14,
-                                    label='{:.2f}'.format(score),
-                                    coordinates=pts)
-                atm.partial_charge = score
-                mol.add_atom(atom=atm)
-
-        fname = os.path.join(temp, 'fit_pts.mol2')
-        with io.MoleculeWriter(fname) as w:
-            w.write(mol)
+        coordinates, scores = fitting_points(apolar, threshold=threshold)
+        fname = os.path.join(tempfile.mkdtemp(), 'fit_pts.mol2')
+        write_fitting_points(fname, coordinates, scores)
 
         self.fitting_points_file = fname
 
+    def add_prepared_receptor(self, prep_dir, max_constraints=2, weight=5.0, min_hbond_score=0.001):
+        """
+        adds a receptor prepared by :class:`hotspots.hs_docking_prep.DockingPrep`: its protein, fitting points and
+        hydrogen bond constraints
+
+        :param str prep_dir: receptor directory
+        :param int max_constraints: max number of constraints
+        :param float weight: the constraint weight
+        :param float min_hbond_score: float between 0.0 (bad) and 1.0 (good) determining the minimum hydrogen bond quality in the solutions.
+        """
+        with open(os.path.join(prep_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+
+        self.add_protein_file(manifest["protein_file"])
+        self.fitting_points_file = manifest["fitting_points_file"]
+        protein = self.proteins[-1]
+        for constraint in self.HotspotHBondConstraint._from_file(manifest["constraints_file"], protein, weight,
+                                                                 min_hbond_score=min_hbond_score,
+                                                                 max=max_constraints):
+            self.add_constraint(constraint)
+
 
 # def _is_solvent_accessible(protein_coords, atm, min_distance=2):
 #     """
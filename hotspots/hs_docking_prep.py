@@ -0,0 +1,409 @@
+"""
+The :mod:`hotspots.hs_docking_prep` module prepares GOLD docking inputs from Fragment Hotspot Maps results in bulk.
+
+For each result the following are computed on the grid arrays:
+
+- fitting points: the apolar grid points above a threshold (optionally within the best continuous volume)
+- hydrogen bond constraint atoms: the protein donor hydrogens and acceptors nearest to the polar hotspot islands
+- atom scores: a hotspot score for each protein atom
+
+Preparation does not need a GOLD licence, so a docking farm can prepare its receptors up front, in parallel, and
+reuse them: each receptor directory records what it was prepared from and is only rebuilt when the result or the
+settings change.
+
+The main class of the :mod:`hotspots.hs_docking_prep` module is:
+
+- :class:`hotspots.hs_docking_prep.DockingPrep`
+
+>>> from hotspots.hs_docking_prep import DockingPrep
+
+>>> prep = DockingPrep()
+>>> records = prep.prepare_all({"1hcl": "1hcl/out.zip", "2vta": "2vta/out.zip"}, out_dir="receptors", nprocesses=8)
+
+>>> from hotspots.hs_docking import DockerSettings
+>>> settings = DockerSettings()
+>>> settings.add_prepared_receptor(records[0].out_dir)
+"""
+from __future__ import print_function, division
+
+import collections
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+from concurrent import futures
+from os.path import join, exists, abspath, basename, splitext
+
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+from hotspots.grid_io import GridData
+
+AtomTable = collections.namedtuple("AtomTable", ["coordinates", "residue", "parent", "atom_type", "donor_hydrogen",
+                                                 "acceptor"])
+
+
+class PreparedReceptor(collections.namedtuple("PreparedReceptor", ["name", "path", "out_dir", "protein_file",
+                                                                   "fitting_points_file", "constraints_file",
+                                                                   "scores_file", "n_fitting_points",
+                                                                   "n_constraints", "cached", "error"])):
+    """
+    The outcome of preparing one receptor
+
+    :param str name: receptor name, the name of its directory in the output directory
+    :param str path: path to the Fragment Hotspot Maps result
+    :param str out_dir: receptor directory
+    :param str protein_file: the protein the constraint atom indices refer to (mol2)
+    :param str fitting_points_file: GOLD fitting points (mol2)
+    :param str constraints_file: constraint atoms, {score: atom index} (as `hotspots.result.Results._ConstraintData`)
+    :param str scores_file: atom scores (.npy), one per atom of `protein_file`
+    :param int n_fitting_points: number of fitting points
+    :param int n_constraints: number of constraint atoms
+    :param bool cached: True if the receptor directory was up to date
+    :param str error: why the preparation failed, None on success
+    """
+    __slots__ = ()
+
+    @property
+    def success(self):
+        return self.error is None
+
+
+def atom_table(protein):
+    """
+    the per-atom properties used by the preparation, as arrays indexed by atom index
+
+    :param `ccdc.protein.Protein` protein: protein
+    :return: :class:`hotspots.hs_docking_prep.AtomTable`
+    """
+    from hotspots.hs_utilities import Helper
+
+    atoms = protein.atoms
+    n = len(atoms)
+    coordinates = np.array([tuple(a.coordinates) for a in atoms], dtype=float).reshape(n, 3)
+    residue = np.full(n, -1, dtype=int)
+    for i, r in enumerate(protein.residues):
+        residue[[a.index for a in r.atoms]] = i
+
+    parent = np.full(n, -1, dtype=int)
+    atom_type = np.full(n, "", dtype=object)
+    is_donor = np.zeros(n, dtype=bool)
+    acceptor = np.zeros(n, dtype=bool)
+    for a in atoms:
+        if a.atomic_number == 1:
+            neighbours = a.neighbours
+            if neighbours:
+                parent[a.index] = neighbours[0].index
+        else:
+            atom_type[a.index] = Helper.get_atom_type(a)
+        is_donor[a.index] = a.is_donor
+        acceptor[a.index] = a.is_acceptor
+
+    donor_hydrogen = (parent >= 0) & is_donor[np.maximum(parent, 0)]
+    return AtomTable(coordinates, residue, parent, atom_type, donor_hydrogen, acceptor)
+
+
+def fitting_points(apolar, threshold=17):
+    """
+    the apolar grid points above `threshold`
+
+    :param `hotspots.grid_io.GridData` apolar: apolar grid
+    :param float threshold: points above this value are fitting points
+    :return: tup, ((n, 3) `numpy.array` coordinates, (n,) `numpy.array` scores)
+    """
+    array = np.asarray(apolar.array)
+    indices = np.nonzero(array > threshold)
+    coordinates = np.asarray(apolar.origin) + np.transpose(indices) * apolar.spacing
+    return coordinates.reshape(-1, 3), array[indices].astype(float)
+
+
+def write_fitting_points(fname, coordinates, scores):
+    """
+    writes fitting points as a mol2 file of unbonded carbon atoms, labelled and charged with their score
+
+    :param str fname: path to output file
+    :param coordinates: (n, 3) coordinates
+    :param scores: (n,) scores
+    """
+    lines = ["@<TRIPOS>MOLECULE", "fitting_pts", "{} 0 0 0 0".format(len(scores)), "SMALL", "USER_CHARGES", "",
+             "@<TRIPOS>ATOM"]
+    lines.extend("{:>7d} {:<8} {:>10.4f} {:>10.4f} {:>10.4f} C.3 1 UNL1 {:>10.4f}".format(i + 1, "{:.2f}".format(s),
+                                                                                        x, y, z, s)
+                 for i, ((x, y, z), s) in enumerate(zip(np.asarray(coordinates).tolist(), np.asarray(scores).tolist())))
+    with open(fname, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def best_volume(grids, protein, volume=400):
+    """
+    the best continuous volume of a result, see :class:`hotspots.result.Extractor`
+
+    :param dict grids: {probe: :class:`hotspots.grid_io.GridData`}
+    :param `ccdc.protein.Protein` protein: protein
+    :param float volume: target volume in Angstroms ^ 3
+    :return: dict, {probe: :class:`hotspots.grid_io.GridData`}
+    """
+    from hotspots.result import Extractor, Results
+
+    hr = Results(super_grids={p: g.to_grid() for p, g in grids.items()}, protein=protein)
+    extracted = Extractor(hr, settings=Extractor.Settings(volume=volume)).extract_volume(volume=volume)
+    return {p: GridData.from_grid(g) for p, g in extracted.super_grids.items()}
+
+
+def _islands(grid, settings):
+    """
+    the islands of a polar grid that qualify as constraint features
+
+    :return: tup, ((n, 3) bounding box centres, (n,) island maxima)
+    """
+    array = np.asarray(grid.array)
+    labels, n = ndimage.label(array > settings.island_threshold)
+    if n == 0:
+        return np.zeros((0, 3)), np.zeros(0)
+    index = np.arange(1, n + 1)
+    counts = np.bincount(labels.ravel(), minlength=n + 1)[1:]
+    core = np.asarray(ndimage.sum(array > settings.core_threshold, labels, index))
+    keep = (counts > settings.min_island_size) & (core > settings.min_core_size)
+
+    # the centre of each island's bounding box, as `Grid.centroid`
+    boxes = ndimage.find_objects(labels)
+    centres = np.array([[(sl.start + sl.stop - 1) / 2. for sl in box] for box in boxes])
+    scores = np.asarray(ndimage.maximum(array, labels, index))
+    return np.asarray(grid.origin) + centres[keep] * grid.spacing, scores[keep]
+
+
+def constraint_atoms(grids, atoms, settings):
+    """
+    pairs each qualifying donor / acceptor island with the nearest protein acceptor / donor hydrogen in the binding
+    site (the residues within `settings.binding_site_radius` of the centre of the apolar grid)
+
+    :param dict grids: {probe: :class:`hotspots.grid_io.GridData`}
+    :param `hotspots.hs_docking_prep.AtomTable` atoms: protein atoms
+    :param `hotspots.hs_docking_prep.DockingPrep.Settings` settings: settings
+    :return: `collections.OrderedDict`, {island score: atom index}, best first
+    """
+    apolar = grids["apolar"]
+    centre = (np.asarray(apolar.origin) + np.asarray(apolar.far_corner)) / 2.
+    near = np.linalg.norm(atoms.coordinates - centre, axis=1) <= settings.binding_site_radius
+    site = np.isin(atoms.residue, atoms.residue[near & (atoms.residue >= 0)])
+
+    partners = {"acceptor": np.flatnonzero(site & atoms.donor_hydrogen),
+                "donor": np.flatnonzero(site & atoms.acceptor)}
+    constraints = {}
+    for probe, candidates in partners.items():
+        if probe not in grids or len(candidates) == 0:
+            continue
+        centres, scores = _islands(grids[probe], settings)
+        if len(centres) == 0:
+            continue
+        distances, nearest = cKDTree(atoms.coordinates[candidates]).query(centres)
+        for score, d, i in zip(scores.tolist(), distances, nearest):
+            if d < settings.max_hbond_dist:
+                constraints[score] = int(candidates[i])
+
+    best = sorted(constraints, reverse=True)[:settings.max_constraints]
+    return OrderedDict((score, constraints[score]) for score in best)
+
+
+def _near_max(grid, coordinates, tolerance):
+    """
+    the largest positive grid value within `tolerance` grid steps of each coordinate, 0 if there is none
+    """
+    array = np.pad(np.clip(np.asarray(grid.array, dtype=float), 0, None), tolerance)
+    maxima = ndimage.maximum_filter(array, size=2 * tolerance + 1, mode="constant")
+    index = np.round((coordinates - np.asarray(grid.origin)) / grid.spacing).astype(int) + tolerance
+    valid = np.all((index >= 0) & (index < maxima.shape), axis=1)
+    out = np.zeros(len(coordinates))
+    out[valid] = maxima[tuple(index[valid].T)]
+    return out
+
+
+def atom_scores(grids, atoms):
+    """
+    a hotspot score for each protein atom: the best value of the partner grid near the atom
+
+    - acceptors and donor / acceptors: the donor grid, within 5 grid steps
+    - hydrogens of donors and donor / acceptors: the acceptor grid around their heavy atom, within 5 grid steps
+    - other heavy atoms: the apolar grid, within 4 grid steps
+
+    :param dict grids: {probe: :class:`hotspots.grid_io.GridData`}
+    :param `hotspots.hs_docking_prep.AtomTable` atoms: protein atoms
+    :return: `numpy.array`, (n,) scores indexed by atom index
+    """
+    scores = np.zeros(len(atoms.coordinates))
+    parent_type = np.where(atoms.parent >= 0, atoms.atom_type[np.maximum(atoms.parent, 0)], "")
+    rules = [("donor", 5, np.isin(atoms.atom_type, ["acceptor", "doneptor"]), atoms.coordinates),
+             ("apolar", 4, atoms.atom_type == "apolar", atoms.coordinates),
+             ("acceptor", 5, np.isin(parent_type, ["donor", "doneptor"]),
+              atoms.coordinates[np.maximum(atoms.parent, 0)])]
+    for probe, tolerance, selected, coordinates in rules:
+        if probe in grids and selected.any():
+            scores[selected] = _near_max(grids[probe], coordinates[selected], tolerance)
+    return scores
+
+
+def _prepare(args):
+    """
+    worker: prepares one receptor
+
+    :param tup args: (settings, name, path to result, receptor directory)
+    :return: :class:`hotspots.hs_docking_prep.PreparedReceptor`
+    """
+    settings, name, path, out_dir = args
+    try:
+        return DockingPrep(settings).prepare(path, out_dir, name=name)
+    except Exception as e:
+        return PreparedReceptor(name, path, out_dir, None, None, None, None, 0, 0, False,
+                                "{}: {}".format(type(e).__name__, e))
+
+
+class DockingPrep(object):
+    """
+    Prepares receptors for hotspot-guided GOLD docking
+
+    :param `hotspots.hs_docking_prep.DockingPrep.Settings` settings: preparation settings
+    """
+    class Settings(object):
+        """
+        settings available for adjustment
+
+        :param float fitting_threshold: apolar points above this value are fitting points
+        :param str fitting_mode: 'threshold', all points above the threshold, or 'bcv', the points above the threshold
+                                 within the best continuous volume
+        :param float fitting_volume: target volume of the best continuous volume, in Angstroms ^ 3
+        :param int max_constraints: number of constraint atoms kept, best first
+        :param float max_hbond_dist: furthest acceptable distance from an island to its constraint atom
+        :param float island_threshold: polar islands are made of points above this value
+        :param int min_island_size: islands must have more points than this
+        :param float core_threshold: score of the island core
+        :param int min_core_size: island cores must have more points than this
+        :param float binding_site_radius: constraint atoms belong to residues within this distance of the centre of
+                                          the apolar grid
+        """
+        def __init__(self, fitting_threshold=17, fitting_mode="threshold", fitting_volume=400, max_constraints=10,
+                     max_hbond_dist=4, island_threshold=5, min_island_size=6, core_threshold=14, min_core_size=15,
+                     binding_site_radius=12.):
+            if fitting_mode not in ("threshold", "bcv"):
+                raise TypeError("{} not supported, see documentation for details".format(fitting_mode))
+            self.fitting_threshold = fitting_threshold
+            self.fitting_mode = fitting_mode
+            self.fitting_volume = fitting_volume
+            self.max_constraints = max_constraints
+            self.max_hbond_dist = max_hbond_dist
+            self.island_threshold = island_threshold
+            self.min_island_size = min_island_size
+            self.core_threshold = core_threshold
+            self.min_core_size = min_core_size
+            self.binding_site_radius = binding_site_radius
+
+    def __init__(self, settings=None):
+        if settings is None:
+            self.settings = self.Settings()
+        else:
+            self.settings = settings
+
+    def _key(self, path):
+        """
+        identifies a preparation: the result file (path, size and modification time) and the settings
+        """
+        stat = os.stat(path)
+        values = json.dumps({"path": abspath(path), "size": stat.st_size, "mtime": stat.st_mtime,
+                             "settings": vars(self.settings)}, sort_keys=True)
+        return hashlib.sha1(values.encode()).hexdigest()
+
+    def prepare(self, path, out_dir, name=None):
+        """
+        prepares one receptor. If `out_dir` already holds a preparation of the same result with the same settings,
+        it is reused.
+
+        Files written to `out_dir`: protein.mol2, fit_pts.mol2, constraints.dat, atom_scores.npy and manifest.json
+
+        :param str path: path to a Fragment Hotspot Maps result (directory or .zip)
+        :param str out_dir: receptor directory
+        :param str name: receptor name (default: the name of `out_dir`)
+        :return: :class:`hotspots.hs_docking_prep.PreparedReceptor`
+        """
+        from ccdc import io
+        from hotspots.hs_io import HotspotReader
+
+        name = name or basename(abspath(out_dir))
+        key = self._key(path)
+        manifest = join(out_dir, "manifest.json")
+        if exists(manifest):
+            with open(manifest) as f:
+                m = json.load(f)
+            files = [m["protein_file"], m["fitting_points_file"], m["constraints_file"], m["scores_file"]]
+            if m.get("key") == key and all(exists(f) for f in files):
+                return PreparedReceptor(name, path, out_dir, *files, n_fitting_points=m["n_fitting_points"],
+                                        n_constraints=m["n_constraints"], cached=True, error=None)
+
+        if not exists(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+
+        with HotspotReader(path) as reader:
+            protein = reader.protein
+            # copied out of the (possibly extracted) result before it is cleaned up
+            grids = {p: GridData(np.array(g.array), g.origin, g.spacing) for p, g in reader.read_arrays().items()}
+        if "apolar" not in grids:
+            raise ValueError("{} has no apolar grid".format(path))
+
+        # as `hotspots.result.Results._docking_constraint_atoms`: hydrogens without neighbours are re-added
+        if any(len(a.neighbours) == 0 for a in protein.atoms if a.atomic_number == 1):
+            print("WARNING HYDROGENS READDED THIS MAY CAUSE ISSUES")
+            protein.add_hydrogens()
+        atoms = atom_table(protein)
+
+        apolar = grids["apolar"]
+        if self.settings.fitting_mode == "bcv":
+            apolar = best_volume(grids, protein, volume=self.settings.fitting_volume)["apolar"]
+        coordinates, scores = fitting_points(apolar, threshold=self.settings.fitting_threshold)
+        constraints = constraint_atoms(grids, atoms, self.settings)
+
+        files = [join(out_dir, f) for f in ("protein.mol2", "fit_pts.mol2", "constraints.dat", "atom_scores.npy")]
+        with io.MoleculeWriter(files[0]) as w:
+            w.write(protein)
+        write_fitting_points(files[1], coordinates, scores)
+        with open(files[2], "wb") as f:
+            pickle.dump(constraints, f)
+        np.save(files[3], atom_scores(grids, atoms))
+
+        # written last, so an interrupted preparation is redone
+        m = {"key": key, "path": abspath(path), "protein_file": files[0], "fitting_points_file": files[1],
+             "constraints_file": files[2], "scores_file": files[3], "n_fitting_points": len(scores),
+             "n_constraints": len(constraints)}
+        with open(manifest + ".part", "w") as f:
+            json.dump(m, f, indent=2)
+        os.replace(manifest + ".part", manifest)
+
+        return PreparedReceptor(name, path, out_dir, *files, n_fitting_points=len(scores),
+                                n_constraints=len(constraints), cached=False, error=None)
+
+    def prepare_all(self, results, out_dir, nprocesses=None):
+        """
+        prepares many receptors in a process pool, each in <out_dir>/<name>
+
+        :param results: dict, {name: path to result}, or a list of paths named by their file names
+        :param str out_dir: output directory
+        :param int nprocesses: number of worker processes (default: one per CPU)
+        :return: list of :class:`hotspots.hs_docking_prep.PreparedReceptor`, in the order of `results`
+        """
+        if not isinstance(results, dict):
+            names = [splitext(basename(p.rstrip("/")))[0] for p in results]
+            if len(set(names)) != len(names):
+                raise ValueError("results have duplicate names, name them with a dict")
+            results = OrderedDict(zip(names, results))
+
+        jobs = [(self.settings, name, path, join(out_dir, name)) for name, path in results.items()]
+        nprocesses = min(nprocesses or os.cpu_count() or 1, max(len(jobs), 1))
+        if nprocesses <= 1:
+            records = [_prepare(job) for job in jobs]
+        else:
+            with futures.ProcessPoolExecutor(max_workers=nprocesses) as executor:
+                records = list(executor.map(_prepare, jobs))
+
+        for r in records:
+            if not r.success:
+                print("WARNING: {} failed ({})".format(r.name, r.error))
+        return records
@@ -0,0 +1,421 @@
+"""
+The :mod:`hotspots.hs_ensemble` module builds ensemble Fragment Hotspot Maps from many structures, for example the
+frames of a molecular dynamics trajectory.
+
+Unlike :meth:`hotspots.result.Results.from_grid_ensembles`, the per-frame results are never held together in memory.
+Each frame is calculated (or read from a result archive) in a worker process, its probe grids are placed onto a single
+fixed frame and folded into per-point running statistics stored in memory-mapped arrays. Peak memory is therefore
+bounded by the frames in flight plus the accumulators, regardless of the number of frames.
+
+The statistics available for each probe are:
+
+- max, mean and standard deviation
+- frequency, the fraction of frames scoring above a threshold
+- approximate percentiles, from a fixed-bin histogram kept for every point
+
+The main classes of the :mod:`hotspots.hs_ensemble` module are:
+
+- :class:`hotspots.hs_ensemble.EnsembleRunner`
+
+Structures must be aligned by the binding site of interest before the calculation.
+"""
+from __future__ import print_function, division
+
+import shutil
+import tempfile
+from concurrent import futures
+from itertools import islice
+from os.path import join, splitext
+
+import numpy as np
+from ccdc.protein import Protein
+
+from hotspots.grid_extension import Grid, _lattice_index
+from hotspots.result import Results
+
+
+def _frame_arrays(args):
+    """
+    worker: produces the probe grids of one frame as numpy arrays
+
+    :param tup args: (source, kind, probes, kwargs), kwargs are the runner arguments, or {"identifier": ...} for
+                     results
+    :return: dict, {probe: (origin, spacing, `numpy.array`)}
+    """
+    source, kind, probes, runner_kwargs = args
+    if kind == "result":
+        from hotspots.hs_io import HotspotReader
+        with HotspotReader(source) as reader:
+            hr = reader.read(identifier=runner_kwargs["identifier"])
+        if isinstance(hr, list):
+            raise ValueError("{} holds {} results, choose one with `identifier`".format(source, len(hr)))
+    else:
+        from hotspots.calculation import Runner
+        protein = Protein.from_file(source)
+        hr = Runner().from_protein(protein, **runner_kwargs)
+
+    out = {}
+    for p in probes:
+        g = hr.super_grids.get(p)
+        if g is None:
+            continue
+        out[p] = (tuple(g.bounding_box[0]), g.spacing, g.get_array().astype(np.float32))
+    return out
+
+
+class _MemmapAccumulator(object):
+    """
+    Running per-point statistics for one probe on a fixed frame, held in memory-mapped .npy files
+
+    :param str directory: scratch directory for the arrays
+    :param str name: prefix for the array files
+    :param tup origin_index: frame origin in grid steps (origin / spacing)
+    :param tup shape: frame shape (nx, ny, nz)
+    :param `hotspots.hs_ensemble.EnsembleRunner.Settings` settings: histogram and threshold settings
+    """
+    def __init__(self, directory, name, origin_index, shape, settings):
+        self.origin_index = np.asarray(origin_index, dtype=int)
+        self.shape = tuple(int(s) for s in shape)
+        self.settings = settings
+        self.n = 0
+        self.clipped = 0
+
+        def _open(label, dtype, shape=self.shape):
+            return np.lib.format.open_memmap(join(directory, "{}_{}.npy".format(name, label)),
+                                             mode="w+", dtype=dtype, shape=shape)
+
+        self.max = _open("max", np.float32)
+        self.mean = _open("mean", np.float64)
+        self.m2 = _open("m2", np.float64)
+        self.nonzero = _open("nonzero", np.uint32)
+        self.above = _open("above", np.uint32)
+        self.histogram = _open("histogram", np.uint32, shape=self.shape + (settings.nbins,))
+
+    @property
+    def bin_width(self):
+        return float(self.settings.max_score) / self.settings.nbins
+
+    def add_array(self, array, origin_index):
+        """
+        folds one frame into the statistics. Points outside the fixed frame are dropped (and counted in `clipped`).
+
+        :param `numpy.array` array: grid values
+        :param tup origin_index: origin of `array` in grid steps
+        :return:
+        """
+        start = np.asarray(origin_index, dtype=int) - self.origin_index
+        src = []
+        dst = []
+        for s, n, m in zip(start, array.shape, self.shape):
+            lo = max(int(s), 0)
+            hi = min(int(s) + n, m)
+            if hi <= lo:
+                lo = hi = 0
+            dst.append(slice(lo, hi))
+            src.append(slice(lo - int(s), hi - int(s)))
+        src = tuple(src)
+        dst = tuple(dst)
+
+        window = array[src]
+        self.clipped += int(np.count_nonzero(array)) - int(np.count_nonzero(window))
+        self.n += 1
+
+        # Welford's update; every point outside this frame's box sees a zero
+        delta = -self.mean
+        delta[dst] += window
+        self.mean += delta / self.n
+        resid = -self.mean
+        resid[dst] += window
+        self.m2 += delta * resid
+
+        np.maximum(self.max[dst], window, out=self.max[dst])
+        hits = window.nonzero()
+        self.nonzero[dst][hits] += 1
+        self.above[dst] += (window >= self.settings.frequency_threshold).astype(np.uint32)
+
+        bins = np.clip((window[hits] / self.bin_width).astype(int), 0, self.settings.nbins - 1)
+        offset = [d.start for d in dst]
+        self.histogram[hits[0] + offset[0], hits[1] + offset[1], hits[2] + offset[2], bins] += 1
+
+    def percentile(self, q):
+        """
+        approximate percentile of each point across the ensemble, interpolated within the histogram bins.
+        Frames in which the point scored zero are included.
+
+        :param float q: percentile, 0-100
+        :return: `numpy.array`
+        """
+        out = np.zeros(self.shape, dtype=np.float32)
+        if self.n == 0:
+            return out
+        target = q / 100. * self.n
+        width = self.bin_width
+        # work slab by slab so only one x-plane of the histogram is expanded at a time
+        for i in range(self.shape[0]):
+            zeros = self.n - self.nonzero[i].astype(np.float64)
+            rest = target - zeros
+            hist = np.asarray(self.histogram[i], dtype=np.float64)
+            cum = np.cumsum(hist, axis=-1)
+            idx = np.argmax(cum >= rest[..., None], axis=-1)
+            in_bin = np.take_along_axis(hist, idx[..., None], axis=-1)[..., 0]
+            before = np.take_along_axis(cum, idx[..., None], axis=-1)[..., 0] - in_bin
+            frac = np.where(in_bin > 0, (rest - before) / np.maximum(in_bin, 1), 0)
+            value = (idx + np.clip(frac, 0, 1)) * width
+            out[i] = np.where(rest > 0, value, 0)
+        return out
+
+    def statistic(self, mode):
+        """
+        :param str mode: "max", "mean", "std", "frequency" or "p<q>" (e.g. "p90")
+        :return: `numpy.array`
+        """
+        if mode == "max":
+            return np.array(self.max)
+        elif mode == "mean":
+            return np.array(self.mean)
+        elif mode == "std":
+            return np.sqrt(self.m2 / max(self.n, 1))
+        elif mode == "frequency":
+            return self.above / float(max(self.n, 1))
+        elif mode.startswith("p"):
+            return self.percentile(float(mode[1:]))
+        else:
+            raise ValueError("Unrecognised mode: {}".format(mode))
+
+
+class EnsembleRunner(object):
+    """
+    A class for calculating ensemble Fragment Hotspot Maps out-of-core
+
+    >>> from hotspots.hs_ensemble import EnsembleRunner
+
+    >>> frames = ["<path_to_frame_0.pdb>", "<path_to_frame_1.pdb>", ...]
+    >>> with EnsembleRunner() as ensemble:
+    ...     ensemble.from_proteins(frames, nprocesses=8)
+    ...     result = ensemble.result(mode="max")
+    ...     p90 = ensemble.result(mode="p90")
+
+    """
+
+    class Settings(object):
+        """
+        adjusts the default settings for the ensemble
+
+        :param float spacing: grid spacing of the fixed frame, must match the hotspot maps
+        :param float padding: padding (Angstroms) added around the frame when it is taken from the first frame
+        :param float frequency_threshold: score a point must reach in a frame to count towards "frequency"
+        :param float max_score: upper edge of the percentile histogram, larger scores fall in the top bin
+        :param int nbins: number of histogram bins
+        :param str scratch_dir: directory for the memory-mapped accumulators, a temporary directory by default
+        """
+        def __init__(self, spacing=0.5, padding=4., frequency_threshold=14, max_score=50., nbins=50,
+                     scratch_dir=None):
+            self.spacing = spacing
+            self.padding = padding
+            self.frequency_threshold = frequency_threshold
+            self.max_score = max_score
+            self.nbins = nbins
+            self.scratch_dir = scratch_dir
+
+    def __init__(self, settings=None, probes=("apolar", "donor", "acceptor")):
+        if settings is None:
+            settings = self.Settings()
+        self.settings = settings
+        self.probes = list(probes)
+        self.protein = None
+        self.accumulators = {}
+        self._origin_index = None
+        self._shape = None
+        self._scratch = None
+        self._own_scratch = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        releases the accumulators and removes the scratch directory if it was created here
+        :return:
+        """
+        self.accumulators = {}
+        if self._own_scratch and self._scratch is not None:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+            self._scratch = None
+
+    @property
+    def nframes(self):
+        if not self.accumulators:
+            return 0
+        return list(self.accumulators.values())[0].n
+
+    def set_frame(self, origin, far_corner):
+        """
+        fixes the frame every grid is placed onto
+
+        :param tup origin: (float(x), float(y), float(z))
+        :param tup far_corner: (float(x), float(y), float(z))
+        :return:
+        """
+        if self.accumulators:
+            raise RuntimeError("The frame cannot be changed once frames have been accumulated")
+        gs = self.settings.spacing
+        lo = np.array([int(np.floor(round(o / gs, 6))) for o in origin])
+        hi = np.array([int(np.ceil(round(f / gs, 6))) for f in far_corner])
+        self._origin_index = lo
+        self._shape = tuple(hi - lo + 1)
+
+    def _frame_from_arrays(self, arrays):
+        gs = self.settings.spacing
+        origins = []
+        far_corners = []
+        for origin, _, array in arrays.values():
+            origins.append(origin)
+            far_corners.append([o + (n - 1) * gs for o, n in zip(origin, array.shape)])
+        pad = self.settings.padding
+        self.set_frame(np.min(origins, axis=0) - pad, np.max(far_corners, axis=0) + pad)
+
+    def _init_accumulators(self):
+        if self.settings.scratch_dir is None:
+            self._scratch = tempfile.mkdtemp()
+            self._own_scratch = True
+        else:
+            self._scratch = self.settings.scratch_dir
+        self.accumulators = {p: _MemmapAccumulator(self._scratch, p, self._origin_index, self._shape, self.settings)
+                             for p in self.probes}
+
+    def _add(self, arrays):
+        gs = self.settings.spacing
+        # every grid is checked before any is folded in, so a rejected frame leaves the statistics untouched
+        origin_indices = {}
+        for p, (origin, spacing, _) in arrays.items():
+            if abs(spacing - gs) > 1e-6:
+                raise ValueError("Grid spacing {} does not match ensemble spacing {}".format(spacing, gs))
+            origin_indices[p] = _lattice_index(origin, gs)
+
+        if self._origin_index is None:
+            self._frame_from_arrays(arrays)
+        if not self.accumulators:
+            self._init_accumulators()
+        for p, acc in self.accumulators.items():
+            if p in arrays:
+                acc.add_array(arrays[p][2], origin_indices[p])
+            else:
+                acc.add_array(np.zeros((0, 0, 0), dtype=np.float32), acc.origin_index)
+
+    @staticmethod
+    def _map(jobs, nprocesses):
+        """
+        runs the jobs, yielding results as they complete. At most 2 * nprocesses frames are in flight.
+        """
+        if nprocesses <= 1:
+            for job in jobs:
+                yield _frame_arrays(job)
+            return
+
+        jobs = iter(jobs)
+        with futures.ProcessPoolExecutor(max_workers=nprocesses) as executor:
+            pending = set(executor.submit(_frame_arrays, job) for job in islice(jobs, 2 * nprocesses))
+            while pending:
+                done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for f in done:
+                    for job in islice(jobs, 1):
+                        pending.add(executor.submit(_frame_arrays, job))
+                    yield f.result()
+
+    def _run(self, sources, kind, nprocesses, runner_kwargs):
+        jobs = ((s, kind, self.probes, runner_kwargs) for s in sources)
+        for i, arrays in enumerate(self._map(jobs, nprocesses)):
+            self._add(arrays)
+            print("Accumulated frame {}".format(i + 1))
+
+        clipped = sum(acc.clipped for acc in self.accumulators.values())
+        if clipped:
+            print("WARNING! {} nonzero grid points fell outside the ensemble frame".format(clipped))
+        return self
+
+    def from_proteins(self, paths, nprocesses=1, charged_probes=False, probe_size=7, buriedness_method='ghecom',
+                      cavities=None, settings=None):
+        """
+        calculates a hotspot map for every frame and accumulates the statistics
+
+        :param paths: iterable of paths to the protein file of each (pre-aligned) frame
+        :param int nprocesses: number of frames calculated concurrently
+        :param bool charged_probes: If True include positive and negative probes
+        :param int probe_size: Size of probe in number of heavy atoms (3-8 atoms)
+        :param str buriedness_method: Either 'ghecom' or 'ligsite'
+        :param cavities: coordinates of the cavity (or cavities) to run on, shared by every frame
+        :param `hotspots.calculation.Runner.Settings` settings: sampler settings used for each frame
+        :return: self
+        """
+        paths = iter(paths)
+        first = next(paths)
+        self.protein = Protein.from_file(first)
+        if charged_probes:
+            self.probes = list(set(self.probes) | {"positive", "negative"})
+        runner_kwargs = {"charged_probes": charged_probes,
+                         "probe_size": probe_size,
+                         "buriedness_method": buriedness_method,
+                         "cavities": cavities,
+                         "nprocesses": 1,
+                         "settings": settings}
+
+        def _all():
+            yield first
+            for p in paths:
+                yield p
+
+        return self._run(_all(), "protein", nprocesses, runner_kwargs)
+
+    def from_results(self, paths, nprocesses=1, identifier=None):
+        """
+        accumulates the statistics from precomputed result archives (as written by `hotspots.hs_io.HotspotWriter`)
+
+        :param paths: iterable of paths to result directories or .zip archives
+        :param int nprocesses: number of archives read concurrently
+        :param str identifier: for archives holding several results, the subdirectory to read from each archive
+        :return: self
+        """
+        paths = iter(paths)
+        first = next(paths)
+        if splitext(first)[1] != ".zip":
+            from hotspots.hs_io import HotspotReader
+            self.protein = HotspotReader(first).protein
+
+        def _all():
+            yield first
+            for p in paths:
+                yield p
+
+        self._run(_all(), "result", nprocesses, {"identifier": identifier})
+        if self.protein is None:
+            from hotspots.hs_io import HotspotReader
+            with HotspotReader(first) as reader:
+                self.protein = reader.protein
+        return self
+
+    def grid(self, probe, mode="max"):
+        """
+        :param str probe: probe type
+        :param str mode: "max", "mean", "std", "frequency" or "p<q>" for the q-th percentile (e.g. "p90")
+        :return: `hotspots.grid_extension.Grid`
+        """
+        gs = self.settings.spacing
+        origin = [float(i) * gs for i in self._origin_index]
+        far_corner = [float(i + n - 1) * gs for i, n in zip(self._origin_index, self._shape)]
+        blank = Grid(origin=origin, far_corner=far_corner, spacing=gs, default=0.0, _grid=None)
+        return Grid.array_to_grid(self.accumulators[probe].statistic(mode), blank)
+
+    def result(self, mode="max"):
+        """
+        the ensemble map as a Fragment Hotspot Map result
+
+        :param str mode: see :meth:`hotspots.hs_ensemble.EnsembleRunner.grid`
+        :return: a :class:`hotspots.result.Results` instance
+        """
+        if not self.accumulators:
+            raise RuntimeError("No frames have been accumulated")
+        return Results(super_grids={p: self.grid(p, mode) for p in self.accumulators},
+                       protein=self.protein)
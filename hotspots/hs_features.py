@@ -0,0 +1,359 @@
+"""
+The :mod:`hotspots.hs_features` module holds interaction features in a compact, columnar form.
+
+A :class:`hotspots.hs_features.FeatureTable` stores one row per feature in NumPy arrays (type, coordinates, projected
+coordinates, score, count, rank and the result the feature came from). Thousands of results can be mined without
+keeping island grids or feature objects alive, and tables can be filtered, ranked, concatenated and saved in bulk.
+Indexing a single row gives a light-weight view with the attributes of the feature classes in
+:mod:`hotspots.result` and :mod:`hotspots.hs_pharmacophore`.
+
+The main class of the :mod:`hotspots.hs_features` module is:
+
+- :class:`hotspots.hs_features.FeatureTable`
+
+>>> from hotspots.hs_features import FeatureTable
+
+>>> table = FeatureTable.concatenate([r.feature_table() for r in results])
+>>> donors = table.select(feature_type="donor", min_score=14)
+>>> best = donors.ranked()[:10]
+>>> best.save("donors.npz")
+"""
+from __future__ import print_function, division
+
+import collections
+import csv
+
+import numpy as np
+
+Coordinates = collections.namedtuple('Coordinates', ['x', 'y', 'z'])
+
+FEATURE_TYPES = ("apolar", "donor", "acceptor", "negative", "positive")
+
+
+class _FeatureView(object):
+    """
+    private class
+
+    a single row of a :class:`hotspots.hs_features.FeatureTable`
+    """
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __repr__(self):
+        return "_FeatureView({}, {:.2f})".format(self.feature_type, self.score_value)
+
+    @property
+    def feature_type(self):
+        return FEATURE_TYPES[self._table.type_codes[self._index]]
+
+    @property
+    def feature_coordinates(self):
+        return Coordinates(*self._table.coordinates[self._index].tolist())
+
+    @property
+    def projected(self):
+        return bool(not np.isnan(self._table.projected_coordinates[self._index, 0]))
+
+    @property
+    def projected_coordinates(self):
+        if not self.projected:
+            return None
+        return Coordinates(*self._table.projected_coordinates[self._index].tolist())
+
+    @property
+    def projected_identifier(self):
+        return self._table.projected_identifier[self._index] or None
+
+    @property
+    def vector(self):
+        if not self.projected:
+            return None
+        return Coordinates(*(self._table.projected_coordinates[self._index] -
+                             self._table.coordinates[self._index]).tolist())
+
+    @property
+    def score_value(self):
+        return float(self._table.score[self._index])
+
+    @property
+    def count(self):
+        return int(self._table.count[self._index])
+
+    @property
+    def rank(self):
+        rank = int(self._table.rank[self._index])
+        return rank if rank > 0 else None
+
+    @property
+    def source(self):
+        return self._table.sources[self._table.source[self._index]]
+
+
+class FeatureTable(object):
+    """
+    A columnar table of interaction features
+
+    :param feature_type: sequence of feature type names (see `FEATURE_TYPES`) or of their integer codes
+    :param coordinates: (n, 3) feature coordinates
+    :param score: (n,) feature scores
+    :param projected_coordinates: (n, 3) coordinates of the hydrogen bonding partner, NaN for unprojected features
+    :param projected_identifier: (n,) identifier of the hydrogen bonding partner, "" for unprojected features
+    :param count: (n,) number of grid points in the feature, 0 if unknown
+    :param rank: (n,) rank of the feature, 0 if unranked
+    :param source: (n,) index into `sources` of the result each feature came from
+    :param list sources: identifiers of the source results
+    """
+
+    def __init__(self, feature_type, coordinates, score, projected_coordinates=None, projected_identifier=None,
+                 count=None, rank=None, source=None, sources=None):
+        codes = np.asarray(feature_type)
+        if codes.dtype.kind in "US":
+            codes = np.array([FEATURE_TYPES.index(t) for t in codes.tolist()], dtype=np.uint8)
+        self.type_codes = codes.astype(np.uint8).reshape(-1)
+        n = len(self.type_codes)
+
+        self.coordinates = np.asarray(coordinates, dtype=np.float32).reshape(n, 3)
+        self.score = np.asarray(score, dtype=np.float32).reshape(n)
+
+        if projected_coordinates is None:
+            projected_coordinates = np.full((n, 3), np.nan)
+        self.projected_coordinates = np.asarray(projected_coordinates, dtype=np.float32).reshape(n, 3)
+
+        if projected_identifier is None:
+            projected_identifier = [""] * n
+        self.projected_identifier = np.asarray(projected_identifier, dtype=object).reshape(n)
+
+        self.count = np.zeros(n, dtype=np.int32) if count is None else np.asarray(count, dtype=np.int32).reshape(n)
+        self.rank = np.zeros(n, dtype=np.int32) if rank is None else np.asarray(rank, dtype=np.int32).reshape(n)
+        self.source = np.zeros(n, dtype=np.int32) if source is None else np.asarray(source, dtype=np.int32).reshape(n)
+        self.sources = list(sources) if sources is not None else [None]
+
+    def __len__(self):
+        return len(self.type_codes)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield _FeatureView(self, i)
+
+    def __getitem__(self, item):
+        """
+        an int gives a single feature view, a slice, index array or boolean mask gives a new table
+        """
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError("feature index out of range")
+            return _FeatureView(self, int(item))
+        return FeatureTable(self.type_codes[item],
+                            self.coordinates[item],
+                            self.score[item],
+                            projected_coordinates=self.projected_coordinates[item],
+                            projected_identifier=self.projected_identifier[item],
+                            count=self.count[item],
+                            rank=self.rank[item],
+                            source=self.source[item],
+                            sources=self.sources)
+
+    def __repr__(self):
+        return "FeatureTable({} features, {} sources)".format(len(self), len(self.sources))
+
+    @property
+    def feature_types(self):
+        """
+        feature type name of each row
+        :return: `numpy.array` of str
+        """
+        return np.array(FEATURE_TYPES)[self.type_codes]
+
+    @property
+    def nbytes(self):
+        """
+        memory held by the numeric columns
+        :return: int, bytes
+        """
+        return sum(a.nbytes for a in (self.type_codes, self.coordinates, self.score, self.projected_coordinates,
+                                      self.count, self.rank, self.source))
+
+    @staticmethod
+    def from_features(features, source=None):
+        """
+        builds a table from feature objects, e.g. `hotspots.result.Results._HotspotFeature` or
+        `hotspots.hs_pharmacophore._PharmacophoreFeature`
+
+        :param list features: feature objects
+        :param str source: identifier of the result the features came from
+        :return: :class:`hotspots.hs_features.FeatureTable`
+        """
+        features = list(features)
+        n = len(features)
+        projected = np.full((n, 3), np.nan)
+        identifiers = []
+        counts = []
+        ranks = []
+        for i, f in enumerate(features):
+            p = getattr(f, "projected_coordinates", None)
+            if p is not None:
+                projected[i] = tuple(p)
+            identifiers.append(getattr(f, "projected_identifier", None) or "")
+            counts.append(getattr(f, "count", None) or 0)
+            ranks.append(getattr(f, "rank", None) or 0)
+
+        return FeatureTable([f.feature_type for f in features],
+                            np.array([tuple(f.feature_coordinates) for f in features]).reshape(n, 3),
+                            [float(f.score_value) for f in features],
+                            projected_coordinates=projected,
+                            projected_identifier=identifiers,
+                            count=counts,
+                            rank=ranks,
+                            sources=[source])
+
+    @staticmethod
+    def concatenate(tables):
+        """
+        joins tables, keeping track of the source of each feature
+
+        :param list tables: :class:`hotspots.hs_features.FeatureTable` instances
+        :return: :class:`hotspots.hs_features.FeatureTable`
+        """
+        tables = list(tables)
+        sources = []
+        source_columns = []
+        for t in tables:
+            source_columns.append(t.source + len(sources))
+            sources.extend(t.sources)
+
+        def _join(column, empty):
+            if not tables:
+                return empty
+            return np.concatenate([getattr(t, column) for t in tables])
+
+        return FeatureTable(_join("type_codes", np.zeros(0, dtype=np.uint8)),
+                            _join("coordinates", np.zeros((0, 3))),
+                            _join("score", np.zeros(0)),
+                            projected_coordinates=_join("projected_coordinates", np.zeros((0, 3))),
+                            projected_identifier=_join("projected_identifier", np.zeros(0, dtype=object)),
+                            count=_join("count", np.zeros(0)),
+                            rank=_join("rank", np.zeros(0)),
+                            source=np.concatenate(source_columns) if tables else np.zeros(0),
+                            sources=sources or [None])
+
+    def select(self, feature_type=None, min_score=None, source=None):
+        """
+        bulk filter
+
+        :param feature_type: a feature type name, or a list of names
+        :param float min_score: only features scoring above this value are kept
+        :param str source: only features from this source are kept
+        :return: :class:`hotspots.hs_features.FeatureTable`
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if feature_type is not None:
+            if isinstance(feature_type, str):
+                feature_type = [feature_type]
+            mask &= np.isin(self.type_codes, [FEATURE_TYPES.index(t) for t in feature_type])
+        if min_score is not None:
+            mask &= self.score > min_score
+        if source is not None:
+            mask &= np.isin(self.source, [i for i, s in enumerate(self.sources) if s == source])
+        return self[mask]
+
+    def ranked(self, per_source=False):
+        """
+        sorts by descending score and sets the rank column (1 = best). Features with equal scores keep their order
+        and each get their own rank.
+
+        :param bool per_source: rank the features of each source separately
+        :return: :class:`hotspots.hs_features.FeatureTable`
+        """
+        if per_source:
+            order = np.lexsort((-self.score, self.source))
+        else:
+            order = np.argsort(-self.score, kind="stable")
+        table = self[order]
+        if per_source and len(table):
+            starts = np.r_[0, np.flatnonzero(np.diff(table.source)) + 1]
+            first = np.repeat(starts, np.diff(np.r_[starts, len(table)]))
+            table.rank = (np.arange(len(table)) - first + 1).astype(np.int32)
+        else:
+            table.rank = np.arange(1, len(table) + 1, dtype=np.int32)
+        return table
+
+    def top(self, max_features=4, min_score=None, force_apolar=True):
+        """
+        the best features, as used to build a pharmacophore
+
+        :param int max_features: maximum number of features returned
+        :param float min_score: only features above this value are considered
+        :param bool force_apolar: ensures the best apolar feature is included
+        :return: :class:`hotspots.hs_features.FeatureTable`
+        """
+        table = self.ranked()
+        if not force_apolar:
+            return table.select(min_score=min_score)[:max_features]
+
+        apolar = table.type_codes == FEATURE_TYPES.index("apolar")
+        best_apolar = np.flatnonzero(apolar)[:1]
+        others = table[~apolar].select(min_score=min_score)[:max(max_features - len(best_apolar), 0)]
+        return FeatureTable.concatenate([others, table[best_apolar]])
+
+    def to_dict(self):
+        """
+        :return: dict of columns, as stored by `save`
+        """
+        return {"feature_type": self.type_codes,
+                "coordinates": self.coordinates,
+                "score": self.score,
+                "projected_coordinates": self.projected_coordinates,
+                "projected_identifier": self.projected_identifier.astype(str),
+                "count": self.count,
+                "rank": self.rank,
+                "source": self.source,
+                "sources": np.array(["" if s is None else str(s) for s in self.sources])}
+
+    def save(self, fname):
+        """
+        writes the table as a compressed NumPy archive (.npz)
+
+        :param str fname: path to output file
+        :return:
+        """
+        np.savez_compressed(fname, **self.to_dict())
+
+    @staticmethod
+    def load(fname):
+        """
+        reads a table written by `save`
+
+        :param str fname: path to a .npz file
+        :return: :class:`hotspots.hs_features.FeatureTable`
+        """
+        with np.load(fname, allow_pickle=False) as data:
+            return FeatureTable(data["feature_type"],
+                                data["coordinates"],
+                                data["score"],
+                                projected_coordinates=data["projected_coordinates"],
+                                projected_identifier=data["projected_identifier"].tolist(),
+                                count=data["count"],
+                                rank=data["rank"],
+                                source=data["source"],
+                                sources=[s or None for s in data["sources"].tolist()])
+
+    def write_csv(self, fname):
+        """
+        writes one row per feature
+
+        :param str fname: path to output file
+        :return:
+        """
+        with open(fname, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["source", "feature_type", "x", "y", "z", "score", "count", "rank",
+                             "projected_identifier", "projected_x", "projected_y", "projected_z"])
+            for i, t in enumerate(self.feature_types):
+                writer.writerow([self.sources[self.source[i]], t] + self.coordinates[i].tolist() +
+                                [float(self.score[i]), int(self.count[i]), int(self.rank[i]),
+                                 self.projected_identifier[i]] + self.projected_coordinates[i].tolist())
@@ -13,18 +13,26 @@ The main classes of the :mod:`hotspots.io` module are:
 
 - :class:`hotspots.io.HotspotWriter`
 - :class:`hotspots.io.HotspotReader`
+- :class:`hotspots.io.HotspotIndex`
 
 """
 from __future__ import print_function
 
+import hashlib
+import json
 import shutil
+import sqlite3
 import tempfile
+import time
 import zipfile
+from collections import OrderedDict
 from os import listdir
-from os.path import splitext, join, basename, dirname, isdir
+from os.path import splitext, join, basename, dirname, isdir, abspath
 
+import numpy as np
 from ccdc import io
 from ccdc.protein import Protein
+from hotspots import grid_io
 from hotspots.grid_extension import Grid
 from hotspots.result import Results
 from hotspots.hs_utilities import Helper
@@ -42,6 +50,7 @@ class HotspotWriter(Helper):
     :param str grid_extension: ".grd", ".ccp4" and ".acnt" supported
     :param bool zip_results: If True, the result directory will be compressed. (recommended)
     :param `hotspots.hs_io.HotspotWriter.Settings` settings: settings
+    :param index: path to a SQLite database or :class:`hotspots.hs_io.HotspotIndex`, updated with every result written
     """
 
     class Settings(object):
@@ -65,7 +74,8 @@ class HotspotWriter(Helper):
             self.pharmacophore_format = [".py"]
             self.container = 'out'
 
-    def __init__(self, path, visualisation="pymol", grid_extension=".grd", zip_results=True, settings=None):
+    def __init__(self, path, visualisation="pymol", grid_extension=".grd", zip_results=True, settings=None,
+                 index=None):
         if settings is None:
             self.settings = self.Settings()
         else:
@@ -86,6 +96,7 @@ class HotspotWriter(Helper):
 
         self.path = self.get_out_dir(path)
         self.zipped = zip_results
+        self.index = index
 
     def __enter__(self):
         return self
@@ -142,6 +153,7 @@ class HotspotWriter(Helper):
             self.out_dir = dirname(self.out_dir)
             if self.zipped:
                 self.compress(join(dirname(self.out_dir), self.settings.container))
+            self._update_index(hr, entries=[str(i) for i in range(len(hr))])
 
         else:
             self.settings.grids = list(hr.super_grids.keys())
@@ -159,6 +171,31 @@ class HotspotWriter(Helper):
 
             if self.zipped:
                 self.compress(join(dirname(self.out_dir), self.settings.container))
+            self._update_index([hr], entries=[None])
+
+    def _update_index(self, hrs, entries):
+        """
+        adds the written results to the index
+        :param list hrs: `hotspots.result.Results` instances
+        :param list entries: subdirectory of each result
+        :return:
+        """
+        if self.index is None:
+            return
+        if self.zipped:
+            location = abspath("{}.zip".format(join(dirname(self.out_dir), self.settings.container)))
+        else:
+            location = abspath(self.out_dir)
+
+        index = self.index if isinstance(self.index, HotspotIndex) else HotspotIndex(self.index)
+        try:
+            # a rewrite may hold fewer results than before, drop every entry of the archive first
+            index.remove(location)
+            for hr, entry in zip(hrs, entries):
+                index.add(location, hr, entry=entry)
+        finally:
+            if index is not self.index:
+                index.close()
 
     def _write_grids(self, grid_dict, buriedness=None, mesh=None, out_dir=None):
         """
@@ -312,7 +349,8 @@ class HotspotReader(object):
         self._path = path
 
         ext = splitext(self._path)[1]
-        if ext == ".zip":
+        self._extracted = ext == ".zip"
+        if self._extracted:
             self._base = self._path_from_zip()
         else:
             self._base = path
@@ -334,10 +372,15 @@ class HotspotReader(object):
         return self
 
     def __exit__(self, type, value, traceback):
-        try:
-            shutil.rmtree(self._base)
-        except:
-            pass
+        self._clean_up()
+
+    def _clean_up(self):
+        """
+        removes the temporary directory if the result was extracted from a .zip archive
+        :return:
+        """
+        if self._extracted:
+            shutil.rmtree(self._base, ignore_errors=True)
 
     def _path_from_zip(self):
         """
@@ -366,13 +409,23 @@ class HotspotReader(object):
             base = self._base
 
         if ".dat" in self._extensions:
-            grid_dic = {splitext(fname)[0]: Grid.from_array(join(base, fname))
+            # arrays are placed on the frame of the grid file of the same name, if there is one
+            def from_dat(name):
+                origin, spacing = (0., 0., 0.), 0.5
+                for ext in self._supported_grids:
+                    if ext != ".dat" and name + ext in self._files:
+                        frame = grid_io.read(join(base, name + ext))
+                        origin, spacing = frame.origin, frame.spacing
+                        break
+                return Grid.from_array(join(base, name + ".dat"), origin=origin, spacing=spacing)
+
+            grid_dic = {splitext(fname)[0]: from_dat(splitext(fname)[0])
                         for fname in [f for f in self._files
-                                      if splitext(f)[1] == ".grd"
+                                      if splitext(f)[1] == ".dat"
                                       and splitext(f)[0] in self._supported_interactions]}
-            try:
-                buriedness = Grid.from_array(join(self.base, "buriedness.dat"))
-            except RuntimeError:
+            if "buriedness.dat" in self._files:
+                buriedness = from_dat("buriedness")
+            else:
                 buriedness = None
 
         else:
@@ -383,7 +436,7 @@ class HotspotReader(object):
                                           if splitext(f)[1] == ext[0]
                                           and splitext(f)[0] in self._supported_interactions]}
                 try:
-                    buriedness = Grid.from_file("buriedness{}".format(ext[0]))
+                    buriedness = Grid.from_file(join(base, "buriedness{}".format(ext[0])))
                 except RuntimeError:
                     buriedness = None
             else:
@@ -391,6 +444,31 @@ class HotspotReader(object):
 
         return grid_dic, buriedness
 
+    def read_arrays(self, identifier=None):
+        """
+        reads the grids of a result with :mod:`hotspots.grid_io`, without constructing `ccdc` grids. CCP4 grids are
+        memory-mapped.
+
+        :param str identifier: for directories containing multiple Fragment Hotspot Map results, the subdirectory to
+                               read
+
+        :return: dict, {probe or "buriedness": :class:`hotspots.grid_io.GridData`}
+
+        >>> from hotspots.hs_io import HotspotReader
+
+        >>> with HotspotReader("out.zip") as reader:
+        >>>     arrays = reader.read_arrays()
+        >>>     apolar_max = arrays["apolar"].array.max()
+        """
+        base = join(self._base, str(identifier)) if identifier else self._base
+        names = self._supported_interactions + ["buriedness"]
+        grids = {}
+        for fname in sorted(listdir(base)):
+            name, ext = splitext(fname)
+            if name in names and ext in grid_io.READERS and name not in grids:
+                grids[name] = grid_io.read(join(base, fname))
+        return grids
+
     def read(self, identifier=None):
         """
         creates a single or list of :class:`hotspots.result.Result` instance(s)
@@ -409,7 +487,7 @@ class HotspotReader(object):
         """
         if len(self.hs_dir) == 0:
             self.grid_dic, self.buriedness = self._get_grids()
-            shutil.rmtree(self._base)
+            self._clean_up()
             return Results(protein=self.protein,
                            super_grids=self.grid_dic,
                            buriedness=self.buriedness)
@@ -428,5 +506,254 @@ class HotspotReader(object):
                                        super_grids=self.grid_dic,
                                        buriedness=self.buriedness))
 
-            shutil.rmtree(self._base)
+            self._clean_up()
             return hrs
+
+
+class HotspotIndex(object):
+    """
+    A SQLite index of written :class:`hotspots.result.Results`, so that large collections can be searched without
+    opening each archive.
+
+    For every result the index holds the protein identifier, a hash of the calculation settings, the extraction
+    threshold (for results from :class:`hotspots.result.Extractor`), summary statistics of the nonzero points of each
+    probe grid and of the per-point maximum over all probes ("all"), and the feature table
+    (:meth:`hotspots.result.Results.feature_table`, and the pharmacophore features when the result has a pharmacophore).
+
+    :class:`hotspots.hs_io.HotspotWriter` updates the index as it writes when given `index`. Queries return
+    (path, entry) tuples, where `entry` is the subdirectory of a multi-result archive (None for single results), ready
+    for `HotspotReader(path).read(identifier=entry)`.
+
+    :param str path: path to the SQLite database, created if it does not exist
+
+    >>> from hotspots.hs_io import HotspotIndex, HotspotWriter
+
+    >>> with HotspotWriter("results/1hcl", index="campaign.sqlite") as w:
+    >>>     w.write(bcv_result)
+
+    >>> with HotspotIndex("campaign.sqlite") as index:
+    >>>     hits = index.results(statistic="median", above=17)
+    >>>     donors = index.with_feature("donor", residue="ASP86")
+    """
+    statistics = ("npoints", "min", "max", "mean", "median", "p90", "p99")
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            entry TEXT NOT NULL DEFAULT '',
+            identifier TEXT,
+            protein TEXT,
+            settings_hash TEXT,
+            threshold REAL,
+            indexed REAL,
+            UNIQUE (path, entry));
+        CREATE TABLE IF NOT EXISTS grid_statistics (
+            result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+            probe TEXT NOT NULL,
+            npoints INTEGER, min REAL, max REAL, mean REAL, median REAL, p90 REAL, p99 REAL);
+        CREATE TABLE IF NOT EXISTS features (
+            result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+            feature_type TEXT NOT NULL,
+            x REAL, y REAL, z REAL,
+            score REAL,
+            count INTEGER,
+            projected_identifier TEXT,
+            source TEXT);
+        CREATE INDEX IF NOT EXISTS grid_statistics_probe ON grid_statistics (probe, result_id);
+        CREATE INDEX IF NOT EXISTS features_type ON features (feature_type, x);
+        CREATE INDEX IF NOT EXISTS results_protein ON results (protein);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(self._schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def settings_hash(settings):
+        """
+        a short hash of a settings object, e.g. `hotspots.calculation.Runner.Settings`
+
+        :param settings: object with attributes, or None
+        :return: str or None
+        """
+        if settings is None:
+            return None
+        values = json.dumps(vars(settings), sort_keys=True, default=str)
+        return hashlib.sha1(values.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _grid_statistics(super_grids):
+        """
+        summary statistics of the nonzero points of each grid, and of their per-point maximum
+
+        :param dict super_grids: {probe: `hotspots.grid_extension.Grid`}
+        :return: list of tup, (probe, npoints, min, max, mean, median, p90, p99)
+        """
+        arrays = OrderedDict((p, Grid.get_array(g)) for p, g in sorted(super_grids.items()))
+        shapes = set(a.shape for a in arrays.values())
+        if len(shapes) == 1:
+            arrays["all"] = np.max(np.stack(list(arrays.values())), axis=0)
+
+        rows = []
+        for probe, array in arrays.items():
+            values = array[array != 0]
+            if values.size == 0:
+                rows.append((probe, 0, None, None, None, None, None, None))
+                continue
+            p50, p90, p99 = np.percentile(values, (50, 90, 99))
+            rows.append((probe, int(values.size), float(values.min()), float(values.max()), float(values.mean()),
+                         float(p50), float(p90), float(p99)))
+        return rows
+
+    def add(self, path, hr, entry=None, settings=None):
+        """
+        indexes a result, replacing any previous entry for the same path
+
+        :param str path: path of the written result (archive or directory)
+        :param `hotspots.result.Results` hr: the result
+        :param str entry: subdirectory of the result in a multi-result archive
+        :param settings: calculation settings, by default `hr.settings`
+        :return:
+        """
+        if settings is None:
+            settings = getattr(hr, "settings", None)
+        stats = self._grid_statistics(hr.super_grids)
+        tables = [("island", hr.feature_table())]
+        if hr.pharmacophore:
+            tables.append(("pharmacophore", hr.pharmacophore.feature_table))
+        protein = getattr(hr.protein, "identifier", None) if hr.protein is not None else None
+
+        with self._db:
+            self._db.execute("DELETE FROM results WHERE path = ? AND entry = ?", (path, entry or ""))
+            cursor = self._db.execute(
+                "INSERT INTO results (path, entry, identifier, protein, settings_hash, threshold, indexed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, entry or "", hr.identifier, protein, self.settings_hash(settings),
+                 getattr(hr, "threshold", None), time.time()))
+            result_id = cursor.lastrowid
+            self._db.executemany("INSERT INTO grid_statistics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [(result_id,) + row for row in stats])
+            for source, table in tables:
+                self._db.executemany("INSERT INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     [(result_id, f, float(x), float(y), float(z), float(s), int(c), i or None, source)
+                                      for f, (x, y, z), s, c, i in zip(table.feature_types.tolist(),
+                                                                       table.coordinates.tolist(),
+                                                                       table.score.tolist(),
+                                                                       table.count.tolist(),
+                                                                       table.projected_identifier.tolist())])
+
+    def remove(self, path):
+        """
+        removes all results stored under `path`
+
+        :param str path: path of the written result
+        :return:
+        """
+        with self._db:
+            self._db.execute("DELETE FROM results WHERE path = ?", (path,))
+
+    @staticmethod
+    def _location(row):
+        return row[0], row[1] or None
+
+    def results(self, probe="all", statistic="median", above=None, below=None, protein=None, settings_hash=None):
+        """
+        results whose grid statistic lies within the given bounds
+
+        :param str probe: probe name or "all"
+        :param str statistic: one of `HotspotIndex.statistics`
+        :param float above: the statistic must be greater than this value
+        :param float below: the statistic must be less than this value
+        :param str protein: protein identifier
+        :param str settings_hash: as from `HotspotIndex.settings_hash`
+        :return: list of (path, entry)
+        """
+        if statistic not in self.statistics:
+            raise ValueError("statistic must be one of {}".format(", ".join(self.statistics)))
+
+        sql = ("SELECT r.path, r.entry FROM results r JOIN grid_statistics s ON s.result_id = r.id "
+               "WHERE s.probe = ?")
+        args = [probe]
+        if above is not None:
+            sql += " AND s.{} > ?".format(statistic)
+            args.append(above)
+        if below is not None:
+            sql += " AND s.{} < ?".format(statistic)
+            args.append(below)
+        if protein is not None:
+            sql += " AND r.protein = ?"
+            args.append(protein)
+        if settings_hash is not None:
+            sql += " AND r.settings_hash = ?"
+            args.append(settings_hash)
+        return [self._location(row) for row in self._db.execute(sql + " ORDER BY r.path, r.entry", args)]
+
+    def with_feature(self, feature_type=None, min_score=None, near=None, radius=2.0, residue=None, source=None):
+        """
+        results with at least one feature matching all the given conditions
+
+        :param str feature_type: "donor", "acceptor", ...
+        :param float min_score: the feature must score above this value
+        :param tup near: (float(x), float(y), float(z)), the feature must lie within `radius` of this point
+        :param float radius: distance in Angstrom
+        :param str residue: residue identifier of the hydrogen bonding partner, e.g. "ASP86" (pharmacophore features)
+        :param str source: "island" or "pharmacophore"
+        :return: list of (path, entry)
+        """
+        sql = ("SELECT DISTINCT r.path, r.entry FROM results r JOIN features f ON f.result_id = r.id "
+               "WHERE 1")
+        args = []
+        if feature_type is not None:
+            sql += " AND f.feature_type = ?"
+            args.append(feature_type)
+        if min_score is not None:
+            sql += " AND f.score > ?"
+            args.append(min_score)
+        if near is not None:
+            x, y, z = (float(v) for v in near)
+            sql += (" AND f.x BETWEEN ? AND ? AND f.y BETWEEN ? AND ? AND f.z BETWEEN ? AND ?"
+                    " AND (f.x - ?) * (f.x - ?) + (f.y - ?) * (f.y - ?) + (f.z - ?) * (f.z - ?) <= ?")
+            args.extend([x - radius, x + radius, y - radius, y + radius, z - radius, z + radius,
+                         x, x, y, y, z, z, radius ** 2])
+        if residue is not None:
+            sql += " AND f.projected_identifier LIKE ?"
+            args.append("{}:%".format(residue))
+        if source is not None:
+            sql += " AND f.source = ?"
+            args.append(source)
+        return [self._location(row) for row in self._db.execute(sql + " ORDER BY r.path, r.entry", args)]
+
+    def summary(self, path, entry=None):
+        """
+        the indexed statistics of one result
+
+        :param str path: path of the written result
+        :param str entry: subdirectory of the result in a multi-result archive
+        :return: dict, {"identifier", "protein", "settings_hash", "threshold", "grids": {probe: {statistic: value}},
+                 "features": int}
+        """
+        row = self._db.execute("SELECT id, identifier, protein, settings_hash, threshold FROM results "
+                               "WHERE path = ? AND entry = ?", (path, entry or "")).fetchone()
+        if row is None:
+            raise KeyError("{} is not indexed".format(path))
+        grids = {r[0]: dict(zip(self.statistics, r[1:])) for r in self._db.execute(
+            "SELECT probe, {} FROM grid_statistics WHERE result_id = ?".format(", ".join(self.statistics)),
+            (row[0],))}
+        nfeatures = self._db.execute("SELECT COUNT(*) FROM features WHERE result_id = ?", (row[0],)).fetchone()[0]
+        return {"identifier": row[1], "protein": row[2], "settings_hash": row[3], "threshold": row[4],
+                "grids": grids, "features": nfeatures}
@@ -0,0 +1,190 @@
+"""
+The :mod:`hotspots.hs_metrics` module collects run-time instrumentation for the Fragment Hotspot Maps pipeline.
+
+A :class:`hotspots.hs_metrics.RunMetrics` instance is filled in by :class:`hotspots.calculation.Runner` and attached
+to the returned :class:`hotspots.result.Results` as `Results.metrics`. It records:
+
+- stage timers (wall clock seconds), e.g. "superstar:apolar:0", "buriedness", "sampling:donor"
+- counters, e.g. "poses_evaluated", "voxels_updated"
+- peak resident memory, sampled at the end of every stage
+
+>>> from hotspots.calculation import Runner
+
+>>> result = Runner().from_protein(protein)
+>>> print(result.metrics)
+>>> result.metrics.write_json("metrics.json")
+
+Hooks receive every event as it happens, which is useful for feeding external dashboards:
+
+>>> def hook(kind, name, value):
+...     print(kind, name, value)
+>>> runner = Runner()
+>>> runner.metrics.add_hook(hook)
+
+"""
+from __future__ import print_function, division
+
+import csv
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+
+def peak_memory():
+    """
+    peak resident set size of the current process and its finished children
+
+    :return: float, megabytes (None if the platform does not provide it)
+    """
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on linux
+    kilobytes = max(own, children) / 1024. if sys.platform == "darwin" else max(own, children)
+    return kilobytes / 1024.
+
+
+class RunMetrics(object):
+    """
+    Timers, counters and memory samples for one calculation
+
+    Stages may run on worker threads, so updates are serialised and hooks are called under a lock. Timers of the
+    same name are summed, overlapping stages therefore report their summed thread time, not wall time.
+
+    :param list hooks: callables registered with `add_hook`
+    """
+
+    def __init__(self, hooks=None):
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+        self.peak_memory = None
+        self._hooks = list(hooks or [])
+        self._lock = threading.RLock()
+
+    def __str__(self):
+        lines = ["RunMetrics"]
+        lines.extend("    {:<32} {:>10.2f} s".format(k, v) for k, v in self.timings.items())
+        lines.extend("    {:<32} {:>10d}".format(k, v) for k, v in self.counters.items())
+        if self.peak_memory is not None:
+            lines.append("    {:<32} {:>10.1f} MB".format("peak_memory", self.peak_memory))
+        return "\n".join(lines)
+
+    @property
+    def hooks(self):
+        """
+        registered hooks
+        :return: list
+        """
+        with self._lock:
+            return list(self._hooks)
+
+    def add_hook(self, hook):
+        """
+        registers a callable, called as hook(kind, name, value) with kind "timer", "counter" or "memory"
+
+        :param hook: callable
+        :return:
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def _emit(self, kind, name, value):
+        for hook in self._hooks:
+            hook(kind, name, value)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        times the enclosed block. Repeated stages with the same name are summed.
+
+        >>> with metrics.timer("buriedness"):
+        ...     calculate_buriedness()
+
+        :param str name: stage name
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start)
+
+    def record(self, name, seconds):
+        """
+        adds a duration measured elsewhere (e.g. in a worker process)
+
+        :param str name: stage name
+        :param float seconds: duration
+        :return:
+        """
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.) + seconds
+            self._emit("timer", name, seconds)
+        self.sample_memory()
+
+    def count(self, name, n=1):
+        """
+        increments a counter
+
+        :param str name: counter name
+        :param int n: increment
+        :return:
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+            self._emit("counter", name, n)
+
+    def sample_memory(self):
+        """
+        updates the peak memory
+
+        :return: float, megabytes
+        """
+        mem = peak_memory()
+        with self._lock:
+            if mem is not None and (self.peak_memory is None or mem > self.peak_memory):
+                self.peak_memory = mem
+                self._emit("memory", "peak_memory", mem)
+        return mem
+
+    def to_dict(self):
+        """
+        :return: dict, {"timings": {}, "counters": {}, "peak_memory": float}
+        """
+        with self._lock:
+            return {"timings": dict(self.timings),
+                    "counters": dict(self.counters),
+                    "peak_memory": self.peak_memory}
+
+    def write_json(self, path):
+        """
+        :param str path: output path
+        :return:
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_csv(self, path):
+        """
+        writes one row per metric: kind, name, value
+
+        :param str path: output path
+        :return:
+        """
+        with open(path, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["kind", "name", "value"])
+            for k, v in self.timings.items():
+                writer.writerow(["timer", k, v])
+            for k, v in self.counters.items():
+                writer.writerow(["counter", k, v])
+            writer.writerow(["memory", "peak_memory", self.peak_memory])
@@ -28,11 +28,14 @@ More information about Pharmit is available:
 
 """
 from __future__ import print_function
+import collections
 import csv
+import hashlib
 import json
 import re
 import os
 import tempfile
+from concurrent import futures
 from os.path import basename, splitext, join, dirname
 
 import numpy as np
@@ -41,22 +44,20 @@ from ccdc.descriptors import GeometricDescriptors
 from ccdc.molecule import Atom, Molecule, Coordinates
 from ccdc.pharmacophore import Pharmacophore
 from ccdc.protein import Protein
+from scipy import ndimage
+from scipy.spatial import cKDTree
 
 from hotspots.grid_extension import Grid, Coordinates
+from hotspots.hs_clustering import pack_fingerprints, tanimoto_matrix, cluster_fingerprints
+from hotspots.hs_density import frame, rasterise
+from hotspots.hs_features import FeatureTable
 from hotspots.hs_utilities import Helper
 from hotspots.template_strings import pymol_arrow, pymol_imports, crossminer_features, pymol_labels
-from hotspots.pdb_python_api import Query, PDB, PDBResult
-
-from rdkit import Chem, DataStructs
-from rdkit.Chem import MACCSkeys, AllChem
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from hotspots.pdb_python_api import Query, PDB, PDBResult, PDBClient
 from tqdm import tqdm
 
-import pandas as pd
-from sklearn.manifold import TSNE
-import matplotlib.pyplot as plt
-import hdbscan
+# rdkit, scikit-learn, hdbscan, pandas and matplotlib are imported by the methods that use them (ligand clustering,
+# arpeggio, csv export and plotting) so that importing this module stays cheap
 
 
 def tanimoto_dist(a, b):
@@ -90,6 +91,9 @@ class _Ligand(object):
         :param path:
         :return:
         """
+        from rdkit import Chem
+        from rdkit.Chem import AllChem
+
         ccdc_mol = io.MoleculeReader(path)[0]
         rdkit_mol = Chem.SDMolSupplier(path)[0]
         fingerprint = AllChem.GetMorganFingerprintAsBitVect(rdkit_mol, 2)
@@ -97,6 +101,179 @@ class _Ligand(object):
         return _Ligand(ccdc_mol, rdkit_mol, fingerprint, chem_id)
 
 
+class AlignmentRecord(collections.namedtuple("AlignmentRecord", ["identifier", "clustered_ligand", "chain", "rmsd",
+                                                                 "protein_file", "ligand_file", "error"])):
+    """
+    The outcome of aligning one target
+
+    :param str identifier: PDB code of the target
+    :param str clustered_ligand: het ID of the ligand used to find the chain
+    :param str chain: aligned chain, None if no chain was detected
+    :param float rmsd: superposition RMSD
+    :param str protein_file: path to the aligned protein (mol2)
+    :param str ligand_file: path to the aligned ligands of `chain` (mol2)
+    :param str error: why the alignment failed, None on success
+    """
+    __slots__ = ()
+
+    @property
+    def success(self):
+        return self.error is None
+
+
+# ligand features with no counterpart in the model
+_EXCLUDED_LIGAND_FEATURES = ('exit_vector', 'heavy_atom', 'hydrophobe', 'fluorine', 'bromine', 'chlorine', 'iodine',
+                             'halogen', 'deoxyribose', 'donor_ch_projected', 'acceptor_projected', 'pyrimidine')
+
+
+def _read_feature_definitions(directory=None):
+    """
+    reads the CrossMiner feature definitions
+
+    :param str directory: feature definitions directory (default: $HOTSPOTS_FEATURE_DEFINITIONS, or the definitions
+                          of the CSD installation)
+    :return: dict, {identifier: `ccdc.pharmacophore.Pharmacophore.FeatureDefinition`}
+    """
+    directory = directory or os.environ.get("HOTSPOTS_FEATURE_DEFINITIONS")
+    try:
+        if directory:
+            Pharmacophore.read_feature_definitions(directory=directory)
+        else:
+            Pharmacophore.read_feature_definitions()
+    except Exception:
+        raise ImportError("Crossminer is only available to CSD-Discovery")
+    return Pharmacophore.feature_definitions
+
+
+def _ligand_features(args):
+    """
+    worker: detects the features of a slice of the ligands
+
+    :param tup args: (path to ligand file, first ligand, end of the slice, feature definitions directory)
+    :return: dict, {feature type: (n, 4) `numpy.array` of sphere centres and radii}
+    """
+    fname, start, stop, directory = args
+    cm_dic = crossminer_features()
+    definitions = [fd for fd in _read_feature_definitions(directory).values()
+                   if fd.identifier not in _EXCLUDED_LIGAND_FEATURES and cm_dic.get(fd.identifier)]
+
+    spheres = {}
+    reader = io.CrystalReader(fname)
+    for i in range(start, stop):
+        ligand = reader[i]
+        for fd in definitions:
+            for f in fd.detect_features(ligand):
+                spheres.setdefault(cm_dic[fd.identifier], []).append(tuple(f.spheres[0].centre) +
+                                                                     (f.spheres[0].radius,))
+    reader.close()
+    return {feature_type: np.array(s, dtype=float) for feature_type, s in spheres.items()}
+
+
+# per process: prepared reference proteins and their superposition targets, keyed by the alignment job
+_references = {}
+
+
+def _prepared_protein(path, cache_dir):
+    """
+    reads a protein, detects ligand bonds and adds hydrogens. The prepared protein is cached under the hash of the
+    file contents, so an entry is prepared once however many targets it is aligned for.
+
+    :param str path: path to protein file
+    :param str cache_dir: cache directory, None for no cache
+    :return: `ccdc.protein.Protein`
+    """
+    if cache_dir:
+        with open(path, "rb") as f:
+            key = hashlib.sha1(f.read()).hexdigest()
+        cached = join(cache_dir, key[:2], key + ".mol2")
+        if os.path.exists(cached):
+            return Protein.from_file(cached)
+
+    prot = Protein.from_file(path)
+    prot.detect_ligand_bonds()
+    prot.add_hydrogens()
+
+    if cache_dir:
+        if not os.path.exists(dirname(cached)):
+            os.makedirs(dirname(cached), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname(cached), suffix=".mol2")
+        os.close(fd)
+        try:
+            with io.MoleculeWriter(tmp) as w:
+                w.write(prot)
+            os.replace(tmp, cached)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return prot
+
+
+def _ligand_het_id(ligand):
+    return str(ligand.identifier.split(":")[1][0:3])
+
+
+def _reference(reference_file, reference_chain, binding_site, cache_dir):
+    """
+    the prepared reference and what the targets are superposed onto: the chain, or the binding site of the largest
+    ligand in the chain
+    """
+    key = (reference_file, reference_chain, binding_site)
+    if key not in _references:
+        reference = _prepared_protein(reference_file, cache_dir)
+        if binding_site:
+            ligands = [l for l in reference.ligands if l.identifier.split(":")[0] == reference_chain]
+            if not ligands:
+                raise RuntimeError("no ligand in chain {} of the reference".format(reference_chain))
+            ligand = max(ligands, key=lambda l: len(l.heavy_atoms))
+            _references[key] = (reference, Protein.BindingSiteFromMolecule(protein=reference,
+                                                                          molecule=ligand,
+                                                                          distance=6))
+        else:
+            _references[key] = (reference, reference[reference_chain])
+    return _references[key]
+
+
+def _align_target(args):
+    """
+    worker: aligns one target to the reference and writes the aligned protein and ligands
+
+    :param tup args: (reference file, reference chain, target file, identifier, clustered ligand, binding site,
+                      output directory, cache directory)
+    :return: :class:`hotspots.hs_pharmacophore.AlignmentRecord`
+    """
+    reference_file, reference_chain, fname, identifier, clustered_ligand, binding_site, out_dir, cache_dir = args
+    chain = None
+    try:
+        reference, site = _reference(reference_file, reference_chain, binding_site, cache_dir)
+        prot = _prepared_protein(fname, cache_dir)
+
+        for l in prot.ligands:
+            if str(clustered_ligand) == _ligand_het_id(l):
+                bs = Protein.BindingSiteFromMolecule(protein=prot, molecule=l, distance=6)
+                chain = bs.residues[0].identifier.split(":")[0]
+        if chain is None:
+            return AlignmentRecord(identifier, clustered_ligand, None, None, None, None, "no chain detected")
+
+        if binding_site:
+            rmsd, transformation = Protein.BindingSiteSuperposition().superpose(site, prot)
+        else:
+            rmsd, transformation = Protein.ChainSuperposition().superpose(site, prot[chain])
+
+        protein_file = join(out_dir, "{}_{}.mol2".format(identifier, clustered_ligand))
+        ligand_file = join(out_dir, "{}_{}_ligands.mol2".format(identifier, clustered_ligand))
+        with io.MoleculeWriter(protein_file) as w:
+            w.write(prot)
+        with io.MoleculeWriter(ligand_file) as w:
+            for lig in prot.ligands:
+                if str(clustered_ligand) == _ligand_het_id(lig) and chain == str(lig.identifier.split(":")[0]):
+                    w.write(lig)
+        return AlignmentRecord(identifier, clustered_ligand, chain, rmsd, protein_file, ligand_file, None)
+
+    except Exception as e:
+        return AlignmentRecord(identifier, clustered_ligand, chain, None, None, None,
+                               "{}: {}".format(type(e).__name__, e))
+
+
 class PharmacophoreModel(Helper):
     """
     A class to handle a Pharmacophore Model
@@ -120,16 +297,19 @@ class PharmacophoreModel(Helper):
         :param float transparency: Set transparency of sphere
         :param bool excluded_volume:  If True, the CrossMiner pharmacophore will contain excluded volume spheres
         :param float binding_site_radius: Radius of search for binding site calculation, used for excluded volume
+        :param str feature_definitions: directory of CrossMiner feature definitions (default:
+                                        $HOTSPOTS_FEATURE_DEFINITIONS, or the definitions of the CSD installation)
         """
 
         def __init__(self, feature_boundary_cutoff=5, max_hbond_dist=5, radius=1.0, vector_on=False, transparency=0.6,
-                     excluded_volume=True, binding_site_radius=12):
+                     excluded_volume=True, binding_site_radius=12, feature_definitions=None):
             self.feature_boundary_cutoff = feature_boundary_cutoff
             self.max_hbond_dist = max_hbond_dist
             self.radius = radius  # set more intelligently
             self.transparency = transparency
             self.excluded_volume = excluded_volume
             self.binding_site_radius = binding_site_radius
+            self.feature_definitions = feature_definitions
 
             if vector_on:
                 self.vector_on = 1
@@ -182,6 +362,15 @@ class PharmacophoreModel(Helper):
         """
         return self._features
 
+    @property
+    def feature_table(self):
+        """
+        Interaction features of the Pharmacophore Model as a columnar table
+
+        :return: :class:`hotspots.hs_features.FeatureTable`
+        """
+        return FeatureTable.from_features(self._features, source=self.identifier)
+
     def _comparision_dict(self, feature_threshold=0):
         """
         converts pharmacophore into comparision dictionary
@@ -218,28 +407,17 @@ class PharmacophoreModel(Helper):
         5
 
         """
+        # a stable sort on the score, features with equal scores are no longer dropped
+        ranked = sorted(self.features, key=lambda feat: float(feat.score_value), reverse=True)
         if force_apolar:
-            apolar_dict = {feat.score_value: feat for feat in self.features if feat.feature_type == "apolar"}
-            top_apolar = sorted(apolar_dict.items(), key=lambda x: x[0], reverse=True)[0]
-            apolar = apolar_dict[top_apolar[0]]
-
-            score_dic = {feat.score_value: feat for feat in self.features if feat.feature_type != "apolar"}
-            sorted_scores = sorted(score_dic.items(), key=lambda x: x[0], reverse=True)
-            max_features -= 1
-            if max_features > len(self.features):
-                ordered_features = [feat for score, feat in sorted_scores if score > feature_threshold]
-            else:
-                ordered_features = [feat for score, feat in sorted_scores if score > feature_threshold][:max_features]
-
+            apolar = [feat for feat in ranked if feat.feature_type == "apolar"][0]
+            ordered_features = [feat for feat in ranked
+                                if feat.feature_type != "apolar" and float(feat.score_value) > feature_threshold]
+            ordered_features = ordered_features[:max_features - 1]
             ordered_features.append(apolar)
 
         else:
-            score_dic = {feat.score_value: feat for feat in self.features}
-            sorted_scores = sorted(score_dic.items(), key=lambda x: x[0], reverse=True)
-            if max_features > len(self.features):
-                ordered_features = [feat for score, feat in sorted_scores if score > feature_threshold]
-            else:
-                ordered_features = [feat for score, feat in sorted_scores if score > feature_threshold][:max_features]
+            ordered_features = [feat for feat in ranked if float(feat.score_value) > feature_threshold][:max_features]
 
         self._features = ordered_features
 
@@ -351,13 +529,8 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
         supported_features = {"acceptor_projected": "acceptor",
                               "donor_projected": "donor",
                               "ring": "apolar"}
-        try:
-            Pharmacophore.read_feature_definitions(directory="/local/pcurran/CCDC/CSD_CrossMiner/feature_definitions")
-        except:
-            raise ImportError("Crossminer is only available to CSD-Discovery")
-
         feature_definitions = {supported_features[fd.identifier]: fd for fd in
-                               Pharmacophore.feature_definitions.values()
+                               _read_feature_definitions(getattr(self.settings, "feature_definitions", None)).values()
                                if fd.identifier in supported_features.keys()}
 
         model_features = []
@@ -433,6 +606,10 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
         :param list: list of :class:`pdb_python_api.PDBResult` instances
         :return: RDKit molecules
         """
+        from rdkit import Chem
+        from rdkit.Chem import AllChem
+
+        PDBResult.prefetch(results, info_type='ligand')
         ligs = []
         uniques = []
         for entry in results:
@@ -451,132 +628,130 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
         return ligs
 
     @staticmethod
-    def _cluster_ligands(ligands, t):
+    def _cluster_ligands(ligands, t, method="hdbscan", threshold=0.35, plot=False):
         """
-
-        :return:
+        clusters ligands on the Tanimoto distances of their fingerprints
+
+        :param list ligands: ligands with a `fingerprint` (RDKit bit vector) and a `chemical_id`
+        :param str t: identifier, names the plot
+        :param str method: "hdbscan" or "butina", see :func:`hotspots.hs_clustering.cluster_fingerprints`
+        :param float threshold: Butina neighbour distance cutoff
+        :param bool plot: if True, a t-SNE map of the clusters is saved to <t>.png
+        :return: dict, key = cluster label, value = list of ligands with the representative first
         """
+        if len(ligands) < 2:
+            raise ValueError("Fingerprint array must contain more than 1 entry")
 
-        def fingerprint_array(ligands):
-            X = []
-            for l in ligands:
-                arr = np.zeros((0,))
-                DataStructs.ConvertToNumpyArray(l.fingerprint, arr)
-                X.append(arr)
-            return X
+        distances = 1. - tanimoto_matrix(pack_fingerprints([l.fingerprint for l in ligands]))
+        clusters = cluster_fingerprints(None, method=method, threshold=threshold, distances=distances)
+        cluster_dic = {label: [ligands[i] for i in members] for label, members in enumerate(clusters)}
 
-        cluster_dic = {}
+        if plot:
+            PharmacophoreModel._plot_clusters(distances, clusters, t)
 
-        # generate fingerprint array
-        X = fingerprint_array(ligands)
-        if len(X) < 2:
-            X = fingerprint_array(ligands)
-            if len(X) < 2:
-                raise ValueError("Fingerprint array must contain more than 1 entry")
+        if len(cluster_dic) == 0:
+            print("NO CLUSTERS FOUND")
+            unique = {}
+            for l in ligands:
+                hetid = l.chemical_id.split("_")[0]
+                if not hetid in unique:
+                    unique.update({hetid: l})
 
-        # dimensionality reduction
-        tsne_X = TSNE(n_components=2, metric=tanimoto_dist).fit_transform(np.array(X, dtype=np.float32))
+            ligands = list(unique.values())
+            cluster_dic = {i: [ligands[i]] for i in range(0, len(ligands))}
 
-        # clustering
-        cluster_tsne = hdbscan.HDBSCAN(min_cluster_size=2, gen_min_span_tree=True)
-        cluster_tsne.fit(tsne_X)
+        return cluster_dic
 
-        for i, label in enumerate(cluster_tsne.labels_):
-            if label == -1:
-                continue
-            else:
-                if label in cluster_dic:
-                    cluster_dic[label].append(ligands[i])
-                else:
-                    cluster_dic.update({label: [ligands[i]]})
+    @staticmethod
+    def _plot_clusters(distances, clusters, t):
+        """
+        saves a t-SNE map of the clustered ligands to <t>.png, representatives are marked with a cross
 
-        x = [tsne_X.T[0][j] for j, l in enumerate(cluster_tsne.labels_) if l != -1]
-        y = [tsne_X.T[1][j] for j, l in enumerate(cluster_tsne.labels_) if l != -1]
-        hue = [l for j, l in enumerate(cluster_tsne.labels_) if l != -1]
+        :param `numpy.array` distances: Tanimoto distance matrix
+        :param list clusters: lists of member indices, representative first
+        :param str t: identifier
+        """
+        import matplotlib.pyplot as plt
+        from sklearn.manifold import TSNE
 
-        seen = [-1]
-        sx = []
-        sy = []
-        for k, l in enumerate(cluster_tsne.labels_):
-            if l in seen:
-                continue
-            else:
-                sx.append(tsne_X.T[0][k])
-                sy.append(tsne_X.T[1][k])
-                seen.append(l)
+        tsne_X = TSNE(n_components=2, metric="precomputed", init="random").fit_transform(distances)
 
-        plt.scatter(x, y, c=hue, cmap='RdBu', alpha=0.7)
-        plt.scatter(sx, sy, c="black", marker="x")
+        members = [i for c in clusters for i in c]
+        hue = [label for label, c in enumerate(clusters) for _ in c]
+        reps = [c[0] for c in clusters]
+
+        plt.scatter(tsne_X[members, 0], tsne_X[members, 1], c=hue, cmap='RdBu', alpha=0.7)
+        plt.scatter(tsne_X[reps, 0], tsne_X[reps, 1], c="black", marker="x")
 
         plt.title("{} clusters".format(t))
         plt.savefig("{}.png".format(t))
         plt.close()
 
-        if len(cluster_dic) == 0:
-            print("NO CLUSTERS FOUND")
-            try:
-                unique = {}
-                for l in ligands:
-                    hetid = l.chemical_id.split("_")[0]
-                    if not hetid in unique:
-                        unique.update({hetid: l})
-
-                ligands = unique.values()
-                cluster_dic = {i: [ligands[i]] for i in range(0, len(ligands))}
-            except:
-                cluster_dic = {i: [ligands[i]] for i in range(0, len(ligands))}
+    @staticmethod
+    def align_targets(reference, reference_chain, targets, nprocesses=None, binding_site=False, out_dir=None,
+                      cache_dir=None):
+        """
+        aligns targets to a reference in a process pool
 
-        return cluster_dic
+        Each target is read, its ligand bonds detected and hydrogens added (prepared proteins are cached, see
+        `cache_dir`), the chain binding its clustered ligand is found and superposed onto the reference.
+
+        :param reference: the reference entry, with `fname` (path to protein file)
+        :param str reference_chain: align to this chain
+        :param list targets: entries with `fname`, `identifier` and `clustered_ligand` (het ID), e.g.
+                             :class:`hotspots.pdb_python_api.PDBResult`
+        :param int nprocesses: number of worker processes (default: one per CPU)
+        :param bool binding_site: if True, the binding site residues around the largest ligand of the reference
+                                  chain are superposed instead of the whole chain
+        :param str out_dir: directory for the aligned proteins and ligands (default: a new temporary directory)
+        :param str cache_dir: cache of prepared proteins (default: $HOTSPOTS_PREPARED_CACHE or
+                              ~/.cache/hotspots/prepared), "" to disable
+        :return: list of :class:`hotspots.hs_pharmacophore.AlignmentRecord`, in the order of `targets`
+        """
+        if out_dir is None:
+            out_dir = tempfile.mkdtemp()
+        if cache_dir is None:
+            cache_dir = os.environ.get("HOTSPOTS_PREPARED_CACHE") or \
+                join(os.path.expanduser("~"), ".cache", "hotspots", "prepared")
+        jobs = [(reference.fname, reference_chain, t.fname, t.identifier, t.clustered_ligand, binding_site, out_dir,
+                 cache_dir) for t in targets]
+
+        nprocesses = min(nprocesses or os.cpu_count() or 1, max(len(jobs), 1))
+        if nprocesses <= 1:
+            return [_align_target(job) for job in tqdm(jobs)]
+
+        with futures.ProcessPoolExecutor(max_workers=nprocesses) as executor:
+            submitted = [executor.submit(_align_target, job) for job in jobs]
+            for _ in tqdm(futures.as_completed(submitted), total=len(submitted)):
+                pass
+        return [f.result() for f in submitted]
 
     @staticmethod
-    def _align_proteins(reference, reference_chain, targets):
+    def _align_proteins(reference, reference_chain, targets, nprocesses=None, binding_site=False):
         """
         align proteins by chain
 
-        :param `ccdc.protein.Protein` reference: align to me
+        :param reference: the reference entry, with `fname` and `identifier`
         :param str reference_chain: align to this chain
-        :param list targets: list of `ccdc.protein.Protein`
-        :return tup: list(:class:`ccdc.protein.Protein`) and list (:classa`ccdc.molecule.Molecule`)
+        :param list targets: entries with `fname`, `identifier` and `clustered_ligand`
+        :param int nprocesses: number of worker processes
+        :param bool binding_site: if True, superpose binding sites instead of chains
+        :return tup: list(:class:`ccdc.protein.Protein`), list (:class:`ccdc.molecule.Molecule`) and list
+                     (:class:`hotspots.hs_pharmacophore.AlignmentRecord`)
         """
         print("Aligning proteins to {}, chain {}...".format(reference.identifier, reference_chain))
+        records = PharmacophoreModel.align_targets(reference, reference_chain, targets, nprocesses=nprocesses,
+                                                   binding_site=binding_site)
         aligned_prots = []
         aligned_ligands = []
-
-        reference = Protein.from_file(reference.fname)
-        reference.add_hydrogens()
-
-        for t in tqdm(targets):
-            prot = Protein.from_file(t.fname)
-            prot.detect_ligand_bonds()
-            prot.add_hydrogens()
-            chain = None
-            for l in prot.ligands:
-                if str(t.clustered_ligand) == str(l.identifier.split(":")[1][0:3]):
-                    try:
-                        bs = Protein.BindingSiteFromMolecule(protein=prot,
-                                                             molecule=l,
-                                                             distance=6)
-                        chain = bs.residues[0].identifier.split(":")[0]
-                    except:
-                        chain = None
-
-            if chain is None:
-                print("\n        {} failed! No chain detected".format(t.identifier))
-                continue
-            try:
-                binding_site_superposition = Protein.ChainSuperposition()
-                (bs_rmsd, bs_transformation) = binding_site_superposition.superpose(reference[reference_chain],
-                                                                                    prot[chain])
-                aligned_prots.append(prot)
-                for lig in prot.ligands:
-                    if str(t.clustered_ligand) == str(lig.identifier.split(":")[1][0:3]):
-                        if chain == str(lig.identifier.split(":")[0]):
-                            aligned_ligands.append(lig)
-            except:
-                print("\n        {} failed!".format(t.identifier))
+        for r in records:
+            if not r.success:
+                print("\n        {} failed! {}".format(r.identifier, r.error))
                 continue
+            aligned_prots.append(Protein.from_file(r.protein_file))
+            aligned_ligands.extend(io.MoleculeReader(r.ligand_file))
 
-        return aligned_prots, aligned_ligands
+        return aligned_prots, aligned_ligands, records
 
     def write(self, fname):
         """
@@ -599,6 +774,7 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
             pharmacophore.write(fname)
 
         elif extension == ".csv":
+            import pandas as pd
             df = pd.DataFrame({'Identifier': [self.identifier for feature in self._features],
                                'Feature_type': [feature.feature_type for feature in self._features],
                                'x': [feature.feature_coordinates.x for feature in self._features],
@@ -722,9 +898,11 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
             settings = PharmacophoreModel.Settings()
 
         feature_list = []
+        # hydrogen bonding partners are indexed once for all probes
+        partners = _PartnerIndex(result.protein)
         for probe, g in result.super_grids.items():
-            print(probe)
-            feature_list.extend(_PharmacophoreFeature.from_hotspot(g, probe, result.protein, settings))
+            feature_list.extend(_PharmacophoreFeature.from_hotspot(g, probe, result.protein, settings,
+                                                                   partners=partners))
 
         return PharmacophoreModel(settings,
                                   identifier=identifier,
@@ -866,6 +1044,8 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
                    "weakpolar",
                    "relationship"]
 
+        import pandas as pd
+
         atom_types = pd.read_csv(os.path.join(tmpdir, f"{pdb_code}.atomtypes"),
                                  sep='\t',
                                  names=["atom", "atomtype"],
@@ -924,14 +1104,19 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
         return 0
     
     @staticmethod
-    def from_ligands(ligands, identifier, protein=None, settings=None):
+    def from_ligands(ligands, identifier, protein=None, settings=None, kernel="sphere", nprocesses=None):
         """
         creates a Pharmacophore Model from a collection of overlaid ligands
 
+        The CrossMiner features of the ligands are detected (in parallel over slices of the ligands), the feature
+        spheres of each type are summed into a density grid and the peaks of the density become the model features.
+
         :param `ccdc,molecule.Molecule` ligands: ligands from which the Model is created
         :param str identifier: identifier for the Pharmacophore Model
         :param `ccdc.protein.Protein` protein: target system that the model has been created for
         :param `hotspots.hs_pharmacophore.PharmacophoreModel.Settings` settings: Pharmacophore Model settings
+        :param str kernel: density kernel of each feature, "sphere" or "gaussian", see :mod:`hotspots.hs_density`
+        :param int nprocesses: number of processes detecting features (default: one per CPU)
 
         :return: :class:`hotspots.hs_pharmacophore.PharmacophoreModel`
 
@@ -945,83 +1130,61 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
         >>> model.write("model.json")
 
         """
-        cm_dic = crossminer_features()
-        blank_grd = Grid.initalise_grid([a.coordinates for l in ligands for a in l.atoms])
-        feature_dic = {"apolar": blank_grd.copy(),
-                       "acceptor": blank_grd.copy(),
-                       "donor": blank_grd.copy()}
-
         if not settings:
             settings = PharmacophoreModel.Settings()
 
-        if isinstance(ligands[0], Molecule):
-            temp = tempfile.mkdtemp()
-
-            with io.MoleculeWriter(join(temp, "ligs.mol2")) as w:
-                for l in ligands:
-                    w.write(l)
-            ligands = list(io.CrystalReader(join(temp, "ligs.mol2")))
-
-        try:
-            Pharmacophore.read_feature_definitions(directory="/local/pcurran/CCDC/CSD_CrossMiner/feature_definitions")
-        except:
-            raise ImportError("Crossminer is only available to CSD-Discovery")
-
-        feature_definitions = [fd for fd in Pharmacophore.feature_definitions.values() if
-                               fd.identifier != 'exit_vector' and
-                               fd.identifier != 'heavy_atom' and
-                               fd.identifier != 'hydrophobe' and
-                               fd.identifier != 'fluorine' and
-                               fd.identifier != 'bromine' and
-                               fd.identifier != 'chlorine' and
-                               fd.identifier != 'iodine' and
-                               fd.identifier != 'halogen' and
-                               fd.identifier != 'deoxyribose' and
-                               fd.identifier != 'donor_ch_projected' and
-                               fd.identifier != 'acceptor_projected' and
-                               fd.identifier != 'pyrimidine']
-
-        for fd in feature_definitions:
-            detected = [fd.detect_features(ligand) for ligand in ligands]
-            all_feats = [f for l in detected for f in l]
-
-            if not all_feats:
-                continue
-
-            print(f"{len(all_feats)} {fd.identifier} features detected")
+        mols = [l if isinstance(l, Molecule) else l.molecule for l in ligands]
+        temp = tempfile.mkdtemp()
+        fname = join(temp, "ligs.mol2")
+        with io.MoleculeWriter(fname) as w:
+            for m in mols:
+                w.write(m)
+
+        # feature detection, over slices of the ligand file
+        directory = getattr(settings, "feature_definitions", None)
+        nprocesses = min(nprocesses or os.cpu_count() or 1, max(len(mols) // 8, 1))
+        bounds = np.linspace(0, len(mols), 4 * nprocesses + 1).astype(int)
+        jobs = [(fname, int(start), int(stop), directory)
+                for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        if nprocesses <= 1:
+            detected = [_ligand_features(job) for job in jobs]
+        else:
+            with futures.ProcessPoolExecutor(max_workers=nprocesses) as executor:
+                detected = list(executor.map(_ligand_features, jobs))
 
-            for f in all_feats:
-                feature_dic[cm_dic[fd.identifier]].set_sphere(f.spheres[0].centre, f.spheres[0].radius, 1)
+        spacing = 0.5
+        origin, far_corner, shape = frame([tuple(a.coordinates) for m in mols for a in m.atoms],
+                                          padding=1, spacing=spacing)
+        blank_grd = Grid(origin=tuple(origin), far_corner=tuple(far_corner), spacing=spacing, default=0, _grid=None)
+        partners = _PartnerIndex(protein) if protein else None
 
+        feature_dic = {}
         features = []
-        projected_ident = None
-        projected_coordinates = None
-        for feat, feature_grd in feature_dic.items():
-            peaks = feature_grd.get_peaks(min_distance=1, cutoff=0)
-
-            for p in peaks:
-                coords = Coordinates(p[0], p[1], p[2])
-                projected_coordinates = None
-                if feat == "donor" or feat == "acceptor":
-                    if protein:
-                        projected_ident, \
-                        projected_coordinates = _PharmacophoreFeature.get_projected_coordinates(feat,
-                                                                                                coords,
-                                                                                                protein,
-                                                                                                settings)
-
-                features.append(_PharmacophoreFeature(projected=None,
-                                                      feature_type=feat,
-                                                      feature_coordinates=coords,
-                                                      projected_coordinates=projected_coordinates,
-                                                      projected_identifier=projected_ident,
-                                                      score_value=feature_grd.value_at_coordinate(coords,
-                                                                                                  position=False),
-
-                                                      vector=None,
-                                                      settings=settings
-                                                      )
-                                )
+        for feat in ("apolar", "acceptor", "donor"):
+            spheres = np.concatenate([d[feat] for d in detected if feat in d] or [np.zeros((0, 4))])
+            if len(spheres):
+                print(f"{len(spheres)} {feat} features detected")
+
+            density = rasterise(spheres[:, :3], spheres[:, 3], origin, shape, spacing=spacing, kernel=kernel)
+            feature_dic[feat] = Grid.array_to_grid(density, blank_grd)
+
+            peaks = Grid.array_peaks(density, min_distance=1, cutoff=0)
+            coordinates = origin + peaks * spacing
+            scores = density[tuple(peaks.T)] if len(peaks) else np.zeros(0)
+            if partners is not None and (feat == "donor" or feat == "acceptor"):
+                matched = partners.nearest(feat, coordinates, settings.max_hbond_dist)
+            else:
+                matched = [None] * len(coordinates)
+
+            features.extend(_PharmacophoreFeature(projected=None,
+                                                  feature_type=feat,
+                                                  feature_coordinates=Coordinates(*c),
+                                                  projected_coordinates=match[1] if match else None,
+                                                  projected_identifier=match[0] if match else None,
+                                                  score_value=float(score),
+                                                  vector=None,
+                                                  settings=settings)
+                            for c, score, match in zip(coordinates.tolist(), scores, matched))
 
         return PharmacophoreModel(settings,
                                   identifier=identifier,
@@ -1036,7 +1199,7 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
                 f.write("{},{},{}\n".format(l.structure_id, l.chemical_id, l.smiles))
 
     @staticmethod
-    def _from_siena(pdb, ligand, mode, identifier, out_dir=None):
+    def _from_siena(pdb, ligand, mode, identifier, out_dir=None, clustering="hdbscan"):
         """
         creates a Pharmacophore Model from a PDB code using a binding site search
 
@@ -1059,7 +1222,7 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
         ligands = [_Ligand.from_file(path=os.path.join(out_dir, "ligands", f))
                    for f in os.listdir(os.path.join(out_dir, "ligands")) if f.split(".")[1] == "sdf"]
 
-        cluster_dict = PharmacophoreModel._cluster_ligands(ligands=ligands, t=identifier)
+        cluster_dict = PharmacophoreModel._cluster_ligands(ligands=ligands, t=identifier, method=clustering)
         reps = [l[0].ccdc_mol for l in cluster_dict.values() if len(l) != 0]
 
         p = PharmacophoreModel.from_ligands(ligands=reps, identifier=identifier)
@@ -1067,7 +1230,8 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
         return p
 
     @staticmethod
-    def from_pdb(pdb_code, chain, representatives=None, identifier="LigandBasedPharmacophore"):
+    def from_pdb(pdb_code, chain, representatives=None, identifier="LigandBasedPharmacophore", clustering="hdbscan",
+                 nprocesses=None, binding_site=False):
         """
         creates a Pharmacophore Model from a PDB code.
 
@@ -1080,6 +1244,9 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
         :param str out_dir: path to output directory
         :param representatives: path to .dat file containing previously clustered data (time saver)
         :param str identifier: identifier for the Pharmacophore Model
+        :param str clustering: ligand clustering method, "hdbscan" or "butina"
+        :param int nprocesses: number of processes aligning the representatives (default: one per CPU)
+        :param bool binding_site: if True, binding sites are superposed instead of whole chains
 
         :return: :class:`hotspots.hs_pharmacophore.PharmacophoreModel`
 
@@ -1122,7 +1289,7 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
             # return all_ligands
             all_ligands = PharmacophoreModel._get_ligands(results)
 
-            cluster_dict = PharmacophoreModel._cluster_ligands(ligands=all_ligands, t=identifier)
+            cluster_dict = PharmacophoreModel._cluster_ligands(ligands=all_ligands, t=identifier, method=clustering)
             reps = [l[0] for l in cluster_dict.values() if len(l) != 0]
 
         targets = []
@@ -1139,21 +1306,65 @@ cluster_dict = {{"{0}":[], "{0}_arrows":[]}}
                 except:
                     raise AttributeError
 
-            r.download(out_dir=temp, compressed=False)
             targets.append(r)
 
-        prots, ligands = PharmacophoreModel._align_proteins(reference=ref,
-                                                            reference_chain=chain,
-                                                            targets=targets)
+        # the representatives are fetched concurrently into the cache, then copied
+        PDBClient.shared().fetch_all([r.identifier for r in targets])
+        for r in targets:
+            r.download(out_dir=temp, compressed=False)
+
+        prots, ligands, records = PharmacophoreModel._align_proteins(reference=ref,
+                                                                     reference_chain=chain,
+                                                                     targets=targets,
+                                                                     nprocesses=nprocesses,
+                                                                     binding_site=binding_site)
 
         p = PharmacophoreModel.from_ligands(ligands=ligands, identifier=identifier)
         p.all_ligands = all_ligands
         p.representatives = reps
         p.aligned_ligands = ligands
+        p.alignments = records
 
         return p
 
 
+class _PartnerIndex(object):
+    """
+    private class
+
+    spatial index of the hydrogen bond donors and acceptors of a protein, used to find the partner of polar features
+
+    :param `ccdc.protein.Protein` protein: target protein
+    """
+
+    def __init__(self, protein):
+        self._trees = {}
+        for feature_type, is_partner in (("donor", lambda a: a.is_acceptor), ("acceptor", lambda a: a.is_donor)):
+            atoms = [(f"{r.identifier.split(':')[1]}: {a.label}", a.coordinates)
+                     for r in protein.residues for a in r.atoms if is_partner(a)]
+            identifiers = [i for i, c in atoms]
+            coordinates = np.array([tuple(c) for i, c in atoms]).reshape(-1, 3)
+            tree = cKDTree(coordinates) if len(atoms) else None
+            self._trees[feature_type] = (tree, identifiers, [c for i, c in atoms])
+
+    def nearest(self, feature_type, coordinates, max_distance):
+        """
+        closest partner of each feature, within `max_distance`
+
+        :param str feature_type: "donor" or "acceptor"
+        :param `numpy.array` coordinates: (n, 3) feature coordinates
+        :param float max_distance: furthest acceptable partner
+        :return: list of (identifier, `ccdc.molecule.Coordinates`) or None for each feature
+        """
+        tree, identifiers, atom_coordinates = self._trees[feature_type]
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 3)
+        if tree is None or len(coordinates) == 0:
+            return [None] * len(coordinates)
+        distances, index = tree.query(coordinates, distance_upper_bound=max_distance)
+        return [(identifiers[i], atom_coordinates[i]) if np.isfinite(d) and d < max_distance else None
+                for d, i in zip(distances, index)]
+
+
 class _PharmacophoreFeature(Helper):
     """
     A class to construct pharmacophoric models based upon fragment hotspot maps.
@@ -1167,6 +1378,8 @@ class _PharmacophoreFeature(Helper):
     :param settings:
 
     """
+    __slots__ = ("_projected", "_feature_type", "_feature_coordinates", "_projected_coordinates",
+                 "_projected_identifier", "_score_value", "_vector", "settings")
 
     def __init__(self, projected, feature_type, feature_coordinates, projected_coordinates, projected_identifier,
                  score_value, vector, settings):
@@ -1212,7 +1425,7 @@ class _PharmacophoreFeature(Helper):
         return self._vector
 
     @staticmethod
-    def from_hotspot(grid, probe, protein, settings):
+    def from_hotspot(grid, probe, protein, settings, partners=None):
         """
         create a feature from a hotspot island
 
@@ -1220,51 +1433,48 @@ class _PharmacophoreFeature(Helper):
         :param str probe: probe type identifier
         :param `ccdc.protein.Protein` protein: target protein
         :param `hotspots.hs_pharmacophore.PharmacophoreModel.Settings` settings: settings
+        :param `hotspots.hs_pharmacophore._PartnerIndex` partners: hydrogen bonding partners of the protein, built
+                                                                   from `protein` if not supplied
         :return: :class:`hotspots.hs_pharmacophore._PharmacophoreFeature`
         """
-
         feature_type = probe
+        array = Grid.get_array(grid)
+        origin = np.array(tuple(grid.bounding_box[0]))
 
         if probe == "donor" or probe == "acceptor":
-            temp_g = grid.gaussian(sigma=0.5)
-            peaks = temp_g.get_peaks(min_distance=2, cutoff=0)
+            smoothed = ndimage.gaussian_filter(array, sigma=0.5)
+            peaks = Grid.array_peaks(smoothed, min_distance=2, cutoff=0)
+        else:
+            smoothed = ndimage.gaussian_filter(array, sigma=1)
+            peaks = Grid.array_peaks(smoothed, min_distance=4, cutoff=0)
 
-            feats = []
-            for peak in peaks:
-                try:
-                    projected_identifier, \
-                    projected_coordinates = _PharmacophoreFeature.get_projected_coordinates(feature_type,
-                                                                                            Coordinates(
-                                                                                                x=peak[0],
-                                                                                                y=peak[1],
-                                                                                                z=peak[
-                                                                                                    2]),
-                                                                                            protein,
-                                                                                            settings)
-                    print(projected_identifier, projected_coordinates)
-                    feats.append(_PharmacophoreFeature(projected=False,
-                                                       feature_type=feature_type,
-                                                       feature_coordinates=Coordinates(x=peak[0], y=peak[1], z=peak[2]),
-                                                       projected_identifier=projected_identifier,
-                                                       projected_coordinates=projected_coordinates,
-                                                       score_value=grid.value_at_point(peak),
-                                                       vector=None,
-                                                       settings=settings)
-                                 )
-                except TypeError:
-                    continue
+        coordinates = origin + peaks * grid.spacing
+        scores = array[tuple(peaks.T)] if len(peaks) else np.zeros(0)
+
+        if probe == "donor" or probe == "acceptor":
+            if partners is None:
+                partners = _PartnerIndex(protein)
+            # polar features without a hydrogen bonding partner are dropped
+            matched = partners.nearest(feature_type, coordinates, settings.max_hbond_dist)
+            feats = [_PharmacophoreFeature(projected=False,
+                                           feature_type=feature_type,
+                                           feature_coordinates=Coordinates(*c),
+                                           projected_identifier=match[0],
+                                           projected_coordinates=match[1],
+                                           score_value=float(score),
+                                           vector=None,
+                                           settings=settings)
+                     for c, score, match in zip(coordinates.tolist(), scores, matched) if match is not None]
         else:
-            temp_g = grid.gaussian(sigma=1)
-            peaks = temp_g.get_peaks(min_distance=4, cutoff=0)
             feats = [_PharmacophoreFeature(projected=False,
                                            feature_type=feature_type,
-                                           feature_coordinates=Coordinates(x=peak[0], y=peak[1], z=peak[2]),
-                                           projected_identifier=f"apolar:{grid.value_at_point(peak):.3}",
+                                           feature_coordinates=Coordinates(*c),
+                                           projected_identifier=f"apolar:{score:.3}",
                                            projected_coordinates=None,
-                                           score_value=grid.value_at_point(peak),
+                                           score_value=float(score),
                                            vector=None,
                                            settings=settings)
-                     for peak in peaks]
+                     for c, score in zip(coordinates.tolist(), scores)]
 
         return feats
 
@@ -1398,26 +1608,13 @@ class _PharmacophoreFeature(Helper):
         :return: score, float, and coords, ccdc.molecule.Coordinate
         """
 
-        weighted_x = 0
-        weighted_y = 0
-        weighted_z = 0
-        total_mass = 0
-        nx, ny, nz = grid.nsteps
-
-        for i in range(nx):
-            for j in range(ny):
-                for k in range(nz):
-                    grid_val = grid.value(i, j, k)
-                    x, y, z = grid.indices_to_point(i, j, k)
-                    weighted_x += grid_val * x
-                    weighted_y += grid_val * y
-                    weighted_z += grid_val * z
-                    total_mass += grid_val
-
-        coords = Coordinates(np.divide(weighted_x, total_mass),
-                             np.divide(weighted_y, total_mass),
-                             np.divide(weighted_z, total_mass)
-                             )
+        array = Grid.get_array(grid)
+        total_mass = array.sum()
+        # the weighted mean index along each axis, from the marginal sums of the array
+        mean_index = [np.divide(np.dot(array.sum(axis=tuple(a for a in range(3) if a != axis)),
+                                       np.arange(n)), total_mass)
+                      for axis, n in enumerate(array.shape)]
+        coords = Coordinates(*[o + grid.spacing * i for o, i in zip(grid.bounding_box[0], mean_index)])
         score = grid.value_at_point(coords)
 
         return float(score), coords
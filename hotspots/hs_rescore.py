@@ -0,0 +1,450 @@
+"""
+The :mod:`hotspots.hs_rescore` module rescores docked poses in Fragment Hotspot Map fields, in bulk.
+
+A result is first written to a compact rescoring file (.npz): its probe grids on one frame and, optionally, the mask
+of its best continuous volume (BCV). A :class:`hotspots.hs_rescore.Rescorer` loads the file once and precomputes
+everything a pose needs, so scoring a pose is a handful of array lookups:
+
+- score: the mean hotspot score of the heavy atoms, as `hotspots.result.Results.score`
+- percentage matched: the percentage of heavy atoms whose van der Waals sphere overlaps the grid of their atom type,
+  as `hotspots.result.Results.percentage_matched_atoms`
+- BCV overlap: the percentage of the ligand volume inside the best continuous volume
+
+SD and mol2 pose files are split into byte ranges without parsing them, and the ranges are scored in worker
+processes, each holding its own :class:`hotspots.hs_rescore.Rescorer`. Scores are yielded in file order as they
+complete, so libraries of millions of poses are streamed rather than held in memory.
+
+The main class of the :mod:`hotspots.hs_rescore` module is:
+
+- :class:`hotspots.hs_rescore.Rescorer`
+
+>>> from hotspots.hs_rescore import Rescorer, build_compact, write_scores
+
+>>> build_compact("1hcl/out.zip", "1hcl.npz", bcv_volume=400)
+>>> rescorer = Rescorer("1hcl.npz")
+>>> write_scores(rescorer.rescore(["poses_1.sdf", "poses_2.sdf"], nprocesses=16), "scores.csv")
+"""
+from __future__ import print_function, division
+
+import collections
+import csv
+import os
+import re
+from concurrent import futures
+from os.path import splitext
+
+import numpy as np
+from scipy import ndimage
+
+from hotspots.grid_io import GridData
+
+# probe grids kept by :func:`write_compact`
+PROBES = ("apolar", "donor", "acceptor", "positive", "negative")
+
+_POSE_FORMATS = {".sdf": "sdf", ".sd": "sdf", ".mol2": "mol2"}
+
+# per process: loaded rescorers, keyed by the rescoring file and settings
+_rescorers = {}
+
+# grid offsets covering a sphere, keyed by (radius, spacing)
+_stencils = {}
+
+
+class PoseScore(collections.namedtuple("PoseScore", ["index", "identifier", "score", "percentage_matched",
+                                                     "bcv_overlap", "n_atoms", "error"])):
+    """
+    The scores of one pose
+
+    :param int index: position of the pose in the stream
+    :param str identifier: pose identifier
+    :param float score: mean hotspot score of the heavy atoms
+    :param float percentage_matched: percentage of heavy atoms overlapping the grid of their type
+    :param float bcv_overlap: percentage of the ligand volume in the best continuous volume, None without a BCV
+    :param int n_atoms: number of heavy atoms
+    :param str error: why the pose could not be scored, None on success
+    """
+    __slots__ = ()
+
+    @property
+    def success(self):
+        return self.error is None
+
+
+def _frame(grids):
+    """
+    the frame enclosing a set of grids with the same spacing
+
+    :return: tup, (`numpy.array` origin, tup shape, float spacing)
+    """
+    spacings = set(float(g.spacing) for g in grids)
+    if len(spacings) != 1:
+        raise ValueError("grids have different spacings: {}".format(sorted(spacings)))
+    spacing = spacings.pop()
+    origin = np.min([g.origin for g in grids], axis=0)
+    far_corner = np.max([g.far_corner for g in grids], axis=0)
+    shape = tuple(int(n) for n in np.round((far_corner - origin) / spacing) + 1)
+    return origin, shape, spacing
+
+
+def _place(grid, origin, shape, spacing):
+    """
+    copies a grid into a larger frame, points outside the grid are 0
+    """
+    out = np.zeros(shape, dtype=np.float32)
+    offset = np.round((np.asarray(grid.origin) - origin) / spacing).astype(int)
+    array = np.asarray(grid.array)
+    out[tuple(slice(o, o + n) for o, n in zip(offset, array.shape))] = array
+    return out
+
+
+def write_compact(fname, grids, bcv=None):
+    """
+    writes a rescoring file: the probe grids on a common frame and the best continuous volume mask
+
+    :param str fname: path to output file (.npz)
+    :param dict grids: {probe: :class:`hotspots.grid_io.GridData`}, other keys (e.g. "buriedness") are ignored
+    :param dict bcv: {probe: :class:`hotspots.grid_io.GridData`}, the best continuous volume grids, optional
+    """
+    grids = {p: g for p, g in grids.items() if p in PROBES}
+    if not grids:
+        raise ValueError("no probe grids to write")
+    origin, shape, spacing = _frame(list(grids.values()) + list((bcv or {}).values()))
+    arrays = {"grid_{}".format(p): _place(g, origin, shape, spacing) for p, g in grids.items()}
+    if bcv:
+        arrays["bcv"] = np.any([_place(g, origin, shape, spacing) > 0 for g in bcv.values()], axis=0)
+    np.savez(fname, origin=origin, spacing=spacing, **arrays)
+
+
+def build_compact(path, fname, bcv_volume=None):
+    """
+    writes the rescoring file of a Fragment Hotspot Maps result
+
+    :param str path: path to the result (directory or .zip)
+    :param str fname: path to output file (.npz)
+    :param float bcv_volume: if given, the best continuous volume of this volume (Angstroms ^ 3) is included
+    """
+    from hotspots.hs_docking_prep import best_volume
+    from hotspots.hs_io import HotspotReader
+
+    with HotspotReader(path) as reader:
+        protein = reader.protein
+        grids = {p: GridData(np.array(g.array), g.origin, g.spacing) for p, g in reader.read_arrays().items()
+                 if p in PROBES}
+    bcv = best_volume(grids, protein, volume=bcv_volume) if bcv_volume else None
+    write_compact(fname, grids, bcv=bcv)
+
+
+def _sphere_points(relative, radii, spacing):
+    """
+    the grid points within each atom's radius
+
+    :param relative: (n, 3) atom positions in grid units
+    :param radii: (n,) radii in Angstroms
+    :param float spacing: grid spacing
+    :return: tup, (`numpy.array` atom of each point, (m, 3) `numpy.array` point indices)
+    """
+    atoms, points = [], []
+    for r in np.unique(radii):
+        selected = np.flatnonzero(radii == r)
+        if (r, spacing) not in _stencils:
+            n = int(np.ceil(r / spacing))
+            _stencils[(r, spacing)] = np.mgrid[-n:n + 1, -n:n + 1, -n:n + 1].reshape(3, -1).T
+        offsets = _stencils[(r, spacing)]
+        p = np.round(relative[selected]).astype(int)[:, None, :] + offsets[None, :, :]
+        inside = np.sqrt((((p - relative[selected][:, None, :]) * spacing) ** 2).sum(axis=2)) <= r
+        atoms.append(np.broadcast_to(selected[:, None], inside.shape)[inside])
+        points.append(p[inside])
+    return np.concatenate(atoms), np.concatenate(points)
+
+
+def _pose_format(path):
+    ext = splitext(path)[1].lower()
+    if ext not in _POSE_FORMATS:
+        raise ValueError("unsupported pose file {}, expected one of {}".format(path, sorted(_POSE_FORMATS)))
+    return _POSE_FORMATS[ext]
+
+
+def _next_boundary(f, position, fmt, size):
+    """
+    the first record boundary at or after `position`
+    """
+    if position >= size:
+        return size
+    f.seek(position)
+    f.readline()
+    while True:
+        start = f.tell()
+        line = f.readline()
+        if not line:
+            return size
+        if fmt == "sdf" and line.rstrip() == b"$$$$":
+            return f.tell()
+        if fmt == "mol2" and line.startswith(b"@<TRIPOS>MOLECULE"):
+            return start
+
+
+def pose_chunks(path, chunk_bytes=1 << 22):
+    """
+    splits a pose file into byte ranges of whole records, reading only around the range boundaries
+
+    :param str path: path to .sdf or .mol2 file
+    :param int chunk_bytes: approximate size of each range
+    :return: generator of tup, (start, end) byte offsets
+    """
+    fmt = _pose_format(path)
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            end = _next_boundary(f, start + chunk_bytes, fmt, size)
+            yield start, end
+            start = end
+
+
+def split_records(text, fmt):
+    """
+    splits the text of a pose file into one string per record
+
+    :param str text: file contents
+    :param str fmt: "sdf" or "mol2"
+    :return: list of str
+    """
+    if fmt == "sdf":
+        return [r + "$$$$\n" for r in re.split(r"(?m)^\$\$\$\$[^\n]*\n?", text) if r.strip()]
+    return [r for r in re.split(r"(?m)^(?=@<TRIPOS>MOLECULE)", text) if r.strip()]
+
+
+def atom_arrays(mol):
+    """
+    the heavy atom properties used for rescoring
+
+    :param `ccdc.molecule.Molecule` mol: pose
+    :return: tup, ((n, 3) coordinates, (n,) van der Waals radii, (n,) score atom types, (n,) match atom types)
+    """
+    from hotspots.hs_utilities import Helper
+    from hotspots.result import _Scorer
+
+    atoms = mol.heavy_atoms
+    coordinates = np.array([tuple(a.coordinates) for a in atoms], dtype=float).reshape(-1, 3)
+    radii = np.array([a.vdw_radius for a in atoms], dtype=float)
+    score_types = np.array([_Scorer._atom_type(a) for a in atoms], dtype=object)
+    match_types = np.array([Helper.get_atom_type(a) for a in atoms], dtype=object)
+    return coordinates, radii, score_types, match_types
+
+
+def _score_chunk(args):
+    """
+    worker: scores the poses in one byte range of a pose file
+
+    :param tup args: (rescoring file, settings, pose file, start, end)
+    :return: list of :class:`hotspots.hs_rescore.PoseScore`, with indices counted from the start of the range
+    """
+    from ccdc.molecule import Molecule
+
+    fname, settings, path, start, end = args
+    key = (fname, tuple(sorted(vars(settings).items())))
+    if key not in _rescorers:
+        _rescorers[key] = Rescorer(fname, settings=settings)
+    rescorer = _rescorers[key]
+
+    fmt = _pose_format(path)
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8", errors="replace")
+
+    records = []
+    for i, record in enumerate(split_records(text, fmt)):
+        try:
+            mol = Molecule.from_string(record, format=fmt)
+        except Exception as e:
+            records.append(PoseScore(i, record.split("\n", 1)[0].strip(), None, None, None, 0,
+                                     "{}: {}".format(type(e).__name__, e)))
+            continue
+        records.append(rescorer.score_molecule(mol)._replace(index=i))
+    return records
+
+
+def _ordered_map(executor, func, jobs, window):
+    """
+    as `executor.map`, but submits at most `window` jobs ahead of the results consumed
+    """
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(executor.submit(func, job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def write_scores(records, fname):
+    """
+    writes pose scores to a .csv file as they arrive
+
+    :param records: iterable of :class:`hotspots.hs_rescore.PoseScore`
+    :param str fname: path to output file
+    :return: int, number of poses written
+    """
+    n = 0
+    with open(fname, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(PoseScore._fields)
+        for r in records:
+            writer.writerow(r)
+            n += 1
+    return n
+
+
+class Rescorer(object):
+    """
+    Scores poses against a rescoring file written by :func:`hotspots.hs_rescore.write_compact`
+
+    :param str fname: path to the rescoring file (.npz)
+    :param `hotspots.hs_rescore.Rescorer.Settings` settings: rescoring settings
+    """
+    class Settings(object):
+        """
+        settings available for adjustment
+
+        :param int tolerance: atoms score the best grid value within this many grid points, as
+                              `hotspots.result.Results.score`
+        :param float match_threshold: percentage of an atom's volume that must overlap the grid for a match
+        :param bool match_atom_types: match atoms against the grid of their type, otherwise against all grids
+        """
+        def __init__(self, tolerance=2, match_threshold=30, match_atom_types=True):
+            self.tolerance = tolerance
+            self.match_threshold = match_threshold
+            self.match_atom_types = match_atom_types
+
+    def __init__(self, fname, settings=None):
+        if settings is None:
+            self.settings = self.Settings()
+        else:
+            self.settings = settings
+        self.path = os.path.abspath(fname)
+
+        with np.load(fname) as data:
+            self.origin = np.asarray(data["origin"], dtype=float)
+            self.spacing = float(data["spacing"])
+            grids = {k[len("grid_"):]: data[k] for k in data.files if k.startswith("grid_")}
+            self._bcv = data["bcv"] if "bcv" in data.files else None
+
+        # the best value within the tolerance cube of each point, values under 0.1 count as 0
+        size = 2 * self.settings.tolerance + 1
+        self._values = {}
+        for p, array in grids.items():
+            values = ndimage.maximum_filter(array, size=size, mode="constant", cval=0)
+            values[values < 0.1] = 0
+            self._values[p] = values
+        self._occupied = {p: array > 0 for p, array in grids.items()}
+        self._occupied["all"] = np.any(list(self._occupied.values()), axis=0)
+        self.shape = next(iter(grids.values())).shape
+
+    def _flat(self, points):
+        """
+        flat indices of the integer grid points inside the grid
+
+        :return: tup, (`numpy.array` bool, True for points inside the grid, `numpy.array` their flat indices)
+        """
+        valid = np.all((points >= 0) & (points < self.shape), axis=-1)
+        return valid, np.ravel_multi_index(tuple(points[valid].T), self.shape)
+
+    def score_arrays(self, coordinates, radii, score_types, match_types):
+        """
+        scores one pose from its heavy atom arrays, see :func:`hotspots.hs_rescore.atom_arrays`
+
+        :return: tup, (float score, float percentage matched, float BCV overlap or None)
+        """
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 3)
+        n = len(coordinates)
+        if n == 0:
+            return 0., 0., None if self._bcv is None else 0.
+        radii = np.asarray(radii, dtype=float)
+        score_types = np.asarray(score_types, dtype=object)
+        match_types = np.asarray(match_types, dtype=object)
+
+        relative = (coordinates - self.origin) / self.spacing
+        centres = np.round(relative).astype(int)
+        zero = np.zeros(n)
+        valid, flat = self._flat(centres)
+        values = {}
+        for p, v in self._values.items():
+            values[p] = np.zeros(n)
+            values[p][valid] = v.ravel()[flat]
+        atom_scores = np.zeros(n)
+        for p in ("apolar", "donor", "acceptor"):
+            selected = score_types == p
+            atom_scores[selected] = values.get(p, zero)[selected]
+        selected = score_types == "doneptor"
+        atom_scores[selected] = np.maximum(values.get("donor", zero), values.get("acceptor", zero))[selected]
+
+        atoms, points = _sphere_points(relative, radii, self.spacing)
+        volume = np.bincount(atoms, minlength=n)
+        valid, flat = self._flat(points)
+        if self.settings.match_atom_types:
+            groups = [(p, [p, "doneptor"] if p in ("donor", "acceptor") else [p]) for p in self._occupied if p != "all"]
+        else:
+            groups = [("all", list(set(match_types)))]
+        matched = 0
+        for p, types in groups:
+            selected = np.isin(match_types, types)
+            if not selected.any():
+                continue
+            overlap = np.bincount(atoms[valid], weights=self._occupied[p].ravel()[flat], minlength=n)
+            matched += np.count_nonzero((overlap / volume * 100)[selected] > self.settings.match_threshold)
+
+        bcv_overlap = None
+        if self._bcv is not None:
+            # the union of the atom spheres, each point counted once
+            inside = np.unique(flat)
+            if valid.all():
+                union = len(inside)
+            else:
+                low = points.min(axis=0)
+                box = tuple(points.max(axis=0) - low + 1)
+                union = len(np.unique(np.ravel_multi_index(tuple((points - low).T), box)))
+            bcv_overlap = round(np.count_nonzero(self._bcv.ravel()[inside]) / union * 100, 1)
+
+        return float(atom_scores.mean()), round(matched / n * 100, 1), bcv_overlap
+
+    def score_molecule(self, mol):
+        """
+        scores one pose
+
+        :param `ccdc.molecule.Molecule` mol: pose
+        :return: :class:`hotspots.hs_rescore.PoseScore`
+        """
+        coordinates, radii, score_types, match_types = atom_arrays(mol)
+        score, matched, bcv_overlap = self.score_arrays(coordinates, radii, score_types, match_types)
+        return PoseScore(0, mol.identifier, score, matched, bcv_overlap, len(coordinates), None)
+
+    def rescore(self, paths, nprocesses=None, chunk_bytes=1 << 22):
+        """
+        scores every pose of one or more pose files in worker processes
+
+        :param paths: path, or list of paths, to .sdf or .mol2 files
+        :param int nprocesses: number of worker processes (default: one per CPU), 1 scores in this process
+        :param int chunk_bytes: approximate size of the pose file range scored by a worker at once
+        :return: generator of :class:`hotspots.hs_rescore.PoseScore`, in file order, indexed across all files
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        for path in paths:
+            _pose_format(path)
+        jobs = ((self.path, self.settings, path, start, end)
+                for path in paths for start, end in pose_chunks(path, chunk_bytes))
+
+        nprocesses = nprocesses or os.cpu_count() or 1
+        index = 0
+        if nprocesses <= 1:
+            for records in map(_score_chunk, jobs):
+                for r in records:
+                    yield r._replace(index=index)
+                    index += 1
+            return
+
+        with futures.ProcessPoolExecutor(max_workers=nprocesses) as executor:
+            for records in _ordered_map(executor, _score_chunk, jobs, window=2 * nprocesses):
+                for r in records:
+                    yield r._replace(index=index)
+                    index += 1
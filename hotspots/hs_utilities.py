@@ -15,10 +15,6 @@ import tempfile
 from os import mkdir
 from os.path import exists, join, abspath
 
-# import matplotlib as mpl
-# mpl.use('TkAgg')
-import matplotlib.pyplot as plt
-
 import numpy as np
 
 from ccdc.cavity import Cavity
@@ -68,6 +64,9 @@ class Helper(object):
     """
     A class to handle miscellaneous functionality
     """
+    # no instance attributes, so subclasses can use __slots__
+    __slots__ = ()
+
     @staticmethod
     def get_distance(coords1, coords2):
         """
@@ -324,11 +323,12 @@ class Figures(object):
                            "apolar": "y",
                            "negative": "m",
                            "positive": "c"}
+            import matplotlib.pyplot as plt
             plt.figure(1)
             for n, key in enumerate(data.keys()):
                 j = int(len(data.keys()))
                 plt.subplot(j, 1, (n + 1))
-                hist, bin_edges = np.histogram(data[key], bins=range(0, 40), normed=True)
+                hist, bin_edges = np.histogram(data[key], bins=range(0, 40), density=True)
                 Figures._histogram_settings(bin_edges)
                 if n == 0:
                     plt.title(title)
@@ -349,6 +349,8 @@ class Figures(object):
         :param title:
         :return:
         """
+        import matplotlib.pyplot as plt
+
         plt.xlim(min(bin_edges), max(bin_edges))
         plt.ylim(0, 0.35)
         plt.yticks([])
@@ -363,8 +365,10 @@ class Figures(object):
         :return:
         """
 
+        import matplotlib.pyplot as plt
+
         colour_dict = {"acceptor": "r", "donor": "b", "apolar": "y"}
-        hist, bin_edges = np.histogram(data[key], bins=range(0, 40), normed=True)
+        hist, bin_edges = np.histogram(data[key], bins=range(0, 40), density=True)
         plt.bar(bin_edges[:-1], hist, width=1, color=colour_dict[key])
         plt.xlim(min(bin_edges), max(bin_edges))
         plt.ylim(0, 0.35)
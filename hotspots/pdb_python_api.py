@@ -5,15 +5,36 @@ Thank-you pypdb.py for a great starting point [ref]
 
 - aiming to open up all search combinations
 - composite queries
+
+Structure files and entry metadata are fetched through :class:`hotspots.pdb_python_api.PDBClient`, which runs
+requests concurrently over pooled connections and keeps an on-disk cache:
+
+>>> from hotspots.pdb_python_api import PDBClient
+
+>>> client = PDBClient(max_connections=16)
+>>> paths = client.download_all(["1hcl", "1aq1", "2vta"], out_dir="structures")
+
+Setting the environment variable HOTSPOTS_PDB_MIRROR to a directory of structure files (or to the base URL of a
+local stand-in server) redirects all structure downloads, e.g. for offline clusters and tests.
 """
 from __future__ import print_function, division
 
+import asyncio
+import gzip
+import hashlib
+import http.client
+import io
 import os
 import sys
 import shutil
+import tempfile
+from os.path import join, exists, expanduser
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
 
 import xmltodict
 from hotspots.data import common_solvents
+from hotspots.rest_client import ConnectionPool
 from tqdm import tqdm
 
 if sys.version_info.major == 2:
@@ -26,6 +47,7 @@ else:
 
 
 base_url = 'http://www.rcsb.org/pdb/rest'
+files_url = 'https://files.rcsb.org/download'
 
 
 class Helper(object):
@@ -373,13 +395,13 @@ class PDBResult(object):
         :param identifier:
         """
         self.identifier = identifier
+        # ligand information is only requested when first used
+        self._ligands = None
 
-        self._ligands = self.get_ligands()
-
-    def _raw_properties(self, info_type='ligand'):
+    def _url(self, info_type='ligand'):
         """
 
-        :return:
+        :return: str, url of the metadata request
         """
         info_type_dict = {'describe_pdb': '/describePDB?structureId=',
                           'describe_mol': '/describeMol?structureId=',
@@ -387,8 +409,25 @@ class PDBResult(object):
                           'pfam': '/hmmer?structureId=',
                           'general': '/getEntityInfo?structureId='}
 
-        url = request(base_url + info_type_dict[info_type] + self.identifier)
-        return urlopen(url)
+        return base_url + info_type_dict[info_type] + self.identifier
+
+    def _raw_properties(self, info_type='ligand'):
+        """
+
+        :return:
+        """
+        return io.BytesIO(PDBClient.shared().metadata(self._url(info_type)))
+
+    @staticmethod
+    def prefetch(results, info_type='ligand'):
+        """
+        requests the metadata of many entries concurrently, later requests are read from the cache
+
+        :param list results: :class:`hotspots.pdb_python_api.PDBResult` instances
+        :param str info_type: 'ligand', 'describe_pdb', 'describe_mol', 'pfam' or 'general'
+        :return:
+        """
+        PDBClient.shared().metadata_all([r._url(info_type) for r in results])
 
     def custom(self, field="classification"):
         """
@@ -428,6 +467,8 @@ class PDBResult(object):
     @property
     def ligands(self):
         """"""
+        if self._ligands is None:
+            self._ligands = self.get_ligands()
         return self._ligands
 
     def get_ligands(self):
@@ -453,7 +494,7 @@ class PDBResult(object):
     def filtered_ligands(self):
         """"""
         cs = common_solvents()
-        return [lig for lig in self._ligands if lig.chemical_id not in cs and
+        return [lig for lig in self.ligands if lig.chemical_id not in cs and
                                                 float(lig.molecular_weight) > 120]
 
     def download(self, out_dir, compressed=False, biological_assembly=False):
@@ -469,12 +510,7 @@ class PDBResult(object):
         else:
             extension = ".pdb"
 
-        url = "https://files.rcsb.org/download/{}{}".format(self.identifier, extension)
-
-        pdbfile = urlopen(url).read()
-
-        if sys.version_info.major == 3:
-            pdbfile = pdbfile.decode('utf-8')
+        cached = PDBClient.shared().fetch(self.identifier, fmt=extension[1:])
 
         if compressed:
             out = os.path.join(out_dir, self.identifier)
@@ -482,16 +518,239 @@ class PDBResult(object):
                 os.mkdir(out)
 
             self.fname = os.path.join(out, self.identifier + extension)
-
-            with open(self.fname, "w") as writer:
-                writer.write(pdbfile)
+            shutil.copyfile(cached, self.fname)
 
             shutil.make_archive(out, 'zip', out)
             shutil.rmtree(out)
 
         else:
             self.fname = os.path.join(out_dir, self.identifier + extension)
-            with open(self.fname, "w") as writer:
-                writer.write(pdbfile)
+            shutil.copyfile(cached, self.fname)
+
+
+
+
+class PDBClient(ConnectionPool):
+    """
+    A PDB client with pooled keep-alive connections, bounded concurrency, retries and a persistent on-disk cache
+
+    Structure files are cached by PDB code and format ("pdb", "pdb1", "cif", and their ".gz" forms). Uncompressed
+    formats are transferred gzipped where the server has them and decompressed into the cache. Entry metadata is
+    cached by request URL. Cache files are written to a temporary name and moved into place, so several processes
+    can share one cache directory.
+
+    Requests for the same file made while it is being fetched share one transfer. The blocking methods can be used
+    from any thread; the `_async` methods are for use in an event loop.
+
+    :param str cache_dir: cache directory (default: $HOTSPOTS_PDB_CACHE or ~/.cache/hotspots/pdb)
+    :param str mirror: directory of structure files, or base URL of a server laid out like files.rcsb.org/download
+                       (default: $HOTSPOTS_PDB_MIRROR)
+    :param int max_connections: maximum number of concurrent requests
+    :param int retries: number of retries of a failed request, with exponential back-off
+    :param float timeout: socket timeout in seconds
+    """
+    def __init__(self, cache_dir=None, mirror=None, max_connections=8, retries=3, timeout=60):
+        super(PDBClient, self).__init__(max_connections=max_connections, retries=retries, timeout=timeout)
+        self.cache_dir = cache_dir or os.environ.get("HOTSPOTS_PDB_CACHE") or \
+            join(expanduser("~"), ".cache", "hotspots", "pdb")
+        self.mirror = mirror or os.environ.get("HOTSPOTS_PDB_MIRROR")
+        self._pending = {}
+
+    def cache_path(self, identifier, fmt="pdb"):
+        """
+        :param str identifier: PDB code
+        :param str fmt: file format, e.g. "pdb", "cif" or "pdb.gz"
+        :return: str, path of the cached file
+        """
+        code = identifier.lower()
+        return join(self.cache_dir, fmt, code[1:3], "{}.{}".format(code, fmt))
 
+    def _retrieve(self, identifier, fmt, fileobj):
+        """
+        writes a structure file from the mirror or the PDB to `fileobj`
 
+        :param str identifier: PDB code
+        :param str fmt: file format
+        :param fileobj: binary file object
+        :return:
+        """
+        name = "{}.{}".format(identifier, fmt)
+        # (file name, transferred compressed)
+        if fmt.endswith(".gz"):
+            candidates = [(name, False)]
+        else:
+            candidates = [(name + ".gz", True), (name, False)]
+
+        if self.mirror and not urlsplit(self.mirror).scheme:
+            for n, compressed in candidates:
+                for path in (join(self.mirror, n.upper()[:4] + n[4:]), join(self.mirror, n.lower())):
+                    if exists(path):
+                        with (gzip.open(path, "rb") if compressed else open(path, "rb")) as f:
+                            shutil.copyfileobj(f, fileobj, 1 << 16)
+                        return
+            raise IOError("{} is not in the mirror {}".format(name, self.mirror))
+
+        base = (self.mirror or files_url).rstrip("/")
+        error = None
+        for n, compressed in candidates:
+            url = "{}/{}".format(base, n.upper()[:4] + n[4:])
+            try:
+                if compressed:
+                    with tempfile.TemporaryFile() as raw:
+                        self._get(url, raw)
+                        raw.seek(0)
+                        fileobj.seek(0)
+                        fileobj.truncate()
+                        with gzip.GzipFile(fileobj=raw) as f:
+                            shutil.copyfileobj(f, fileobj, 1 << 16)
+                else:
+                    self._get(url, fileobj)
+                return
+            except HTTPError as e:
+                if e.code != 404:
+                    raise
+                error = e
+        raise error
+
+    def _store(self, path, write):
+        """
+        writes a cache entry through a temporary file, unless it exists
+
+        :param str path: cache path
+        :param write: callable writing the content to a binary file object
+        :return: str, path
+        """
+        if exists(path):
+            return path
+        directory = os.path.dirname(path)
+        if not exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".")
+        try:
+            with os.fdopen(fd, "w+b") as f:
+                write(f)
+            os.replace(tmp, path)
+        finally:
+            if exists(tmp):
+                os.remove(tmp)
+        return path
+
+    def _submit(self, key, func, *args):
+        """
+        runs `func` on the pool, or returns the future of the same request if it is already running
+        """
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = self._executor.submit(func, *args)
+            self._pending[key] = future
+        # outside the lock: the callback runs at once if the job has already finished
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def _fetch(self, identifier, fmt):
+        return self._store(self.cache_path(identifier, fmt), lambda f: self._retrieve(identifier, fmt, f))
+
+    def _metadata(self, url):
+        code = hashlib.sha1(url.encode()).hexdigest()
+        path = self._store(join(self.cache_dir, "metadata", code[:2], code + ".xml"), lambda f: self._get(url, f))
+        with open(path, "rb") as f:
+            return f.read()
+
+    def fetch(self, identifier, fmt="pdb"):
+        """
+        a structure file, from the cache if present
+
+        :param str identifier: PDB code
+        :param str fmt: file format, e.g. "pdb", "pdb1", "cif" or "pdb.gz"
+        :return: str, path of the cached file
+        """
+        return self._submit(("file", identifier.lower(), fmt), self._fetch, identifier, fmt).result()
+
+    def metadata(self, url):
+        """
+        the body of a metadata request (e.g. the PDB REST describe and ligand services), from the cache if present
+
+        :param str url: request URL
+        :return: bytes
+        """
+        return self._submit(("metadata", url), self._metadata, url).result()
+
+    async def fetch_async(self, identifier, fmt="pdb"):
+        """
+        :meth:`fetch`, awaitable
+
+        :param str identifier: PDB code
+        :param str fmt: file format
+        :return: str, path of the cached file
+        """
+        return await asyncio.wrap_future(self._submit(("file", identifier.lower(), fmt), self._fetch, identifier, fmt))
+
+    async def metadata_async(self, url):
+        """
+        :meth:`metadata`, awaitable
+
+        :param str url: request URL
+        :return: bytes
+        """
+        return await asyncio.wrap_future(self._submit(("metadata", url), self._metadata, url))
+
+    def metadata_all(self, urls):
+        """
+        requests many metadata URLs concurrently
+
+        :param list urls: request URLs
+        :return: list of bytes (None where the request failed)
+        """
+        jobs = [self._submit(("metadata", url), self._metadata, url) for url in urls]
+        out = []
+        for url, job in zip(urls, jobs):
+            try:
+                out.append(job.result())
+            except (IOError, http.client.HTTPException) as e:
+                print("WARNING: {} could not be fetched ({})".format(url, e))
+                out.append(None)
+        return out
+
+    def fetch_all(self, identifiers, fmt="pdb"):
+        """
+        fetches many structures concurrently
+
+        :param list identifiers: PDB codes
+        :param str fmt: file format
+        :return: list of str, cached paths in the order of `identifiers` (None where the fetch failed)
+        """
+        jobs = [self._submit(("file", i.lower(), fmt), self._fetch, i, fmt) for i in identifiers]
+        paths = []
+        for identifier, job in zip(identifiers, jobs):
+            try:
+                paths.append(job.result())
+            except (IOError, http.client.HTTPException) as e:
+                print("WARNING: {} could not be fetched ({})".format(identifier, e))
+                paths.append(None)
+        return paths
+
+    def download_all(self, identifiers, out_dir, fmt="pdb"):
+        """
+        fetches many structures concurrently and copies them to `out_dir` as <identifier>.<fmt>
+
+        :param list identifiers: PDB codes
+        :param str out_dir: output directory
+        :param str fmt: file format
+        :return: list of str, output paths (None where the fetch failed)
+        """
+        out = []
+        for identifier, cached in zip(identifiers, self.fetch_all(identifiers, fmt)):
+            if cached is None:
+                out.append(None)
+                continue
+            fname = join(out_dir, "{}.{}".format(identifier, fmt))
+            shutil.copyfile(cached, fname)
+            out.append(fname)
+        return out
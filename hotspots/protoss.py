@@ -1,52 +1,35 @@
-import shlex, subprocess, ast, time, json, os, csv, re, urllib, tempfile
+"""
+This script wraps around the Protoss web service of the Protein Plus server, which adds hydrogens to PDB entries
+
+Jobs are run by :class:`hotspots.rest_client.JobClient`, so many entries can be protonated concurrently:
+
+>>> from hotspots.protoss import Protoss
+
+>>> protoss = Protoss(out_dir="protonated")
+>>> result = protoss.add_hydrogens("3cqw")
+>>> results = protoss.add_hydrogens_all(["3cqw", "1hcl", "1aq1"])
+"""
+import asyncio
+import os
+import tempfile
+
 from ccdc.protein import Protein
 from ccdc.io import MoleculeReader
+from hotspots.rest_client import JobClient, run_sync, gather
 
 
 class Result(object):
+    """
+    The output of a Protoss job
 
-    def __init__(self, data, out_dir):
+    :param dict data: the finished job
+    :param dict files: {"protein": list of str, "ligands": list of str}, paths of the downloaded output files
+    """
+    def __init__(self, data, files):
         self.data = data
-        self.files = {'protein':[], 'ligands':[]}
-        self.out_dir = out_dir
-        self._write()
+        self.files = files
         self._protein = Protein.from_file(self.files['protein'][0])
-        self._ligands = [y for y in [MoleculeReader(x) for x in self.files['ligands']]]
-
-    def _write(self):
-        """
-        save the ensemble data to output directory
-
-        :param str out_dir: path to output directory
-        """
-        for t in self.files.keys():
-            new_out_dir = os.path.join(self.out_dir, t)
-            if not os.path.exists(new_out_dir):
-                os.mkdir(new_out_dir)
-
-            urls = self.data[t]
-
-            if type(urls) is list:
-                for url in urls:
-                    self.files[t].append(self._out(url, new_out_dir))
-            else:
-                self.files[t].append(self._out(urls, new_out_dir))
-
-    def _out(self, url, out_dir):
-        """
-
-        :param url:
-        :param out_dir:
-        :return:
-        """
-        url = re.sub('/esults/', '/results/', url)              # fix url
-        a = urllib.parse.urlparse(url)
-        fname = os.path.basename(a.path)
-        str = urllib.request.urlopen(url).read()
-        path = os.path.join(out_dir, fname)
-        with open(path, "wb") as w:
-            w.write(str)
-        return path
+        self._ligands = [MoleculeReader(x) for x in self.files['ligands']]
 
     @property
     def protein(self):
@@ -59,66 +42,52 @@ class Result(object):
 
 class Protoss(object):
     """
+    Adds hydrogens to PDB entries
 
+    :param str out_dir: path to output directory, entries of :meth:`add_hydrogens_all` are written to
+                        <out_dir>/<pdb_code> (default: a new temporary directory)
+    :param `hotspots.rest_client.JobClient` client: job client (default: the shared client)
     """
-    def __init__(self, out_dir=tempfile.mkdtemp()):
-        """
-        """
-        self.url = "https://proteins.plus/api/protoss_rest"
-        self.data = {"protoss": {"pdbCode": ""}}
-        self.pdb = ""
-        self.out_dir = out_dir
+    def __init__(self, out_dir=None, client=None):
+        self.client = client or JobClient.shared()
+        self.url = self.client.service_url("protoss")
+        self.out_dir = out_dir or tempfile.mkdtemp()
 
-    def add_hydrogens(self, pdb_code):
+    async def add_hydrogens_async(self, pdb_code, out_dir=None):
         """
+        :meth:`add_hydrogens`, awaitable
 
-		"""
-        self.pdb = pdb_code
-        self.data['protoss']["pdbCode"] = pdb_code
-        results_url = self._post()
-        return Result(data=self._get(results_url), out_dir=self.out_dir)
-
-    def _run(self, cmd):
+        :param str pdb_code: PDB code
+        :param str out_dir: path to output directory (default: `Protoss.out_dir`)
+        :return: :class:`hotspots.protoss.Result`
         """
-        runs commandline procedure (urllib doesn't work for some reason)
+        out_dir = out_dir or self.out_dir
+        data = await self.client.run(self.url, {"protoss": {"pdbCode": pdb_code}})
 
-        :param str cmd: command line str using curl
-        :return:
-        """
-        args = shlex.split(cmd)
-        return subprocess.run(args, capture_output=True).stdout
-		
-    def _post(self):
-        """
-        Initiate the job using a POST request
+        types = ['protein', 'ligands']
+        urls = [data[t] if type(data[t]) is list else [data[t]] for t in types]
+        paths = await asyncio.gather(*[self.client.download_all(u, os.path.join(out_dir, t))
+                                       for t, u in zip(types, urls)])
+        return Result(data=data, files=dict(zip(types, paths)))
 
-        :return:
+    def add_hydrogens(self, pdb_code):
         """
-        cmd = f"""curl -d '{str(json.dumps(self.data, ensure_ascii=True))}' -H "Accept: application/json" -H "Content-Type: application/json" -X POST {self.url}"""
-        response = ast.literal_eval(self._run(cmd).decode('utf-8'))
-        return response['location']
+        protonates a PDB entry, the output files are written to `Protoss.out_dir`
 
-    def _get(self, results_url):
+        :param str pdb_code: PDB code
+        :return: :class:`hotspots.protoss.Result`
         """
-        Collect the results using GET. May have to try multiple times.
+        return run_sync(self.add_hydrogens_async(pdb_code))
 
-        :return:
+    def add_hydrogens_all(self, pdb_codes):
         """
-        cmd = """curl {}""".format(results_url)
+        protonates PDB entries concurrently
 
-        response = ast.literal_eval(self._run(cmd).decode('utf-8'))
-        if response["status_code"] == 400:
-            print("status code: {}".format(response['status_code']))
-            raise RuntimeError()
-
-        status_code = int(response["status_code"])
-        while status_code > 200:
-            print("status code: {}".format(response['status_code']))
-            time.sleep(10)
-            response = ast.literal_eval(self._run(cmd).decode('utf-8'))
-            status_code = int(response["status_code"])
-
-        return response
+        :param list pdb_codes: PDB codes
+        :return: list of :class:`hotspots.protoss.Result`, in the order of `pdb_codes` (None where the job failed)
+        """
+        return gather([self.add_hydrogens_async(p, os.path.join(self.out_dir, p)) for p in pdb_codes],
+                      labels=["protoss {}".format(p) for p in pdb_codes])
 
 
 def main():
@@ -128,4 +97,4 @@ def main():
     print(result.protein)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
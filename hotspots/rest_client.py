@@ -0,0 +1,323 @@
+"""
+The :mod:`hotspots.rest_client` module holds the HTTP plumbing shared by the web service wrappers.
+
+The main classes of the :mod:`hotspots.rest_client` module are:
+
+- :class:`hotspots.rest_client.ConnectionPool`
+- :class:`hotspots.rest_client.JobClient`
+
+:class:`hotspots.rest_client.JobClient` runs jobs on the ProteinsPlus REST services (SIENA, Protoss) without
+blocking: jobs are submitted together and polled with back-off from an event loop, so the time spent waiting on the
+server overlaps, and the output files are streamed to disk in parallel.
+
+>>> from hotspots.protoss import Protoss
+
+>>> results = Protoss(out_dir="protonated").add_hydrogens_all(["1hcl", "1aq1", "2vta"])
+
+Setting the environment variable HOTSPOTS_PROTEINS_PLUS_URL to the base URL of a local stand-in server redirects all
+jobs, e.g. for tests.
+"""
+from __future__ import print_function, division
+
+import asyncio
+import http.client
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent import futures
+from os.path import join, exists, basename
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+proteins_plus_url = 'https://proteins.plus/api'
+
+
+def run_sync(coroutine):
+    """
+    runs a coroutine to completion from blocking code. Inside a running event loop (e.g. a notebook) the coroutine
+    is run in a new loop on a separate thread.
+
+    :param coroutine: coroutine
+    :return: the result of the coroutine
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def gather(coroutines, labels):
+    """
+    runs coroutines concurrently from blocking code. A failure is reported and does not stop the others.
+
+    :param list coroutines: coroutines
+    :param list labels: str, a label for each coroutine, used in the report of a failure
+    :return: list, results in the order of `coroutines` (None where the coroutine failed)
+    """
+    async def _all():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    out = []
+    for label, result in zip(labels, run_sync(_all())):
+        if isinstance(result, Exception):
+            print("WARNING: {} failed ({})".format(label, result))
+            out.append(None)
+        else:
+            out.append(result)
+    return out
+
+
+class ConnectionPool(object):
+    """
+    A pool of keep-alive HTTP connections, one per worker thread and host, with bounded concurrency and retries
+
+    :param int max_connections: maximum number of concurrent requests
+    :param int retries: number of retries of a failed request, with exponential back-off
+    :param float timeout: socket timeout in seconds
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_connections=8, retries=3, timeout=60):
+        self.max_connections = max_connections
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = 0.5
+
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_connections)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @classmethod
+    def shared(cls):
+        """
+        the client shared within the process, created with the default settings on first use
+
+        :return: an instance of the class
+        """
+        with cls._shared_lock:
+            if cls.__dict__.get("_shared") is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def close(self):
+        """
+        waits for running requests and closes the pooled connections
+        """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    def _connection(self, scheme, netloc):
+        """
+        the pooled connection of the calling thread to a host
+        """
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if (scheme, netloc) not in connections:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = cls(netloc, timeout=self.timeout)
+            connections[(scheme, netloc)] = conn
+            with self._lock:
+                self._connections.append(conn)
+        return connections[(scheme, netloc)]
+
+    def _drop(self, scheme, netloc):
+        """
+        closes a connection that failed, it is reopened on the next request
+        """
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+
+    def _request(self, method, url, fileobj, body=None, headers=None):
+        """
+        a request with the response body streamed to `fileobj`. Connection errors, 429 and 5xx responses are retried.
+
+        :param str method: HTTP method
+        :param str url: url
+        :param fileobj: binary file object, overwritten from its start
+        :param bytes body: request body
+        :param dict headers: request headers
+        :return: int, the response status
+        """
+        parts = urlsplit(url)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        headers = dict(headers or {}, **{"Accept-Encoding": "identity"})
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                if 200 <= response.status < 300:
+                    fileobj.seek(0)
+                    fileobj.truncate()
+                    shutil.copyfileobj(response, fileobj, 1 << 16)
+                    return response.status
+                response.read()
+            except (http.client.HTTPException, OSError) as e:
+                self._drop(parts.scheme, parts.netloc)
+                error = e
+                continue
+
+            error = HTTPError(url, response.status, response.reason, response.headers, None)
+            if response.status < 500 and response.status != 429:
+                raise error
+        raise error
+
+    def _get(self, url, fileobj):
+        """
+        a GET request, streamed to `fileobj`
+
+        :param str url: url
+        :param fileobj: binary file object, overwritten from its start
+        :return: int, the response status
+        """
+        return self._request("GET", url, fileobj)
+
+    async def _call(self, func, *args):
+        """
+        runs a blocking request on the pool from a coroutine
+        """
+        return await asyncio.wrap_future(self._executor.submit(func, *args))
+
+
+class JobClient(ConnectionPool):
+    """
+    A non-blocking client for the job based REST services of the ProteinsPlus server
+
+    A job is started with a POST request, which returns the location of the job. The location is polled until the
+    job has finished; the wait between polls starts at `poll_interval` and doubles up to `max_poll_interval`. The
+    finished job lists the URLs of its output files.
+
+    The coroutines are for use in an event loop, where the waits of many jobs overlap.
+
+    :param str base_url: base URL of the services, the "protoss" service is at <base_url>/protoss_rest
+                         (default: $HOTSPOTS_PROTEINS_PLUS_URL or https://proteins.plus/api)
+    :param int max_connections: maximum number of concurrent requests
+    :param int retries: number of retries of a failed request, with exponential back-off
+    :param float timeout: socket timeout in seconds
+    :param float poll_interval: first wait between polls in seconds
+    :param float max_poll_interval: longest wait between polls in seconds
+    :param float max_wait: seconds after which an unfinished job is abandoned
+    """
+    def __init__(self, base_url=None, max_connections=8, retries=3, timeout=60, poll_interval=1.,
+                 max_poll_interval=30., max_wait=3600.):
+        super(JobClient, self).__init__(max_connections=max_connections, retries=retries, timeout=timeout)
+        self.base_url = base_url or os.environ.get("HOTSPOTS_PROTEINS_PLUS_URL") or proteins_plus_url
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_wait = max_wait
+
+    def service_url(self, service):
+        """
+        :param str service: service name, e.g. "siena" or "protoss"
+        :return: str, URL of the service
+        """
+        return "{}/{}_rest".format(self.base_url.rstrip("/"), service)
+
+    def _json(self, method, url, data=None):
+        """
+        a request with an optional JSON body, returning the decoded JSON response
+        """
+        headers = {"Accept": "application/json"}
+        body = None
+        if data is not None:
+            body = json.dumps(data, ensure_ascii=True).encode("ascii")
+            headers["Content-Type"] = "application/json"
+        out = io.BytesIO()
+        self._request(method, url, out, body=body, headers=headers)
+        return json.loads(out.getvalue().decode("utf-8"))
+
+    def _download(self, url, out_dir):
+        url = re.sub('/esults/', '/results/', url)              # fix url
+        path = join(out_dir, basename(urlsplit(url).path))
+        with open(path, "wb") as f:
+            self._get(url, f)
+        return path
+
+    async def submit(self, url, data):
+        """
+        starts a job
+
+        :param str url: service URL, see :meth:`service_url`
+        :param dict data: job request
+        :return: str, location of the job
+        """
+        response = await self._call(self._json, "POST", url, data)
+        return response["location"]
+
+    async def wait(self, location):
+        """
+        polls a job until it has finished
+
+        :param str location: location of the job, as returned by :meth:`submit`
+        :return: dict, the finished job
+        """
+        interval = self.poll_interval
+        start = time.monotonic()
+        while True:
+            response = await self._call(self._json, "GET", location)
+            status_code = int(response.get("status_code", 200))
+            if status_code == 200:
+                return response
+            if status_code >= 400:
+                raise RuntimeError("job {} failed, status code: {}".format(location, status_code))
+            if time.monotonic() - start > self.max_wait:
+                raise RuntimeError("job {} did not finish within {} s".format(location, self.max_wait))
+            await asyncio.sleep(interval)
+            interval = min(2 * interval, self.max_poll_interval)
+
+    async def run(self, url, data):
+        """
+        starts a job and waits for it to finish
+
+        :param str url: service URL, see :meth:`service_url`
+        :param dict data: job request
+        :return: dict, the finished job
+        """
+        return await self.wait(await self.submit(url, data))
+
+    async def download(self, url, out_dir):
+        """
+        streams an output file to disk
+
+        :param str url: file URL
+        :param str out_dir: output directory
+        :return: str, path of the file
+        """
+        return await self._call(self._download, url, out_dir)
+
+    async def download_all(self, urls, out_dir):
+        """
+        streams output files to disk concurrently
+
+        :param list urls: file URLs
+        :param str out_dir: output directory, created if needed
+        :return: list of str, paths in the order of `urls`
+        """
+        if not exists(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+        return list(await asyncio.gather(*[self.download(url, out_dir) for url in urls]))
@@ -39,9 +39,11 @@ import numpy as np
 from ccdc.cavity import Cavity
 from ccdc.molecule import Molecule, Atom
 from ccdc.protein import Protein
+from scipy import ndimage
 from scipy.stats import percentileofscore
 
 from hotspots.grid_extension import Grid, _GridEnsemble
+from hotspots.hs_features import FeatureTable
 from hotspots.hs_pharmacophore import PharmacophoreModel
 from hotspots.hs_utilities import Helper
 
@@ -333,8 +335,13 @@ class Results(Helper):
         self.protein = protein
         self.buriedness = buriedness
         self.pharmacophore = None
-        self._features = self._get_features(interaction_dict=super_grids)
+        # island grids are only built when the features are first used
+        self._features = None
         self.identifier = None
+        # `hotspots.hs_metrics.RunMetrics`, set when the result comes from `hotspots.calculation.Runner`
+        self.metrics = None
+        # `hotspots.calculation.Runner.Settings`, set when the result comes from `hotspots.calculation.Runner`
+        self.settings = None
 
         if pharmacophore:
             self.pharmacophore = self.get_pharmacophore_model()
@@ -377,6 +384,8 @@ class Results(Helper):
         class to hold polar islands above threshold "_features"
         purpose: enables feature ranking
         """
+        __slots__ = ("_feature_type", "_grid", "_feature_coordinates", "_count", "_threshold", "_score_value",
+                     "_sphere", "_rank", "superstar_results")
 
         def __init__(self, feature_type, grid, threshold):
             """
@@ -445,6 +454,8 @@ class Results(Helper):
 
     @property
     def features(self):
+        if self._features is None:
+            self._features = self._get_features(interaction_dict=self.super_grids)
         return self._features
 
     @features.setter
@@ -520,6 +531,40 @@ class Results(Helper):
         """
         return _Scorer(self, obj, tolerance).scored_object
 
+    @staticmethod
+    def _neighbour_mean(arr, tol):
+        """
+        mean of the nonzero values within `tol` grid points (a (2 * tol + 1)**3 cube) of every point
+
+        :param `numpy.array` arr: grid values
+        :param int tol: how many grid points away to consider scores from
+        :return: `numpy.array`, zero where a point has no nonzero neighbours
+        """
+        size = 2 * tol + 1
+        positive = np.where(arr > 0, arr, 0.)
+        # uniform_filter returns the mean over the cube, scale back up to sum and count
+        total = ndimage.uniform_filter(positive, size=size, mode="constant", cval=0.) * size ** 3
+        count = np.rint(ndimage.uniform_filter((arr > 0).astype(float), size=size, mode="constant", cval=0.) * size ** 3)
+        return np.where(count > 0, total / np.maximum(count, 1), 0.)
+
+    @staticmethod
+    def _difference_array(arr1, arr2, mean1, mean2):
+        """
+        points that are zero in one array but sampled in the other are set to the mean of their nonzero neighbours,
+        then arr2 is subtracted from arr1 and negative values discarded
+
+        :param arr1: target values
+        :param arr2: off-target values
+        :param mean1: `Results._neighbour_mean` of arr1
+        :param mean2: `Results._neighbour_mean` of arr2
+        :return: `numpy.array`
+        """
+        f_arr1 = np.where((arr1 <= 0) & (arr2 > 0), mean1, arr1)
+        f_arr2 = np.where((arr2 <= 0) & (arr1 > 0), mean2, arr2)
+        sel_arr = f_arr1 - f_arr2
+        sel_arr[sel_arr < 0] = 0
+        return sel_arr
+
     def _filter_map(self, g1, g2, tol):
         """
         *Experimental feature*
@@ -534,55 +579,12 @@ class Results(Helper):
         :param g2: a :class: "ccdc.utilities.Grid" instance
         :return: a :class: "ccdc.utilities.Grid" instance
         """
-
-        def filter_point(x, y, z):
-            loc_arr = np.array(
-                [g[x + i][y + j][z + k] for i in range(-tol, tol + 1) for j in range(-tol, tol + 1) for k in
-                 range(-tol, tol + 1)])
-            if loc_arr[loc_arr > 0].size != 0:
-                # print(np.mean(loc_arr[loc_arr > 0]))
-                new_grid[x][y][z] = np.mean(loc_arr[loc_arr > 0])
-
-        vfilter_point = np.vectorize(filter_point)
-        com_bound_box = g1.bounding_box
-        com_spacing = g1.spacing
-
         arr1 = g1.get_array()
         arr2 = g2.get_array()
-
-        b_arr1 = np.copy(arr1)
-        b_arr2 = np.copy(arr2)
-
-        b_arr1[b_arr1 > 0] = 1.0
-        b_arr2[b_arr2 > 0] = -1.0
-
-        diff_arr = b_arr1 + b_arr2
-
-        unmatch1 = np.where(diff_arr == 1)
-        unmatch2 = np.where(diff_arr == -1)
-
-        g = arr1
-        new_grid = np.copy(arr1)
-        vfilter_point(unmatch2[0], unmatch2[1], unmatch2[2])
-        f_arr1 = np.copy(new_grid)
-
-        g = arr2
-        new_grid = np.copy(arr2)
-        vfilter_point(unmatch1[0], unmatch1[1], unmatch1[2])
-        f_arr2 = np.copy(new_grid)
-
-        sel_arr = f_arr1 - f_arr2
-        sel_arr[sel_arr < 0] = 0
-        sel_map = Grid(origin=com_bound_box[0], far_corner=com_bound_box[1], spacing=com_spacing, _grid=None)
-
-        idxs = sel_arr.nonzero()
-        vals = sel_arr[idxs]
-
-        as_triads = zip(*idxs)
-        for (i, j, k), v in zip(as_triads, vals):
-            sel_map._grid.set_value(int(i), int(j), int(k), v)
-
-        return sel_map
+        sel_arr = self._difference_array(arr1, arr2,
+                                         self._neighbour_mean(arr1, tol),
+                                         self._neighbour_mean(arr2, tol))
+        return Grid.array_to_grid(sel_arr, g1)
 
     def get_difference_map(self, other, tolerance):
         """
@@ -596,16 +598,30 @@ class Results(Helper):
         :param int tolerance: how many grid points away to apply filter to
         :return: a :class:`hotspots.result.Results` instance
         """
+        return self.get_difference_maps([other], tolerance)[0]
+
+    def get_difference_maps(self, others, tolerance):
+        """
+        *Experimental feature.*
+        Generates selectivity maps for a target against several off targets. All maps are placed on one common
+        frame, so the target grids are converted and filtered once and reused for every off target.
 
-        selectivity_grids = {}
+        :param others: list of :class:`hotspots.result.Results` instances
+        :param int tolerance: how many grid points away to apply filter to
+        :return: list of :class:`hotspots.result.Results` instances, in the order of `others`
+        """
+        selectivity_grids = [{} for _ in others]
         for probe in self.super_grids.keys():
-            g1 = self.super_grids[probe]
-            g2 = other.super_grids[probe]
-            og1, og2 = Grid.common_grid([g1, g2])
-            sele = self._filter_map(og1, og2, tolerance)
-            selectivity_grids[probe] = sele
-        hr = Results(selectivity_grids, self.protein, None, None)
-        return hr
+            grids = Grid.common_grid([self.super_grids[probe]] + [o.super_grids[probe] for o in others])
+            target = grids[0]
+            arr1 = target.get_array()
+            mean1 = self._neighbour_mean(arr1, tolerance)
+            for i, og in enumerate(grids[1:]):
+                arr2 = og.get_array()
+                sel_arr = self._difference_array(arr1, arr2, mean1, self._neighbour_mean(arr2, tolerance))
+                selectivity_grids[i][probe] = Grid.array_to_grid(sel_arr, target)
+
+        return [Results(grid_dic, self.protein, None, None) for grid_dic in selectivity_grids]
 
     @staticmethod
     def from_grid_ensembles(res_list, prot_name, charged=False, mode='max'):
@@ -769,13 +785,13 @@ class Results(Helper):
 
     def _docking_constraint_atoms(self, p=None, max_constraints=10, accessible_cutoff=0.001, max_distance=4, threshold=14, min_size = 15):
         """
-        creates a dictionary of constraints
+        creates a dictionary of constraints, see :func:`hotspots.hs_docking_prep.constraint_atoms`
 
         :param int max_constraints: max number of constraints
         :return dic: score by atom
         """
-
-        from scipy.spatial import distance
+        from hotspots.grid_io import GridData
+        from hotspots.hs_docking_prep import DockingPrep, atom_table, constraint_atoms
 
         def check_hydrogens(protein):
             """check hydrogens have neighbours"""
@@ -783,66 +799,14 @@ class Results(Helper):
                 print("WARNING HYDROGENS READDED THIS MAY CAUSE ISSUES")
                 protein.add_hydrogens()
 
-        print(len(self.protein.atoms))
-
         if p is None:
-            check_hydrogens(self.protein)
-            protein = self.protein.copy()
-        else:
-            check_hydrogens(p)
-            protein = p.copy()
-
-        point = self.super_grids['apolar'].centroid()
-        bs = protein.BindingSiteFromPoint(protein=protein, origin=point, distance=12.)
-
-        for a in protein.atoms:
-            a.label = str(a.index)
-
-        remove = set(protein.residues) - set(bs.residues)
-
-        for r in remove:
-            protein.remove_residue(r.identifier)
-
-        print(len(self.protein.atoms))
+            p = self.protein
+        check_hydrogens(p)
 
-        donors = {x.coordinates: x.label for x in [a for a in protein.atoms if a.atomic_number == 1]
-                  if x.neighbours[0].is_donor 
-                  # and x.solvent_accessible_surface() > accessible_cutoff
-                  }
-
-        acceptors = {a.coordinates: a.label for a in protein.atoms
-                     if a.is_acceptor
-                     # and a.solvent_accessible_surface() > accessible_cutoff
-                     }
-
-        pairs = {"acceptor": donors,
-                 "donor": acceptors}
-
-        constraint_dic = {}
-
-        for feature in self.features:
-            if (feature.grid > threshold).count_grid() > min_size:
-                centoid = [feature.grid.centroid()]
-                coords = list(pairs[feature.feature_type].keys())
-                all_distances = distance.cdist(coords, centoid, 'euclidean')
-                ind = int(np.argmin(all_distances))
-                min_coord = coords[ind]
-
-                atm_index = int(pairs[feature.feature_type][min_coord])
-
-                if all_distances[ind] < max_distance:
-                    constraint_dic.update({feature.score_value: atm_index})
-
-        if len(constraint_dic) > max_constraints:
-            scores = sorted([f[0] for f in constraint_dic.items()], reverse=True)[:max_constraints]
-        else:
-            scores = sorted([f[0] for f in constraint_dic.items()], reverse=True)
-
-        bin_keys = set(constraint_dic.keys()) - set(scores)
-        for b in bin_keys:
-            del constraint_dic[b]
-
-        constraint_dic = OrderedDict(reversed(list(constraint_dic.items())))
+        settings = DockingPrep.Settings(max_constraints=max_constraints, max_hbond_dist=max_distance,
+                                        core_threshold=threshold, min_core_size=min_size)
+        grids = {probe: GridData.from_grid(g) for probe, g in self.super_grids.items()}
+        constraint_dic = constraint_atoms(grids, atom_table(p), settings)
 
         return self._ConstraintData(constraint_dic, self.protein)
 
@@ -890,15 +854,51 @@ class Results(Helper):
                         f.append(Results._HotspotFeature(probe, island, threshold))
         return f
 
+    def feature_table(self, threshold=5, min_feature_gp=6, excluded=("apolar",)):
+        """
+        the polar islands of `features` as a :class:`hotspots.hs_features.FeatureTable`, computed on the grid arrays
+        without building an island grid per feature
+
+        :param float threshold: islands are made of points above this value
+        :param int min_feature_gp: islands must have more points than this
+        :param tup excluded: probes not turned into features
+        :return: :class:`hotspots.hs_features.FeatureTable`
+        """
+        tables = []
+        for probe, g in self.super_grids.items():
+            if probe in excluded:
+                continue
+            array = Grid.get_array(g)
+            # points are connected to all 26 neighbours, as in the islands of `ccdc.utilities.Grid`
+            labels, n = ndimage.label(array > threshold, structure=np.ones((3, 3, 3)))
+            if n == 0:
+                continue
+            index = np.arange(1, n + 1)
+            counts = np.bincount(labels.ravel(), minlength=n + 1)[1:]
+            keep = counts > min_feature_gp
+            if not keep.any():
+                continue
+
+            # the centre of each island's bounding box, as `Grid.centroid`
+            boxes = ndimage.find_objects(labels)
+            centres = np.array([[(sl.start + sl.stop - 1) / 2. for sl in box] for box in boxes])
+            origin = np.array(tuple(g.bounding_box[0]))
+            tables.append(FeatureTable([probe] * int(keep.sum()),
+                                       origin + centres[keep] * g.spacing,
+                                       np.asarray(ndimage.maximum(array, labels, index))[keep],
+                                       count=counts[keep],
+                                       sources=[self.identifier]))
+
+        return FeatureTable.concatenate(tables) if tables else FeatureTable([], [], [], sources=[self.identifier])
+
     def _rank_features(self):
         """
         rank _features based upon feature score (TO DO: modify score if required)
         :return:
         """
-        feature_by_score = {feat.score_value: feat for feat in self.features}
-        score = sorted([f[0] for f in feature_by_score.items()], reverse=True)
-        for i, key in enumerate(score):
-            feature_by_score[key]._rank = int(i + 1)
+        # sorted rather than keyed by score, so features with equal scores are all ranked
+        for i, feat in enumerate(sorted(self.features, key=lambda f: f.score_value, reverse=True)):
+            feat._rank = int(i + 1)
 
 
 class Extractor(object):
@@ -9,13 +9,19 @@ This script wraps around the Protein Plus web services
     - Bietz, S. Rarey, M.: ASCONA: Rapid Detection and Alignment of Protein Binding Site Conformations.
     Journal of Chemical Information and Modeling, 55(8):1747-1756.
 
+Jobs are run by :class:`hotspots.rest_client.JobClient`: several ensembles can be built concurrently and the output
+files are downloaded in parallel.
+
 """
-import shlex, subprocess, ast, time, json, os, csv, re, urllib2, urlparse, tempfile
-from collections import OrderedDict
-import numba
+import asyncio
+import copy
+import csv
+import os
+
+import numpy as np
+from hotspots.rest_client import JobClient, run_sync, gather
 
 
-@numba.njit()
 def tanimoto_dist(a, b):
     """
     calculate the tanimoto distance between two fingerprint arrays
@@ -45,53 +51,53 @@ class Ensemble(object):
         - parameters - the values of parameters used for this request
 
     """
-    def __init__(self, data):
+    def __init__(self, data, client=None):
         self.data = data
+        self.client = client or JobClient.shared()
         self.to_retrieve = ['result_table', 'pdb_files', 'ligands', 'alignment']
         self._ligands = None
 
+    @staticmethod
+    def _format_csv(path):
+        """
+        rewrites the semicolon separated result table as a comma separated file
 
-    def _write(self, url, out_dir):
+        :param str path: path to the downloaded table
         """
-        handles writing all the data
+        with open(path) as r:
+            lines = r.readlines()
+        with open(path, "w", newline='') as w:
+            csv_writer = csv.writer(w, delimiter=',')
+            for line in lines:
+                row = line.rstrip("\r\n").split(";")
+                if row[-1] == '':
+                    row.pop()
+                csv_writer.writerow(row)
+
+    async def save_async(self, out_dir):
+        """
+        :meth:`save`, awaitable
 
-        :param str url: url for aligned files
-        :param str out_dir: path of output directory
+        :param str out_dir: path to output directory
+        :return: list of str, paths of the downloaded files
         """
-        print(url)
-        url = re.sub('/esults/', '/results/', url)              # fix url
-        a = urlparse.urlparse(url)
-        fname = os.path.basename(a.path)
-        ext = fname.split(".")[1]
-        path = os.path.join(out_dir, fname)
-
-        with open(path, "wb") as w:
-            if ext == "csv":
-                # format csv
-                stri = [[a for a in line.split(";") if a != '\n'] for line in urllib2.urlopen(url).readlines()]
-                csv_writer = csv.writer(w, delimiter=',')
-                for s in stri:
-                    csv_writer.writerow(s)
-            else:
-                # otherwise no formatting requried
-                w.write(urllib2.urlopen(url).read())
+        urls = [self.data[t] if type(self.data[t]) is list else [self.data[t]] for t in self.to_retrieve]
+        paths = await asyncio.gather(*[self.client.download_all(u, os.path.join(out_dir, t))
+                                       for t, u in zip(self.to_retrieve, urls)])
+        paths = [p for ps in paths for p in ps]
+        for path in paths:
+            if path.endswith(".csv"):
+                self._format_csv(path)
+        return paths
 
     def save(self, out_dir):
         """
-        save the ensemble data to output directory
+        save the ensemble data to output directory, the files are downloaded concurrently
 
         :param str out_dir: path to output directory
+        :return: list of str, paths of the downloaded files
         """
-        for t in self.to_retrieve:
-            new_out_dir = os.path.join(out_dir, t)
-            if not os.path.exists(new_out_dir):
-                os.mkdir(new_out_dir)
-            urls = self.data[t]
-            if type(urls) is list:
-                for url in urls:
-                    self._write(url, new_out_dir)
-            else:
-                self._write(urls, new_out_dir)
+        return run_sync(self.save_async(out_dir))
 
     # @staticmethod
     # def _cluster_ligands(ligands, t):
@@ -184,8 +190,7 @@ class Search(object):
     >>> searcher = Search()
     >>> ensemble = searcher.create_ensemble(pdb_code="1aq1",
                                         ligand="STU_A_299",
-                                        reduction_procedure="",
-                                        num_members="")
+                                        mode="ligand_pose_comparison")
 
     >>> ensemble.save(out_dir = "/home/pcurran/patel/CDK2/1aq1_ensemble")
 
@@ -196,7 +201,8 @@ class Search(object):
 
         """
         def __init__(self):
-            self.url = 'https://proteins.plus/api/siena_rest'
+            # None: the "siena" service of the job client
+            self.url = None
             self.data = {"siena": {
                             "pdbCode":"",
                             "pocket":"",
@@ -231,85 +237,68 @@ class Search(object):
             #                        }
             #              }
 
-    def __init__(self, settings=None):
+    def __init__(self, settings=None, client=None):
         """
         Search initialisation
 
         :param `Search.Settings` settings: a settings object, modify to change advance settings
+        :param `hotspots.rest_client.JobClient` client: job client (default: the shared client)
         """
         if settings is None:
             self.settings = self.Settings()
         else:
             self.settings = settings
+        self.client = client or JobClient.shared()
 
-    def create_ensemble(self, pdb_code, ligand, mode, pocket=None):
-        """
+    @property
+    def url(self):
+        return self.settings.url or self.client.service_url("siena")
 
-
-        :param str pdb_code: PDB code to base the ensemble on
-        :param str ligand: ligand identifier (example format: STU_A_299)
-        :param str reduction_procedure: either bb_clustering, all_atom_clustering, ligand_driven_selection
-        :param str num_members: number of members in the ensemble
-        :return:
+    def _request(self, pdb_code, ligand, mode, pocket=None):
+        """
+        the job request, built on a copy of the settings so that concurrent searches do not share it
         """
-        self.settings.data['siena']["pdbCode"] = pdb_code
+        data = copy.deepcopy(self.settings.data)
+        data['siena']["pdbCode"] = pdb_code
         if pocket is not None:
-            self.settings.data['siena']['pocket'] = pocket
-        self.settings.data['siena']["ligand"] = ligand
-        self.settings.data['siena']['mode'] = mode
-
-        results_url = self._post()
-        return Ensemble(self._get(results_url))
+            data['siena']['pocket'] = pocket
+        data['siena']["ligand"] = ligand
+        data['siena']['mode'] = mode
+        return data
 
-    def _run(self, cmd):
+    async def create_ensemble_async(self, pdb_code, ligand, mode, pocket=None):
         """
-        runs commandline procedure (urllib doesn't work for some reason)
+        :meth:`create_ensemble`, awaitable
 
-        :param str cmd: command line str using curl
-        :return:
+        :return: :class:`hotspots.siena.Ensemble`
         """
-        args = shlex.split(cmd)
-        return subprocess.check_output(args)
+        response = await self.client.run(self.url, self._request(pdb_code, ligand, mode, pocket))
+        return Ensemble(response, client=self.client)
 
-    def _post(self):
+    def create_ensemble(self, pdb_code, ligand, mode, pocket=None):
         """
-        Initiate the job using a POST request
 
-        :return:
-        """
-        cmd = """curl -d '{}' -H "Accept: application/json" -H "Content-Type: application/json" -X POST {}"""\
-            .format(json.dumps(self.settings.data, ensure_ascii=True, indent=2, default=True),self.settings.url)
 
-        response = ast.literal_eval(self._run(cmd))
-        print(response)
-        return response['location']
+        :param str pdb_code: PDB code to base the ensemble on
+        :param str ligand: ligand identifier (example format: STU_A_299)
+        :param str mode: search mode, e.g. "ligand_pose_comparison"
+        :param str pocket: binding site description, if no ligand is given
+        :return: :class:`hotspots.siena.Ensemble`
+        """
+        return run_sync(self.create_ensemble_async(pdb_code, ligand, mode, pocket))
 
-    def _get(self, results_url):
+    def create_ensembles(self, queries):
         """
-        Collect the results using GET. May have to try multiple times.
+        runs several searches concurrently
+
+        >>> ensembles = Search().create_ensembles([dict(pdb_code="1aq1", ligand="STU_A_299", mode="ligand_pose_comparison"),
+                                                   dict(pdb_code="1drf", ligand="FOL_A_187", mode="ligand_pose_comparison")])
 
-        :return:
+        :param list queries: dict, keyword arguments of :meth:`create_ensemble`
+        :return: list of :class:`hotspots.siena.Ensemble`, in the order of `queries` (None where the search failed)
         """
-        cmd = """curl {}""".format(results_url)
-
-        response = ast.literal_eval(self._run(cmd))
-        if response["status_code"] == 400:
-            print("status code: {}".format(response['status_code']))
-            raise RuntimeError()
-
-        status_code = int(response["status_code"])
-        while status_code > 200:
-            print("status code: {}".format(response['status_code']))
-            time.sleep(10)
-            response = ast.literal_eval(self._run(cmd))
-            status_code = int(response["status_code"])
-            if status_code == 400:
-                raise RuntimeError("help")
-
-        # create Ensemble
-
-        print(type(response["status_code"]))
-        return response
+        return gather([self.create_ensemble_async(**q) for q in queries],
+                      labels=["siena {}".format(q.get("pdb_code")) for q in queries])
 
 
 def main():
@@ -0,0 +1,117 @@
+from __future__ import print_function, division
+
+import unittest
+from os.path import join, dirname, abspath
+
+import numpy as np
+from ccdc.protein import Protein
+from scipy.spatial import cKDTree
+
+from hotspots.atomic_hotspot_calculation import _AtomicHotspot, _SuperStarCache, _SUPERSTAR_CUTOFF
+from hotspots.grid_extension import Grid
+
+BENCHMARK = join(dirname(dirname(abspath(__file__))), "benchmark_set")
+
+
+class _Settings(object):
+    def __init__(self, cavity_radius=10, cavity_shell=None):
+        self.cavity_radius = cavity_radius
+        self.cavity_shell = cavity_shell
+
+
+class TestCavityJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.protein = Protein.from_file(join(BENCHMARK, "8", "apo.pdb"))
+        self.atomic = _AtomicHotspot.__new__(_AtomicHotspot)
+
+    def test_cavity_shell(self):
+        origin = tuple(np.mean([tuple(a.coordinates) for a in self.protein.atoms], axis=0))
+        self.atomic.settings = _Settings(cavity_shell=None)
+        self.assertIs(self.atomic._cavity_shell(self.protein, origin), self.protein)
+
+        self.atomic.settings = _Settings(cavity_radius=6, cavity_shell=2.)
+        shell = self.atomic._cavity_shell(self.protein, origin)
+        self.assertLess(len(shell.residues), len(self.protein.residues))
+        self.assertEqual(len(self.protein.atoms), len(Protein.from_file(join(BENCHMARK, "8", "apo.pdb")).atoms))
+        # every kept residue has an atom within the cropping distance of the origin
+        for r in shell.residues:
+            distances = np.linalg.norm(np.array([tuple(a.coordinates) for a in r.atoms]) - origin, axis=1)
+            self.assertLessEqual(distances.min(), 8. + 1e-6)
+
+    def test_cavity_volume(self):
+        tree = cKDTree(np.array([[0., 0., 0.]]))
+        # lattice points within 3 A of the origin, less those within 1.5 A of the single atom
+        offsets = np.mgrid[-3:4, -3:4, -3:4].reshape(3, -1).T
+        d = np.linalg.norm(offsets, axis=1)
+        self.assertEqual(_AtomicHotspot._cavity_volume(tree, (0, 0, 0), 3, clearance=1.5),
+                         np.count_nonzero((d <= 3) & (d >= 1.5)))
+        self.assertEqual(_AtomicHotspot._cavity_volume(tree, (50, 0, 0), 3),
+                         np.count_nonzero(d <= 3))
+
+
+class _Instruction(object):
+    def __init__(self, ins_str):
+        self.ins_str = ins_str
+
+
+class TestSuperStarCache(unittest.TestCase):
+
+    def setUp(self):
+        self.protein = Protein.from_file(join(BENCHMARK, "8", "apo.pdb"))
+        self.origin = tuple(np.mean([tuple(a.coordinates) for a in self.protein.atoms], axis=0))
+        self.radius = 10 + _SUPERSTAR_CUTOFF
+        self.instruction = _Instruction("CAVITY_ORIGIN {} {} {}".format(*[round(c, 1) for c in self.origin]))
+
+        def distance(residue):
+            return np.linalg.norm(np.array([tuple(a.coordinates) for a in residue.atoms]) - self.origin,
+                                  axis=1).min()
+
+        residues = sorted(self.protein.residues, key=distance)
+        self.near, self.far = residues[0].identifier, residues[-1].identifier
+        self.assertGreater(distance(residues[-1]), self.radius)
+
+    def _mutant(self, residue):
+        mutant = self.protein.copy()
+        mutant.remove_residue(residue)
+        return mutant
+
+    def test_key(self):
+        key = _SuperStarCache.key(self.protein, self.instruction, cavity_origin=self.origin, radius=self.radius)
+        # a change far from the pocket shares the key
+        far = self._mutant(self.far)
+        self.assertEqual(_SuperStarCache.key(far, self.instruction, cavity_origin=self.origin, radius=self.radius),
+                         key)
+        # a change in the pocket, or different instructions, does not
+        near = self._mutant(self.near)
+        self.assertNotEqual(_SuperStarCache.key(near, self.instruction, cavity_origin=self.origin, radius=self.radius),
+                            key)
+        self.assertNotEqual(_SuperStarCache.key(self.protein, _Instruction("SUBSTRUCTURE ALL"),
+                                                cavity_origin=self.origin, radius=self.radius), key)
+        # without a cavity every atom is hashed
+        self.assertNotEqual(_SuperStarCache.key(far, self.instruction), _SuperStarCache.key(self.protein,
+                                                                                             self.instruction))
+
+
+class TestMaxMerge(unittest.TestCase):
+
+    def test_max_merge(self):
+        a = Grid(origin=(0, 0, 0), far_corner=(2, 2, 2), spacing=0.5, default=0, _grid=None)
+        b = Grid(origin=(1, 1, 1), far_corner=(4, 4, 4), spacing=0.5, default=0, _grid=None)
+        a.set_value(2, 2, 2, 5.)    # (1, 1, 1), overlapped by b
+        a.set_value(0, 0, 0, 3.)
+        b.set_value(0, 0, 0, 7.)    # (1, 1, 1)
+        b.set_value(6, 6, 6, 2.)    # (4, 4, 4)
+
+        merged = _AtomicHotspot._max_merge([a, b])
+        self.assertEqual(tuple(merged.bounding_box[0]), (0, 0, 0))
+        self.assertEqual(tuple(merged.bounding_box[1]), (4, 4, 4))
+        array = Grid.get_array(merged)
+        self.assertEqual(array[2, 2, 2], 7.)
+        self.assertEqual(array[0, 0, 0], 3.)
+        self.assertEqual(array[8, 8, 8], 2.)
+        self.assertEqual(np.count_nonzero(array), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+from __future__ import print_function, division
+
+import collections
+import threading
+import time
+import unittest
+from os.path import join, dirname
+
+import numpy as np
+from ccdc.io import MoleculeReader
+
+import hotspots
+from hotspots.calculation import Runner, _StageGraph
+
+
+class TestStageGraph(unittest.TestCase):
+
+    def test_dependency_order(self):
+        order = []
+        graph = _StageGraph(max_workers=4)
+        graph.add("c", lambda a, b: order.append("c") or a + b, deps=("a", "b"))
+        graph.add("a", lambda: order.append("a") or 1)
+        graph.add("b", lambda a: order.append("b") or a * 10, deps=("a",))
+        graph.expect("streamed")
+        graph.add("d", lambda c, s: c + s, deps=("c", "streamed"))
+        threading.Timer(0.05, graph.complete, args=("streamed", 100)).start()
+
+        results = graph.run()
+        self.assertEqual(order, ["a", "b", "c"])
+        self.assertEqual(results, {"a": 1, "b": 10, "c": 11, "streamed": 100, "d": 111})
+
+    def test_shared_lock(self):
+        active = []
+        overlaps = []
+
+        def stage():
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.02)
+            active.pop()
+
+        graph = _StageGraph(max_workers=4)
+        for i in range(4):
+            graph.add("sampling:{}".format(i), stage, lock="sampling")
+        graph.run()
+        self.assertEqual(overlaps, [1, 1, 1, 1])
+
+    def test_unknown_dependency(self):
+        graph = _StageGraph()
+        graph.add("weighting", lambda s: s, deps=("superstar",))
+        self.assertRaises(ValueError, graph.run)
+
+    def test_error_propagation(self):
+        finished = []
+
+        def slow():
+            time.sleep(0.1)
+            finished.append("slow")
+
+        def fail():
+            raise RuntimeError("ghecom failed")
+
+        graph = _StageGraph(max_workers=2)
+        graph.add("slow", slow)
+        graph.add("fail", fail)
+        graph.add("after", lambda: finished.append("after"), deps=("fail",))
+        with self.assertRaises(RuntimeError):
+            graph.run()
+        # the running stage finished before run() returned, the dependent stage never started
+        self.assertEqual(finished, ["slow"])
+
+
+class TestAdaptiveSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.molecule = MoleculeReader(join(dirname(hotspots.__file__), "probes", "rotate-apolar_3_flat.mol2"))[0]
+        self.points = [(0., 0., 0.), (5., 0., 0.), (10., 0., 0.)]
+        calls = collections.defaultdict(int)
+
+        def score_poses(poses, point, probe):
+            # one scoring round at a point: the first pose scores, the best improves by a fixed schedule
+            k = calls[point]
+            calls[point] += 1
+            if point[0] == 0:
+                value = 5.
+            elif point[0] == 5:
+                value = (12., 13., 13.1)[min(k, 2)]
+            else:
+                value = 12. + k
+            scores = np.zeros(len(poses))
+            scores[0] = value
+            return scores
+
+        settings = Runner.Settings(adaptive_rotations=True, initial_rotations=20, refine_rotations=10,
+                                   nrotations=100, refine_thresholds=(14, 17), adaptive_margin=0.75,
+                                   convergence_tolerance=0.25, return_probes=True)
+        self.sampler = Runner._Sampler(settings=settings)
+        self.sampler.get_translation_points = lambda priority_atom_type: list(self.points)
+        self.sampler._score_poses = score_poses
+
+    def test_point_statistics(self):
+        self.sampler.sample_adaptive(self.molecule, probe="apolar")
+        stats = self.sampler.point_statistics
+        # below the refine cutoff: global rotations only
+        self.assertEqual(stats[0].tolist(), [20, 5., 1])
+        # converges once a round improves the best score by less than the tolerance
+        self.assertEqual(stats[1, 0], 40)
+        self.assertAlmostEqual(stats[1, 1], 13.1)
+        self.assertEqual(stats[1, 2], 1)
+        # still improving when the rotation budget runs out
+        self.assertEqual(stats[2].tolist(), [100, 20., 0])
+        self.assertEqual(self.sampler.translation_scores.tolist(), stats[:, 1].tolist())
+
+    def test_return_probes(self):
+        priority_atom, _ = self.sampler.get_priority_atom(self.molecule)
+        label = priority_atom.label
+        probes = self.sampler.sample_adaptive(self.molecule, probe="apolar")
+        # only the point scoring above 14 returns its best pose, with the priority atom on the point
+        self.assertEqual(len(probes), 1)
+        self.assertEqual(probes[0].identifier, "20.0")
+        atom = [a for a in probes[0].atoms if a.label == label][0]
+        self.assertTrue(np.allclose(tuple(atom.coordinates), self.points[2], atol=1e-3))
+        self.assertEqual(len(probes[0].atoms), len(self.molecule.heavy_atoms))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 from __future__ import print_function, division
 
 import unittest
-from hotspots.grid_extension import Grid, _GridEnsemble
+from hotspots.grid_extension import Grid, _GridEnsemble, _GridEnsembleAccumulator
 import numpy as np
 from glob import glob
 import os
@@ -146,12 +146,47 @@ class TestEnsembleSyntheticData(unittest.TestCase):
         other_g = self.grid_ensemble.output_grid(mode="bla", save=False)
         self.assertIsNone(other_g)
 
+    def test_from_grid_stream(self):
+        grid_ensemble = _GridEnsemble()
+        max_grid = grid_ensemble.from_grid_stream(iter(self.grid_list), os.getcwd(), "test", "apolar")
+        self.assertIsNone(grid_ensemble.results_array)
+        self.assertEqual(grid_ensemble.tup_max_length, len(self.grid_list))
+        self.assertEqual(len(grid_ensemble.get_gridpoint_max()), self.values.shape[0])
+
+        max_g, ref_g = Grid.common_grid([max_grid, self.max_grid])
+        self.assertEqual((max_g - ref_g).count_grid(), 0, msg="Streamed max grid differs from stacked max grid")
+
+        self.assertTrue(np.allclose(sorted(grid_ensemble.get_gridpoint_means()),
+                                    sorted(self.grid_ensemble.get_gridpoint_means())))
+        self.assertEqual(set(grid_ensemble.get_gridpoint_frequency()), {len(self.grid_list)})
+
     def tearDown(self):
         if exists(self.tmp_dir):
             shutil.rmtree(self.tmp_dir)
         #os.remove("test_max_apolar.ccp4")
 
 
+class TestGridEnsembleAccumulator(unittest.TestCase):
+
+    def test_add_array(self):
+        acc = _GridEnsembleAccumulator(spacing=0.5)
+        acc.add_array(np.full((2, 2, 2), 4.), (1., 1., 1.))
+        # float noise in the origin is tolerated, the frame grows to fit
+        acc.add_array(np.full((2, 2, 2), 2.), (0.5 + 1e-6, 1., 1.))
+        self.assertEqual(acc.origin, (0.5, 1., 1.))
+        self.assertEqual(acc.max.shape, (3, 2, 2))
+        self.assertEqual(acc.max[0, 0, 0], 2.)
+        self.assertEqual(acc.max[2, 0, 0], 4.)
+        self.assertEqual(acc.mean[1, 0, 0], 3.)
+        self.assertEqual(acc.count[1, 0, 0], 2)
+
+    def test_off_lattice(self):
+        acc = _GridEnsembleAccumulator(spacing=0.5)
+        acc.add_array(np.full((2, 2, 2), 4.), (1., 1., 1.))
+        # a quarter spacing off the lattice would be snapped onto it
+        self.assertRaises(ValueError, acc.add_array, np.full((2, 2, 2), 4.), (1.25, 1., 1.))
+        self.assertEqual(acc.n, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,54 @@
+from __future__ import print_function, division
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from hotspots import grid_io
+
+
+class TestGridIO(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        array = np.zeros((6, 7, 8))
+        array[1, 2, 3] = 14.5
+        array[5, 6, 7] = 2.
+        self.grid = grid_io.GridData(array, (-3., 1.5, 10.), 0.5)
+
+    def test_ccp4_round_trip(self):
+        fname = os.path.join(self.tmp, "apolar.ccp4")
+        grid_io.write(fname, self.grid)
+        for mmap in (True, False):
+            g = grid_io.read_ccp4(fname, mmap=mmap)
+            self.assertEqual(g.nsteps, (6, 7, 8))
+            self.assertEqual(g.origin, self.grid.origin)
+            self.assertEqual(g.spacing, 0.5)
+            self.assertTrue(np.array_equal(g.array, self.grid.array))
+
+    def test_off_lattice_origin(self):
+        fname = os.path.join(self.tmp, "apolar.ccp4")
+        grid_io.write_ccp4(fname, self.grid.array, (0.3, 0., 0.), 0.5)
+        self.assertAlmostEqual(grid_io.read(fname).origin[0], 0.3, places=5)
+
+    def test_insight_round_trip(self):
+        for ext in (".grd", ".acnt"):
+            fname = os.path.join(self.tmp, "donor" + ext)
+            grid_io.write(fname, self.grid)
+            g = grid_io.read(fname)
+            self.assertEqual(g.origin, self.grid.origin)
+            self.assertEqual(g.far_corner, (-0.5, 4.5, 13.5))
+            self.assertTrue(np.array_equal(g.array, self.grid.array))
+
+    def test_unsupported(self):
+        fname = os.path.join(self.tmp, "donor.acnt")
+        with open(fname, "w") as f:
+            f.write("not a grid\n")
+        self.assertRaises(ValueError, grid_io.read, fname)
+        self.assertRaises(ValueError, grid_io.read, "donor.txt")
+
+
+if __name__ == "__main__":
+    unittest.main()
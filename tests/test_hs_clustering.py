@@ -0,0 +1,43 @@
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from hotspots import hs_clustering
+
+
+class TestClustering(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # three families of 2048 bit fingerprints, each member a few bits away from its family
+        centres = rng.rand(3, 2048) < 0.1
+        self.bits = np.array([c ^ (rng.rand(2048) < 0.01) for c in centres for _ in range(10)])
+        self.packed = hs_clustering.pack_fingerprints(self.bits)
+
+    def test_tanimoto_matches_dense(self):
+        a = self.bits.astype(float)
+        inter = a.dot(a.T)
+        expected = inter / (a.sum(1)[:, None] + a.sum(1)[None, :] - inter)
+        self.assertEqual(self.packed.shape, (30, 32))
+        self.assertTrue(np.allclose(hs_clustering.tanimoto_matrix(self.packed), expected, atol=1e-6))
+        self.assertTrue(np.array_equal(hs_clustering.popcount(self.packed), self.bits.sum(1)))
+
+    def test_odd_length_and_empty(self):
+        packed = hs_clustering.pack_fingerprints([[1, 0, 1], [0, 0, 0], [1, 0, 0]])
+        sim = hs_clustering.tanimoto_matrix(packed)
+        self.assertAlmostEqual(sim[0, 2], 0.5)
+        self.assertEqual(sim[1, 1], 0.)
+
+    def test_butina(self):
+        clusters = hs_clustering.cluster_fingerprints(self.packed, method="butina", threshold=0.35)
+        self.assertEqual(sorted(sorted(c) for c in clusters), [list(range(i, i + 10)) for i in (0, 10, 20)])
+        distances = 1. - hs_clustering.tanimoto_matrix(self.packed)
+        labels, centroids = hs_clustering.butina(distances, threshold=0.35)
+        self.assertEqual([c[0] for c in clusters], list(centroids))
+        self.assertEqual(len(set(labels)), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
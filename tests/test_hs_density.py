@@ -0,0 +1,44 @@
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from hotspots import hs_density
+
+
+class TestDensity(unittest.TestCase):
+
+    def test_frame(self):
+        origin, far_corner, shape = hs_density.frame([(0.2, 1.6, -3.), (4.1, 2., -1.2)], padding=1, spacing=0.5)
+        self.assertEqual(origin.tolist(), [-1., 1., -4.])
+        self.assertEqual(far_corner.tolist(), [5., 3., 0.])
+        self.assertEqual(shape, (13, 5, 9))
+
+    def test_matches_brute_force(self):
+        rng = np.random.RandomState(1)
+        origin, shape, spacing = np.array([-1., 0., 2.]), (20, 22, 24), 0.5
+        centres = origin + rng.rand(200, 3) * (np.array(shape) - 1) * spacing
+        radii = rng.choice([1., 1.5], size=200)
+
+        grid = np.stack(np.meshgrid(*[np.arange(n) for n in shape], indexing="ij"), axis=-1) * spacing + origin
+        for kernel in hs_density.KERNELS:
+            expected = np.zeros(shape)
+            for c, r in zip(centres, radii):
+                d = np.sqrt(((grid - c) ** 2).sum(axis=-1))
+                reach = r if kernel == "sphere" else 1.5 * r
+                values = np.clip(1 - d / r, 0, None) if kernel == "sphere" else np.exp(-d ** 2 / (2 * (r / 2) ** 2))
+                expected += np.where(d <= reach, values, 0)
+            density = hs_density.rasterise(centres, radii, origin, shape, spacing, kernel=kernel)
+            self.assertTrue(np.allclose(density, expected))
+
+    def test_sphere_on_grid_point(self):
+        density = hs_density.rasterise([(1., 1., 1.)], 1., (0, 0, 0), (5, 5, 5), 0.5, weights=2.)
+        self.assertAlmostEqual(density[2, 2, 2], 2.)
+        self.assertAlmostEqual(density[3, 2, 2], 1.)
+        self.assertEqual(density[4, 2, 2], 0.)
+        self.assertRaises(ValueError, hs_density.rasterise, [(1., 1., 1.)], 1., (0, 0, 0), (5, 5, 5), 0.5, "cube")
+
+
+if __name__ == "__main__":
+    unittest.main()
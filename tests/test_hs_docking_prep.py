@@ -0,0 +1,86 @@
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from hotspots import hs_docking_prep
+from hotspots.grid_io import GridData
+
+
+class TestDockingPrep(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        self.settings = hs_docking_prep.DockingPrep.Settings()
+        origin = (-5., -5., -5.)
+        apolar = np.zeros((21, 21, 21))
+        apolar[8:13, 8:13, 8:13] = 18.
+        apolar[10, 10, 10] = 25.
+        donor = np.zeros((21, 21, 21))
+        donor[2:6, 2:6, 2:6] = 20.          # 64 points, centre (-3.25, -3.25, -3.25)
+        donor[15:17, 15:17, 15:17] = 20.    # too small to be a feature
+        acceptor = np.zeros((21, 21, 21))
+        acceptor[14:18, 2:6, 2:6] = 16.     # centre (2.75, -3.25, -3.25)
+        self.grids = {p: GridData(a, origin, 0.5) for p, a in
+                      (("apolar", apolar), ("donor", donor), ("acceptor", acceptor))}
+
+        # an acceptor near the donor island, a donor N-H near the acceptor island and a carbon in the middle
+        self.atoms = hs_docking_prep.AtomTable(
+            coordinates=np.array([[-3.5, -3., -3.], [2., -3.5, -3.], [2.5, -3.25, -3.], [0., 0., 0.], [30., 0., 0.]]),
+            residue=np.array([0, 1, 1, 2, 3]),
+            parent=np.array([-1, -1, 1, -1, -1]),
+            atom_type=np.array(["acceptor", "donor", "", "apolar", "acceptor"], dtype=object),
+            donor_hydrogen=np.array([False, False, True, False, False]),
+            acceptor=np.array([True, False, False, False, True]))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+
+    def test_fitting_points(self):
+        coordinates, scores = hs_docking_prep.fitting_points(self.grids["apolar"], threshold=17)
+        self.assertEqual(len(scores), 125)
+        self.assertEqual(scores.max(), 25.)
+        self.assertEqual(coordinates[np.argmax(scores)].tolist(), [0., 0., 0.])
+
+        fname = os.path.join(self.temp, "fit_pts.mol2")
+        hs_docking_prep.write_fitting_points(fname, coordinates, scores)
+        with open(fname) as f:
+            lines = f.read().splitlines()
+        atoms = lines[lines.index("@<TRIPOS>ATOM") + 1:]
+        self.assertEqual(lines[2].split()[0], "125")
+        self.assertEqual(len(atoms), 125)
+        self.assertEqual([float(v) for v in atoms[0].split()[2:5]], coordinates[0].tolist())
+
+    def test_constraint_atoms(self):
+        centres, scores = hs_docking_prep._islands(self.grids["donor"], self.settings)
+        self.assertEqual(centres.tolist(), [[-3.25, -3.25, -3.25]])
+        self.assertEqual(scores.tolist(), [20.])
+
+        constraints = hs_docking_prep.constraint_atoms(self.grids, self.atoms, self.settings)
+        self.assertEqual(list(constraints.items()), [(20., 0), (16., 2)])
+        self.settings.max_constraints = 1
+        self.assertEqual(list(hs_docking_prep.constraint_atoms(self.grids, self.atoms, self.settings).values()), [0])
+
+    def test_atom_scores(self):
+        scores = hs_docking_prep.atom_scores(self.grids, self.atoms)
+        # brute force: largest value within the tolerance cube around each (heavy) atom
+        expected = []
+        for i, (probe, tolerance) in enumerate([("donor", 5), (None, 0), ("acceptor", 5), ("apolar", 4),
+                                                ("donor", 5)]):
+            if probe is None:
+                expected.append(0.)
+                continue
+            position = self.atoms.coordinates[1 if i == 2 else i]
+            index = np.round((position - (-5.)) / 0.5).astype(int)
+            lo, hi = np.maximum(index - tolerance, 0), index + tolerance + 1
+            window = self.grids[probe].array[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+            expected.append(window.max() if window.size else 0.)
+        self.assertEqual(scores.tolist(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
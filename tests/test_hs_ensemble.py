@@ -0,0 +1,102 @@
+from __future__ import print_function, division
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from hotspots.hs_ensemble import EnsembleRunner, _MemmapAccumulator
+
+
+class TestMemmapAccumulator(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        self.settings = EnsembleRunner.Settings(frequency_threshold=14, max_score=50., nbins=50)
+        rng = np.random.RandomState(0)
+        # ten frames on the full (6, 7, 8) frame, a third of the points zero
+        self.frames = np.where(rng.rand(10, 6, 7, 8) > 0.3, rng.rand(10, 6, 7, 8) * 40, 0.).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+
+    def _accumulator(self):
+        acc = _MemmapAccumulator(self.temp, "apolar", (10, 20, 30), (6, 7, 8), self.settings)
+        for frame in self.frames:
+            acc.add_array(frame, (10, 20, 30))
+        return acc
+
+    def test_statistics(self):
+        acc = self._accumulator()
+        self.assertEqual(acc.n, 10)
+        self.assertTrue(np.allclose(acc.statistic("max"), self.frames.max(axis=0)))
+        self.assertTrue(np.allclose(acc.statistic("mean"), self.frames.mean(axis=0), atol=1e-5))
+        self.assertTrue(np.allclose(acc.statistic("std"), self.frames.std(axis=0), atol=1e-4))
+        self.assertTrue(np.allclose(acc.statistic("frequency"), (self.frames >= 14).mean(axis=0)))
+        self.assertRaises(ValueError, acc.statistic, "median")
+
+    def test_percentile(self):
+        acc = self._accumulator()
+        width = acc.bin_width
+        ordered = np.sort(self.frames, axis=0)
+        for q in (50, 90, 100):
+            # the percentile falls in the histogram bin of the k-th smallest value, zero if that value is zero
+            k = int(np.ceil(q / 100. * 10))
+            kth = ordered[k - 1]
+            lower = np.floor(kth / width) * width
+            value = acc.statistic("p{}".format(q))
+            self.assertTrue(np.all(np.where(kth > 0, (value >= lower - 1e-4) & (value <= lower + width + 1e-4),
+                                            value == 0)))
+
+    def test_offset_frames(self):
+        acc = _MemmapAccumulator(self.temp, "donor", (0, 0, 0), (4, 4, 4), self.settings)
+        a = np.full((2, 2, 2), 20., dtype=np.float32)
+        acc.add_array(a, (1, 1, 1))
+        # partly outside the frame: the 4 points with x index 4 are dropped
+        acc.add_array(np.full((2, 2, 2), 10., dtype=np.float32), (3, 0, 0))
+        acc.add_array(np.zeros((0, 0, 0), dtype=np.float32), (0, 0, 0))
+
+        self.assertEqual(acc.n, 3)
+        self.assertEqual(acc.clipped, 4)
+        expected_max = np.zeros((4, 4, 4))
+        expected_max[1:3, 1:3, 1:3] = 20.
+        expected_max[3, 0:2, 0:2] = 10.
+        self.assertTrue(np.array_equal(acc.statistic("max"), expected_max))
+        self.assertTrue(np.allclose(acc.statistic("mean"), expected_max / 3.))
+        self.assertTrue(np.array_equal(acc.statistic("frequency"), (expected_max >= 14) / 3.))
+        self.assertTrue(np.array_equal(np.asarray(acc.histogram).sum(axis=-1), (expected_max > 0).astype(int)))
+
+
+class TestEnsembleFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        self.ensemble = EnsembleRunner(EnsembleRunner.Settings(padding=1., scratch_dir=self.temp), probes=("apolar",))
+
+    def tearDown(self):
+        self.ensemble.close()
+        shutil.rmtree(self.temp)
+
+    def test_lattice(self):
+        self.ensemble._add({"apolar": ((1., 1., 1.), 0.5, np.full((2, 2, 2), 20., dtype=np.float32))})
+        self.ensemble._add({"apolar": ((1.5, 1., 1.), 0.5, np.full((2, 2, 2), 10., dtype=np.float32))})
+        acc = self.ensemble.accumulators["apolar"]
+        # the frame starts one padding (2 points) below the first grid, the second grid one point further along x
+        self.assertEqual(acc.origin_index.tolist(), [0, 0, 0])
+        self.assertEqual(acc.max[2, 2, 2], 20.)
+        self.assertEqual(acc.max[4, 2, 2], 10.)
+        self.assertEqual(acc.max[3, 2, 2], 20.)
+
+    def test_off_lattice(self):
+        self.ensemble._add({"apolar": ((1., 1., 1.), 0.5, np.full((2, 2, 2), 20., dtype=np.float32))})
+        # a quarter spacing off the lattice, or a different spacing, is rejected rather than rounded
+        self.assertRaises(ValueError, self.ensemble._add,
+                          {"apolar": ((1.25, 1., 1.), 0.5, np.full((2, 2, 2), 10., dtype=np.float32))})
+        self.assertRaises(ValueError, self.ensemble._add,
+                          {"apolar": ((1., 1., 1.), 0.375, np.full((2, 2, 2), 10., dtype=np.float32))})
+        self.assertEqual(self.ensemble.nframes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
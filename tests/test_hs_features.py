@@ -0,0 +1,45 @@
+from __future__ import print_function, division
+
+import os
+import tempfile
+import unittest
+
+from hotspots.hs_features import FeatureTable
+
+
+class TestFeatureTable(unittest.TestCase):
+
+    def setUp(self):
+        self.a = FeatureTable(["donor", "apolar", "acceptor"],
+                              [(1, 2, 3), (0, 0, 0), (5, 5, 5)],
+                              [14., 20., 14.],
+                              projected_coordinates=[(2, 2, 3), (float("nan"),) * 3, (float("nan"),) * 3],
+                              projected_identifier=["A1: O", "", ""],
+                              sources=["1abc"])
+        self.b = FeatureTable(["donor"], [(1, 1, 1)], [30.], sources=["2xyz"])
+
+    def test_equal_scores_are_ranked(self):
+        ranked = FeatureTable.concatenate([self.a, self.b]).ranked()
+        self.assertEqual([f.score_value for f in ranked], [30., 20., 14., 14.])
+        self.assertEqual([f.rank for f in ranked], [1, 2, 3, 4])
+        self.assertEqual(ranked[0].source, "2xyz")
+
+    def test_select_and_top(self):
+        table = FeatureTable.concatenate([self.a, self.b])
+        self.assertEqual(len(table.select(feature_type="donor")), 2)
+        self.assertEqual(len(table.select(min_score=15)), 2)
+        self.assertEqual(len(table.select(source="1abc")), 3)
+        self.assertEqual([f.feature_type for f in table.top(max_features=2)], ["donor", "apolar"])
+
+    def test_save_load(self):
+        fname = os.path.join(tempfile.mkdtemp(), "features.npz")
+        FeatureTable.concatenate([self.a, self.b]).save(fname)
+        table = FeatureTable.load(fname)
+        self.assertEqual(table.sources, ["1abc", "2xyz"])
+        self.assertEqual(table[0].projected_identifier, "A1: O")
+        self.assertIsNone(table[1].projected_coordinates)
+        self.assertAlmostEqual(table[0].vector.x, 1.)
+
+
+if __name__ == "__main__":
+    unittest.main()
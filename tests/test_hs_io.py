@@ -0,0 +1,120 @@
+from __future__ import print_function, division
+
+import shutil
+import tempfile
+import unittest
+from os.path import join
+
+from hotspots.grid_extension import Grid
+from hotspots.hs_features import FeatureTable
+from hotspots.hs_io import HotspotIndex, HotspotWriter
+
+
+class _Protein(object):
+    def __init__(self, identifier):
+        self.identifier = identifier
+
+
+class _Result(object):
+    """the parts of `hotspots.result.Results` read by the index"""
+    def __init__(self, identifier, values, features, protein="1hcl", threshold=None):
+        self.identifier = identifier
+        self.protein = _Protein(protein)
+        self.pharmacophore = None
+        self.threshold = threshold
+        self.settings = None
+        self.super_grids = {}
+        for probe, points in values.items():
+            g = Grid(origin=(0, 0, 0), far_corner=(4, 4, 4), spacing=0.5, default=0, _grid=None)
+            for (i, j, k), v in points:
+                g.set_value(i, j, k, v)
+            self.super_grids[probe] = g
+        self._features = features
+
+    def feature_table(self):
+        types, coordinates, scores, partners = zip(*self._features) if self._features else ([], [], [], [])
+        return FeatureTable(list(types), coordinates, scores, projected_identifier=list(partners),
+                            count=[10] * len(types), sources=[self.identifier])
+
+
+class TestHotspotIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        self.index = HotspotIndex(join(self.temp, "index.sqlite"))
+        self.low = _Result("low", {"apolar": [((1, 1, 1), 10.), ((2, 2, 2), 12.)],
+                                   "donor": [((1, 1, 1), 8.)]},
+                           [("donor", (1., 1., 1.), 8., "")])
+        self.high = _Result("high", {"apolar": [((1, 1, 1), 20.), ((2, 2, 2), 22.)],
+                                     "donor": [((3, 3, 3), 25.)]},
+                            [("donor", (5., 5., 5.), 25., "ASP86:OD1"), ("acceptor", (0., 0., 0.), 18., "")],
+                            protein="2vta", threshold=17.)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.temp)
+
+    def test_add(self):
+        self.index.add("a.zip", self.low)
+        self.index.add("b.zip", self.high, entry="0")
+        self.assertEqual(len(self.index), 2)
+        # the same location is replaced, not duplicated
+        self.index.add("a.zip", self.high)
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.summary("a.zip")["identifier"], "high")
+
+        self.index.remove("b.zip")
+        self.assertEqual(len(self.index), 1)
+        self.assertRaises(KeyError, self.index.summary, "b.zip", "0")
+
+    def test_results(self):
+        self.index.add("a.zip", self.low)
+        self.index.add("b.zip", self.high, entry="0")
+        self.assertEqual(self.index.results(statistic="median", above=17), [("b.zip", "0")])
+        self.assertEqual(self.index.results(statistic="median", below=17), [("a.zip", None)])
+        self.assertEqual(self.index.results(probe="apolar", statistic="max", above=11, below=21), [("a.zip", None)])
+        self.assertEqual(self.index.results(statistic="npoints", above=2), [("b.zip", "0")])
+        self.assertEqual(self.index.results(protein="2vta"), [("b.zip", "0")])
+        self.assertRaises(ValueError, self.index.results, statistic="mode")
+
+    def test_with_feature(self):
+        self.index.add("a.zip", self.low)
+        self.index.add("b.zip", self.high, entry="0")
+        self.assertEqual(self.index.with_feature("donor"), [("a.zip", None), ("b.zip", "0")])
+        self.assertEqual(self.index.with_feature("donor", min_score=10), [("b.zip", "0")])
+        self.assertEqual(self.index.with_feature(near=(1.5, 1., 1.), radius=1.), [("a.zip", None)])
+        # inside the bounding box of the search sphere, outside the sphere
+        self.assertEqual(self.index.with_feature(near=(2., 2., 2.), radius=1.5), [])
+        self.assertEqual(self.index.with_feature(residue="ASP86"), [("b.zip", "0")])
+        self.assertEqual(self.index.with_feature(residue="ASP8"), [])
+        self.assertEqual(self.index.with_feature("acceptor", source="pharmacophore"), [])
+
+    def test_summary(self):
+        self.index.add("b.zip", self.high, entry="0")
+        summary = self.index.summary("b.zip", "0")
+        self.assertEqual(summary["protein"], "2vta")
+        self.assertEqual(summary["threshold"], 17.)
+        self.assertEqual(summary["features"], 2)
+        self.assertEqual(sorted(summary["grids"]), ["all", "apolar", "donor"])
+        apolar = summary["grids"]["apolar"]
+        self.assertEqual(apolar["npoints"], 2)
+        self.assertEqual((apolar["min"], apolar["max"]), (20., 22.))
+        self.assertAlmostEqual(apolar["mean"], 21.)
+        # the per-point maximum over all probes
+        self.assertEqual(summary["grids"]["all"]["npoints"], 3)
+
+    def test_writer_update(self):
+        writer = HotspotWriter.__new__(HotspotWriter)
+        writer.index = self.index
+        writer.zipped = False
+        writer.out_dir = join(self.temp, "out")
+        writer._update_index([self.low, self.high, self.low], entries=["0", "1", "2"])
+        self.assertEqual(len(self.index), 3)
+        # rewriting the archive with fewer results drops the old entries
+        writer._update_index([self.high], entries=["0"])
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.summary(writer.out_dir, "0")["identifier"], "high")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+from __future__ import print_function, division
+
+import csv
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from os.path import join
+
+from hotspots import hs_metrics
+from hotspots.hs_metrics import RunMetrics
+
+
+class _Usage(object):
+    def __init__(self, ru_maxrss):
+        self.ru_maxrss = ru_maxrss
+
+
+class _Resource(object):
+    """stands in for the `resource` module, reporting a fixed ru_maxrss"""
+    RUSAGE_SELF = 0
+    RUSAGE_CHILDREN = 1
+
+    def __init__(self, own, children):
+        self.usage = {self.RUSAGE_SELF: own, self.RUSAGE_CHILDREN: children}
+
+    def getrusage(self, who):
+        return _Usage(self.usage[who])
+
+
+class TestPeakMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = hs_metrics.resource
+        self.platform = hs_metrics.sys.platform
+
+    def tearDown(self):
+        hs_metrics.resource = self.resource
+        hs_metrics.sys.platform = self.platform
+
+    def test_units(self):
+        hs_metrics.resource = _Resource(own=2048, children=4096)
+        hs_metrics.sys.platform = "linux"
+        self.assertEqual(hs_metrics.peak_memory(), 4.)
+        # bytes on macOS
+        hs_metrics.resource = _Resource(own=2048 * 1024, children=4096 * 1024)
+        hs_metrics.sys.platform = "darwin"
+        self.assertEqual(hs_metrics.peak_memory(), 4.)
+
+    def test_unavailable(self):
+        hs_metrics.resource = None
+        self.assertIsNone(hs_metrics.peak_memory())
+        metrics = RunMetrics()
+        self.assertIsNone(metrics.sample_memory())
+        self.assertIsNone(metrics.peak_memory)
+
+
+class TestRunMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        self.events = []
+        self.metrics = RunMetrics(hooks=[lambda kind, name, value: self.events.append((kind, name))])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+
+    def test_timers(self):
+        with self.metrics.timer("buriedness"):
+            pass
+        self.metrics.record("superstar:apolar:0", 2.)
+        self.metrics.record("superstar:apolar:0", 3.)
+        self.assertEqual(list(self.metrics.timings), ["buriedness", "superstar:apolar:0"])
+        self.assertEqual(self.metrics.timings["superstar:apolar:0"], 5.)
+        self.assertGreaterEqual(self.metrics.timings["buriedness"], 0.)
+
+    def test_timer_error(self):
+        with self.assertRaises(RuntimeError):
+            with self.metrics.timer("ghecom"):
+                raise RuntimeError("ghecom failed")
+        # the failed stage is still timed
+        self.assertIn("ghecom", self.metrics.timings)
+
+    def test_counters(self):
+        self.metrics.count("poses_evaluated", 100)
+        self.metrics.count("poses_evaluated", 20)
+        self.metrics.count("voxels_updated")
+        self.assertEqual(self.metrics.counters, {"poses_evaluated": 120, "voxels_updated": 1})
+
+    def test_hooks(self):
+        late = []
+        self.metrics.add_hook(lambda kind, name, value: late.append((kind, name, value)))
+        self.assertEqual(len(self.metrics.hooks), 2)
+        self.metrics.count("poses_evaluated", 3)
+        self.metrics.record("sampling:donor", 1.5)
+        self.assertEqual(late[:2], [("counter", "poses_evaluated", 3), ("timer", "sampling:donor", 1.5)])
+        self.assertEqual(self.events[:2], [("counter", "poses_evaluated"), ("timer", "sampling:donor")])
+        # memory is reported only when the peak rises
+        self.assertEqual([e for e in late if e[0] == "memory"][:1],
+                         [("memory", "peak_memory", self.metrics.peak_memory)] if hs_metrics.resource else [])
+
+    def test_threads(self):
+        def stage():
+            for _ in range(1000):
+                self.metrics.count("poses_evaluated", 2)
+                self.metrics.record("weighting:apolar", 0.5)
+
+        threads = [threading.Thread(target=stage) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.metrics.counters["poses_evaluated"], 16000)
+        self.assertEqual(self.metrics.timings["weighting:apolar"], 4000.)
+        self.assertEqual(self.events.count(("counter", "poses_evaluated")), 8000)
+
+    def test_write_json(self):
+        self.metrics.record("buriedness", 1.)
+        self.metrics.count("poses_evaluated", 10)
+        path = join(self.temp, "metrics.json")
+        self.metrics.write_json(path)
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data["timings"], {"buriedness": 1.})
+        self.assertEqual(data["counters"], {"poses_evaluated": 10})
+        self.assertEqual(data["peak_memory"], self.metrics.peak_memory)
+
+    def test_write_csv(self):
+        self.metrics.record("buriedness", 1.)
+        self.metrics.count("poses_evaluated", 10)
+        path = join(self.temp, "metrics.csv")
+        self.metrics.write_csv(path)
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ["kind", "name", "value"])
+        self.assertEqual(rows[1], ["timer", "buriedness", "1.0"])
+        self.assertEqual(rows[2], ["counter", "poses_evaluated", "10"])
+        self.assertEqual(rows[3][:2], ["memory", "peak_memory"])
+        self.assertEqual(len(rows), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
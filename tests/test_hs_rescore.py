@@ -0,0 +1,88 @@
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from hotspots import hs_rescore
+from hotspots.grid_io import GridData
+
+
+class TestRescore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        # donor grid on a smaller, offset frame: write_compact places it on the common frame
+        self.apolar = np.where(rng.rand(30, 30, 30) > 0.5, rng.rand(30, 30, 30) * 30, 0.)
+        self.donor = np.where(rng.rand(10, 10, 10) > 0.3, rng.rand(10, 10, 10) * 30, 0.)
+        bcv = np.zeros((30, 30, 30))
+        bcv[10:20, 10:20, 10:20] = 20.
+        self.fname = os.path.join(self.temp, "result.npz")
+        hs_rescore.write_compact(self.fname, {"apolar": GridData(self.apolar, (0., 0., 0.), 0.5),
+                                              "donor": GridData(self.donor, (5., 5., 5.), 0.5),
+                                              "buriedness": GridData(self.donor, (5., 5., 5.), 0.5)},
+                                 bcv={"apolar": GridData(bcv, (0., 0., 0.), 0.5)})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp)
+
+    def _points(self, centre, radius):
+        grid = np.stack(np.meshgrid(*[np.arange(30)] * 3, indexing="ij"), axis=-1) * 0.5
+        return np.sqrt(((grid - centre) ** 2).sum(axis=-1)) <= radius
+
+    def test_score_arrays(self):
+        rescorer = hs_rescore.Rescorer(self.fname, settings=hs_rescore.Rescorer.Settings(tolerance=1))
+        donor = np.zeros((30, 30, 30))
+        donor[10:20, 10:20, 10:20] = self.donor
+        coordinates = np.array([[7.1, 6.8, 7.4], [7.6, 7.4, 6.1], [3.2, 4.4, 5.], [8.3, 7., 7.7]])
+        radii = np.array([1.7, 1.55, 1.7, 1.52])
+        score_types = np.array(["apolar", "donor", "apolar", "doneptor"], dtype=object)
+        match_types = np.array(["apolar", "donor", "apolar", "doneptor"], dtype=object)
+        score, matched, bcv_overlap = rescorer.score_arrays(coordinates, radii, score_types, match_types)
+
+        # brute force
+        def best(array, c):
+            i, j, k = np.round(np.asarray(c) / 0.5).astype(int)
+            return array[max(i - 1, 0):i + 2, max(j - 1, 0):j + 2, max(k - 1, 0):k + 2].max()
+
+        expected = [best(self.apolar, coordinates[0]), best(donor, coordinates[1]), best(self.apolar, coordinates[2]),
+                    max(best(donor, coordinates[3]), 0)]
+        self.assertAlmostEqual(score, np.mean(expected), places=5)
+
+        spheres = [self._points(c, r) for c, r in zip(coordinates, radii)]
+        grids = [self.apolar, donor, self.apolar, donor]
+        overlap = [(s & (g > 0)).sum() / s.sum() * 100 for s, g in zip(spheres, grids)]
+        self.assertEqual(matched, round(sum(o > 30 for o in overlap) / 4 * 100, 1))
+
+        union = np.any(spheres, axis=0)
+        inside = np.zeros((30, 30, 30), dtype=bool)
+        inside[10:20, 10:20, 10:20] = True
+        self.assertEqual(bcv_overlap, round((union & inside).sum() / union.sum() * 100, 1))
+
+    def test_pose_chunks(self):
+        records = ["pose{}\n  body\n\n  0  0  0  0  0  0  0  0  0  0999 V2000\nM  END\n$$$$\n".format(i)
+                   for i in range(50)]
+        path = os.path.join(self.temp, "poses.sdf")
+        with open(path, "w") as f:
+            f.write("".join(records))
+
+        chunks = list(hs_rescore.pose_chunks(path, chunk_bytes=200))
+        self.assertGreater(len(chunks), 1)
+        text = []
+        with open(path) as f:
+            for start, end in chunks:
+                f.seek(start)
+                text.extend(hs_rescore.split_records(f.read(end - start), "sdf"))
+        self.assertEqual(text, records)
+
+        mol2 = "@<TRIPOS>MOLECULE\na\n@<TRIPOS>ATOM\n@<TRIPOS>MOLECULE\nb\n@<TRIPOS>ATOM\n"
+        self.assertEqual([r.split("\n")[1] for r in hs_rescore.split_records(mol2, "mol2")], ["a", "b"])
+        self.assertRaises(ValueError, list, hs_rescore.pose_chunks("poses.pdb"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+from __future__ import print_function, division
+
+import unittest
+
+import matplotlib
+import numpy as np
+
+matplotlib.use("Agg")
+
+from hotspots.hs_utilities import Figures
+
+
+class TestFigures(unittest.TestCase):
+
+    def test_plot_histogram(self):
+        rng = np.random.RandomState(0)
+        data = {"apolar": rng.rand(100) * 30, "donor": rng.rand(50) * 20, "acceptor": rng.rand(50) * 20}
+        plt = Figures._plot_histogram(data, title="test")
+        self.assertEqual(len(plt.figure(1).axes), 3)
+        plt.close("all")
+
+
+if __name__ == "__main__":
+    unittest.main()
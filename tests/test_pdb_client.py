@@ -0,0 +1,56 @@
+from __future__ import print_function, division
+
+import functools
+import gzip
+import http.server
+import os
+import tempfile
+import threading
+import unittest
+
+from hotspots.pdb_python_api import PDBClient
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPDBClient(unittest.TestCase):
+
+    def setUp(self):
+        self.mirror = tempfile.mkdtemp()
+        with open(os.path.join(self.mirror, "1ABC.pdb"), "w") as f:
+            f.write("HEADER    1ABC\n")
+        with gzip.open(os.path.join(self.mirror, "2XYZ.pdb.gz"), "wt") as f:
+            f.write("HEADER    2XYZ\n")
+
+    def test_local_mirror(self):
+        with PDBClient(cache_dir=tempfile.mkdtemp(), mirror=self.mirror) as client:
+            paths = client.fetch_all(["1abc", "2xyz", "3qqq"])
+            with open(paths[1]) as f:
+                self.assertEqual(f.read().strip(), "HEADER    2XYZ")
+            self.assertIsNone(paths[2])
+            self.assertEqual(client.fetch("1abc"), client.cache_path("1abc"))
+
+    def test_stand_in_server(self):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0),
+                                                 functools.partial(_Handler, directory=self.mirror))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = "http://127.0.0.1:{}".format(server.server_address[1])
+            with PDBClient(cache_dir=tempfile.mkdtemp(), mirror=url, max_connections=2) as client:
+                out = client.download_all(["1abc", "2xyz"], out_dir=tempfile.mkdtemp())
+                with open(out[0]) as f:
+                    self.assertEqual(f.read().strip(), "HEADER    1ABC")
+                with open(out[1]) as f:
+                    self.assertEqual(f.read().strip(), "HEADER    2XYZ")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+from __future__ import print_function, division
+
+import asyncio
+import http.server
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from hotspots.rest_client import JobClient, gather
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """ a stand-in job service: each job is running for the first two polls, job "fail" ends with status 400 """
+    protocol_version = "HTTP/1.1"
+    polls = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        body = body if type(body) is bytes else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        code = data["protoss"]["pdbCode"]
+        self._send(202, {"location": "http://{}:{}/jobs/{}".format(*self.server.server_address, code)})
+
+    def do_GET(self):
+        kind, name = self.path.strip("/").split("/")
+        if kind == "files":
+            return self._send(200, "HEADER    {}\n".format(name).encode())
+        self.polls[name] = self.polls.get(name, 0) + 1
+        if name == "fail":
+            return self._send(200, {"status_code": 400})
+        if self.polls[name] < 3:
+            return self._send(202, {"status_code": 202})
+        base = "http://{}:{}/files/".format(*self.server.server_address)
+        self._send(200, {"status_code": 200,
+                         "protein": base + name + ".pdb",
+                         "ligands": [base + name + "_1.sdf", base + name + "_2.sdf"]})
+
+
+class TestJobClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = JobClient(base_url="http://127.0.0.1:{}".format(self.server.server_address[1]),
+                                poll_interval=0.2)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_waits_overlap(self):
+        url = self.client.service_url("protoss")
+        codes = ["{}abc".format(i) for i in range(20)] + ["fail"]
+        t = time.perf_counter()
+        results = gather([self.client.run(url, {"protoss": {"pdbCode": c}}) for c in codes], labels=codes)
+        # each job waits 0.2 + 0.4 s between its polls, in series the batch would take 12 s
+        self.assertLess(time.perf_counter() - t, 3.)
+        self.assertIsNone(results[-1])
+        self.assertTrue(results[0]["protein"].endswith("0abc.pdb"))
+
+    def test_download_all(self):
+        out_dir = os.path.join(tempfile.mkdtemp(), "ligands")
+        urls = ["http://127.0.0.1:{}/files/1abc_{}.sdf".format(self.server.server_address[1], i) for i in range(5)]
+        paths = asyncio.run(self.client.download_all(urls, out_dir))
+        self.assertEqual([os.path.basename(p) for p in paths], ["1abc_{}.sdf".format(i) for i in range(5)])
+        with open(paths[3]) as f:
+            self.assertEqual(f.read().strip(), "HEADER    1abc_3.sdf")
+
+
+if __name__ == "__main__":
+    unittest.main()
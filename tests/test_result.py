@@ -0,0 +1,125 @@
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from hotspots.grid_extension import Grid
+from hotspots.result import Results
+
+
+def _grid(origin, array, spacing=0.5):
+    far_corner = [o + (n - 1) * spacing for o, n in zip(origin, array.shape)]
+    blank = Grid(origin=origin, far_corner=far_corner, spacing=spacing, default=0, _grid=None)
+    return Grid.array_to_grid(array, blank)
+
+
+def _sparse(rng, shape, fraction=0.3):
+    return np.where(rng.rand(*shape) < fraction, rng.rand(*shape) * 30, 0.)
+
+
+class TestDifferenceMaps(unittest.TestCase):
+
+    @staticmethod
+    def _filter_map(arr1, arr2, tol):
+        """the point by point filter that `Results._neighbour_mean` replaced, with windows clipped at the edges"""
+        def filter_point(g, new, x, y, z):
+            loc_arr = g[max(x - tol, 0):x + tol + 1, max(y - tol, 0):y + tol + 1, max(z - tol, 0):z + tol + 1]
+            if loc_arr[loc_arr > 0].size != 0:
+                new[x, y, z] = np.mean(loc_arr[loc_arr > 0])
+
+        b_arr1 = np.copy(arr1)
+        b_arr2 = np.copy(arr2)
+        b_arr1[b_arr1 > 0] = 1.0
+        b_arr2[b_arr2 > 0] = -1.0
+        diff_arr = b_arr1 + b_arr2
+
+        f_arr1 = np.copy(arr1)
+        for x, y, z in zip(*np.where(diff_arr == -1)):
+            filter_point(arr1, f_arr1, x, y, z)
+        f_arr2 = np.copy(arr2)
+        for x, y, z in zip(*np.where(diff_arr == 1)):
+            filter_point(arr2, f_arr2, x, y, z)
+
+        sel_arr = f_arr1 - f_arr2
+        sel_arr[sel_arr < 0] = 0
+        return sel_arr
+
+    def test_neighbour_mean(self):
+        rng = np.random.RandomState(0)
+        arr = _sparse(rng, (7, 8, 9))
+        for tol in (1, 2):
+            expected = np.zeros(arr.shape)
+            for x, y, z in np.ndindex(*arr.shape):
+                loc_arr = arr[max(x - tol, 0):x + tol + 1, max(y - tol, 0):y + tol + 1, max(z - tol, 0):z + tol + 1]
+                if np.any(loc_arr > 0):
+                    expected[x, y, z] = loc_arr[loc_arr > 0].mean()
+            # every point is compared, including the corners and faces of the array
+            self.assertTrue(np.allclose(Results._neighbour_mean(arr, tol), expected))
+
+    def test_difference_array(self):
+        rng = np.random.RandomState(1)
+        arr1 = _sparse(rng, (7, 8, 9))
+        arr2 = _sparse(rng, (7, 8, 9))
+        for tol in (1, 2):
+            sel_arr = Results._difference_array(arr1, arr2,
+                                                Results._neighbour_mean(arr1, tol),
+                                                Results._neighbour_mean(arr2, tol))
+            self.assertTrue(np.allclose(sel_arr, self._filter_map(arr1, arr2, tol)))
+            self.assertTrue(np.all(sel_arr >= 0))
+
+    def test_get_difference_maps(self):
+        rng = np.random.RandomState(2)
+        probes = ("apolar", "donor")
+        target = Results({p: _grid((0., 0., 0.), _sparse(rng, (8, 8, 8))) for p in probes}, None)
+        others = [Results({p: _grid(origin, _sparse(rng, (6, 7, 8))) for p in probes}, None)
+                  for origin in ((1., 0.5, -1.), (-2., 1.5, 0.5))]
+
+        for tol in (1, 2):
+            maps = target.get_difference_maps(others, tol)
+            self.assertEqual(len(maps), len(others))
+            for other, multi in zip(others, maps):
+                single = target.get_difference_map(other, tol)
+                for p in probes:
+                    # the frames differ in extent, compare on their common frame
+                    a, b = Grid.common_grid([multi.super_grids[p], single.super_grids[p]])
+                    self.assertTrue(np.allclose(a.get_array(), b.get_array()))
+                    self.assertGreater(np.count_nonzero(a.get_array()), 0)
+
+
+class TestFeatureTable(unittest.TestCase):
+
+    def setUp(self):
+        donor = np.zeros((12, 12, 12))
+        # a 3 x 3 x 1 island with a point joined only through a corner
+        donor[1:4, 1:4, 1] = np.arange(10., 19.).reshape(3, 3)
+        donor[4, 4, 2] = 9.
+        # a 2 x 2 x 2 island
+        donor[8:10, 7:9, 6:8] = 20.
+        # too small to be a feature
+        donor[1, 10, 10:12] = 30.
+        acceptor = np.zeros((12, 12, 12))
+        acceptor[5:8, 5:8, 9:11] = 8.
+        apolar = np.full((12, 12, 12), 15.)
+        self.result = Results({"donor": _grid((1., -2., 0.5), donor),
+                               "acceptor": _grid((1., -2., 0.5), acceptor),
+                               "apolar": _grid((1., -2., 0.5), apolar)}, None)
+
+    def test_feature_table(self):
+        table = self.result.feature_table()
+        features = sorted(self.result.features, key=lambda f: (f.feature_type, f.score_value))
+        order = sorted(range(len(table)), key=lambda i: (table.feature_types[i], table.score[i]))
+
+        self.assertEqual(len(table), 3)
+        self.assertEqual(len(features), len(table))
+        for f, i in zip(features, order):
+            self.assertEqual(f.feature_type, table.feature_types[i])
+            self.assertAlmostEqual(f.score_value, table.score[i], places=4)
+            self.assertEqual(f.count, table.count[i])
+            self.assertTrue(np.allclose(f.feature_coordinates, table.coordinates[i], atol=1e-4))
+        # the corner point belongs to the first island
+        self.assertIn(10, table.count.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()